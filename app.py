@@ -1,12 +1,19 @@
-from flask import Flask, render_template, jsonify, request, send_file, session
-from world import World, DYNAMIC_NPCS, NPC_POSITIONS, PLAYER_STATE
+from flask import Flask, Response, abort, g, render_template, jsonify, request, session
+from world import World
+from events import format_sse
+from sessions import SessionBackend, SessionStore, SQLiteSessionStore
+from snapshot import encode_world, decode_world
+from jobs import JobPool, JobQueueFull
+from assets import AssetStore
 from npc import NPC
 import os
-from character_generator import create_character
-import yaml
+from character_generator import create_character_data
 import uuid
 import json
 import logging
+import queue
+import tempfile
+import time
 from dataclasses import dataclass
 from typing import Dict, List, Optional, Any, Union
 from sequence import ChoiceNode
@@ -18,33 +25,88 @@ logger = logging.getLogger(__name__)
 # Reduce Werkzeug logger verbosity
 logging.getLogger('werkzeug').setLevel(logging.WARNING)
 
-app = Flask(__name__)
+# Static files are served by the asset routes below, not Flask's default static route
+app = Flask(__name__, static_folder=None)
 app.secret_key = os.environ.get('FLASK_SECRET_KEY', os.urandom(24))  # Required for sessions
 
-# Dictionary to store game worlds for each session
-game_worlds = {}
-game_messages = {}
-
-def get_player_world():
-    """Get or create a game world for the current session"""
+# Server-sent event stream timing
+EVENT_KEEPALIVE_SECONDS = 15.0
+EVENT_MIN_WAIT_SECONDS = 0.05
+EVENT_LOCK_RETRY_SECONDS = 0.25  # Wait while an interaction holds the world, NPCs may be due
+EVENT_RETRY_MS = 2000
+EVENT_STORE_POLL_SECONDS = 1.0
+
+# Stream generated talk lines over /events, only possible when the stream shares the world
+STREAM_DIALOGUE = os.environ.get('STREAM_DIALOGUE', '1').lower() not in ('0', 'false', 'no')
+
+# Attempts at saving a generated NPC into a world other workers keep saving
+NPC_INSERT_ATTEMPTS = 5
+
+def create_session_store() -> SessionBackend:
+    """Build the session backend selected by SESSION_BACKEND (memory or sqlite)"""
+    max_sessions = int(os.environ.get('MAX_SESSIONS', 500))
+    idle_timeout = float(os.environ.get('SESSION_IDLE_TIMEOUT', 1800))
+    backend = os.environ.get('SESSION_BACKEND', 'memory').lower()
+    if backend == 'sqlite':
+        path = os.environ.get('SESSION_DB_PATH',
+                              os.path.join(tempfile.gettempdir(), 'ai-playground-sessions.db'))
+        return SQLiteSessionStore(path, World, max_sessions=max_sessions, idle_timeout=idle_timeout,
+                                  encode=encode_world, decode=decode_world)
+    if backend != 'memory':
+        raise ValueError(f"Unknown SESSION_BACKEND: {backend}")
+    return SessionStore(World, max_sessions=max_sessions, idle_timeout=idle_timeout)
+
+# Static files fingerprinted once at startup, templates link them with asset_url
+assets = AssetStore(os.path.dirname(os.path.abspath(__file__)), ('static', 'graphics', 'sounds'))
+app.add_template_global(assets.url, 'asset_url')
+
+# Game worlds for each session, bounded by count and idle time
+session_store = create_session_store()
+
+# NPC generation makes slow model calls, so it runs off the request threads
+npc_jobs = JobPool(max_workers=int(os.environ.get('NPC_JOB_WORKERS', 2)),
+                   max_pending=int(os.environ.get('NPC_JOB_MAX_PENDING', 16)))
+
+def get_session_id() -> str:
+    """Get or assign the current session's id"""
     session_id = session.get('session_id')
     if not session_id:
         session_id = str(uuid.uuid4())
         session['session_id'] = session_id
-    
-    if session_id not in game_worlds:
-        game_worlds[session_id] = World()
-        game_messages[session_id] = []
-    
-    return game_worlds[session_id], game_messages[session_id]
+    return session_id
+
+def get_player_world():
+    """Get or create a game world for the current session"""
+    if 'world' in g:
+        return g.world, g.messages
+
+    g.session_id = get_session_id()
+    g.world, g.messages = session_store.get_or_create(g.session_id)
+    return g.world, g.messages
+
+@app.after_request
+def save_player_world(response):
+    """Write the session's world back once the request is done"""
+    if 'world' in g and not g.get('world_discarded'):
+        with g.world.lock:
+            session_store.save(g.session_id, g.world, g.messages)
+    return response
 
 @dataclass
 class GameState:
-    """Class to manage game state"""
+    """Game state saved by the client, uploaded to restore a lost world.
+
+    The server's world is authoritative. A saved state from the same world
+    (same epoch) that is no newer than it is ignored, so a stale tab cannot
+    roll back inventory or drop NPCs added by background jobs. Only a state
+    from another world instance, or one ahead of the stored world, is applied.
+    """
     player: Dict[str, Any]
     npc_positions: Dict[str, Dict[str, int]]
     dynamic_npcs: List[Dict[str, Any]]
     interaction: Optional[Dict[str, Any]] = None
+    version: Optional[int] = None
+    epoch: Optional[str] = None
 
     @classmethod
     def from_request(cls, request_data: Dict[str, Any]) -> Optional['GameState']:
@@ -57,23 +119,36 @@ class GameState:
             player=saved_state.get('player', {}),
             npc_positions=saved_state.get('npcPositions', {}),
             dynamic_npcs=saved_state.get('dynamicNpcs', []),
-            interaction=saved_state.get('interaction')
+            interaction=saved_state.get('interaction'),
+            version=saved_state.get('version'),
+            epoch=saved_state.get('epoch')
         )
 
+    def is_outdated_for(self, world: World) -> bool:
+        """Whether the world already holds everything this state was saved from"""
+        return (self.epoch == world.epoch and isinstance(self.version, int)
+                and self.version <= world.version)
+
     def apply_to_world(self, world: World) -> None:
-        """Apply state to game world"""
+        """Apply state to game world, unless the world is as new or newer"""
+        if self.is_outdated_for(world):
+            return
+
         if self.player:
-            PLAYER_STATE.update(self.player)
             world.character.x = self.player['x']
             world.character.y = self.player['y']
+            if 'inventory' in self.player:
+                # Saves from before used up items were removed may still list them at zero
+                world.character.inventory = {item: amount for item, amount in self.player['inventory'].items()
+                                             if amount}
         
         if self.npc_positions:
-            NPC_POSITIONS.update(self.npc_positions)
+            world.npc_positions.update(self.npc_positions)
             self._sync_npc_positions(world)
         
-        if self.dynamic_npcs:
-            DYNAMIC_NPCS.clear()
-            DYNAMIC_NPCS.extend(self.dynamic_npcs)
+        if self.dynamic_npcs and self.dynamic_npcs != world.dynamic_npcs:
+            world.dynamic_npcs[:] = self.dynamic_npcs
+            world.reload_npcs()
 
     def _sync_npc_positions(self, world: World) -> None:
         """Sync NPC positions with saved state"""
@@ -81,31 +156,44 @@ class GameState:
             if not isinstance(location, NPC):
                 continue
             
-            npc_id = self._find_npc_id(location)
-            if npc_id and npc_id in self.npc_positions:
-                location.x = self.npc_positions[npc_id]['x']
-                location.y = self.npc_positions[npc_id]['y']
-
-    def _find_npc_id(self, npc: NPC) -> Optional[str]:
-        """Find NPC ID in positions"""
-        return next((
-            id for id in self.npc_positions.keys()
-            if (isinstance(id, str) and id.startswith('dynamic_') and npc.name == f'dynamic_{id.split("_")[1]}')
-            or (npc.name == id.replace('.yaml', ''))
-        ), None)
+            position = self.npc_positions.get(location.id)
+            if position:
+                world.move_location(location, position['x'], position['y'])
 
 class GameStateBuilder:
-    """Builder for game state responses"""
+    """Builder for game state responses.
+
+    Clients that send the version and epoch of the last state they saw get
+    only the changes since then. Clients without a version, or whose version
+    has fallen out of the change log, get a full snapshot. A client holding
+    a version from another world instance (for example after a server
+    restart) is told its state is stale so it can upload its saved state.
+    Only NPCs in the player's view are included. NPCs crossing the edge of
+    the view arrive as 'npc_entered' and 'npc_left' changes.
+    """
     def __init__(self, world: World):
         self.world = world
 
-    def build_state(self) -> Dict[str, Any]:
-        """Build current game state"""
-        state = {
-            'player': self._build_player_state(),
-            'npcPositions': NPC_POSITIONS,
-            'dynamicNpcs': DYNAMIC_NPCS,
-        }
+    def build_state(self, since_version: Optional[int] = None,
+                    epoch: Optional[str] = None) -> Dict[str, Any]:
+        """Build current game state, as a delta when possible"""
+        self.world.commit_player_state()
+
+        if since_version is not None and epoch != self.world.epoch:
+            return {'stale': True}
+
+        changes = self.world.changes_since(since_version) if since_version is not None else None
+        if changes is None:
+            state = {
+                'full': True,
+                'player': self._build_player_state(),
+                'npcPositions': self.world.npc_positions_payload(),
+                'dynamicNpcs': self.world.dynamic_npcs,
+            }
+        else:
+            state = {'full': False, 'changes': changes}
+        state['version'] = self.world.version
+        state['epoch'] = self.world.epoch
 
         if self.world.current_interaction:
             state['interaction'] = self._build_interaction_state()
@@ -136,8 +224,16 @@ class GameStateBuilder:
 
 def create_state_response(world: World, response_data: Dict[str, Any]) -> Any:
     """Create response with current game state"""
+    request_data = request.get_json(silent=True) or {}
+    since_version = request_data.get('sinceVersion')
+    if since_version is None:
+        since_version = request.args.get('sinceVersion', type=int)
+    if not isinstance(since_version, int):
+        since_version = None
+    epoch = request_data.get('epoch', request.args.get('epoch'))
+
     state_builder = GameStateBuilder(world)
-    response_data['gameState'] = state_builder.build_state()
+    response_data['gameState'] = state_builder.build_state(since_version, epoch)
     return jsonify(response_data)
 
 @app.route('/')
@@ -145,13 +241,16 @@ def home():
     world, messages = get_player_world()
     return render_template('game.html', 
                          character=world.character,
-                         locations=world.locations,
+                         locations=world.visible_locations(),
                          messages=messages)
 
 @app.route('/move', methods=['POST'])
 def move():
     world, _ = get_player_world()
-    
+    with world.lock:
+        return _move(world)
+
+def _move(world: World):
     # Load and apply saved state
     if state := GameState.from_request(request.json):
         state.apply_to_world(world)
@@ -189,47 +288,156 @@ def move():
         'canMove': True
     })
 
-@app.route('/game_state', methods=['GET', 'POST'])
-def game_state():
+@app.route('/walk_to', methods=['POST'])
+def walk_to():
+    """Walk the player to a cell along the shortest path in one request"""
+    try:
+        target = (int(request.json['x']), int(request.json['y']))
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'x and y are required'}), 400
+
     world, _ = get_player_world()
-    
-    # Load and apply saved state
-    if request.is_json:
+    with world.lock:
         if state := GameState.from_request(request.json):
             state.apply_to_world(world)
-    
-    # Update NPCs
-    world.update_npcs()
-    
-    return create_state_response(world, {
-        'character': {
+
+        # Like single steps, walking is not allowed during an interaction
+        path = None
+        if not world.is_interaction_active():
+            path = world.pathfinder.find_path((world.character.x, world.character.y), target)
+        if path:
+            world.character.x, world.character.y = path[-1]
+
+        return create_state_response(world, {
             'x': world.character.x,
             'y': world.character.y,
-            'emoji': world.character.emoji
-        },
-        'locations': [{
-            'x': loc.x,
-            'y': loc.y,
-            'emoji': loc.emoji,
-            'type': loc.__class__.__name__,
-            'name': getattr(loc, 'name', None)
-        } for loc in world.locations]
-    })
+            'inventory': world.character.inventory,
+            'emoji': world.character.emoji,
+            'canMove': path is not None,
+            'path': [list(cell) for cell in path or []]
+        })
+
+@app.route('/game_state', methods=['GET', 'POST'])
+def game_state():
+    world, _ = get_player_world()
+    with world.lock:
+        # Load and apply saved state
+        if request.is_json:
+            if state := GameState.from_request(request.json):
+                state.apply_to_world(world)
+        
+        # Update NPCs
+        world.update_npcs()
+        
+        return create_state_response(world, {
+            'character': {
+                'x': world.character.x,
+                'y': world.character.y,
+                'emoji': world.character.emoji
+            },
+            'locations': world.visible_locations_payload()
+        })
+
+@app.route('/events')
+def events():
+    """Stream NPC movement and interaction events for the current session"""
+    world, _ = get_player_world()
+    with world.lock:
+        snapshot = {'type': 'locations', 'locations': world.visible_locations_payload()}
+        version = world.version
+    if session_store.shares_worlds:
+        stream = _event_stream(world, world.events.subscribe(), snapshot)
+    else:
+        stream = _stored_event_stream(g.session_id, version, snapshot)
+    return Response(stream,
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+def _event_stream(world: World, subscription, snapshot: Dict[str, Any]):
+    """Yield events as they happen, ticking the world only when an NPC is due"""
+    try:
+        yield f"retry: {EVENT_RETRY_MS}\n\n"
+        yield format_sse(snapshot)
+        last_sent = time.time()
+        while True:
+            now = time.time()
+            timeout = EVENT_KEEPALIVE_SECONDS
+            # An interaction may hold the lock while it streams a reply to us, never wait on it
+            next_due = None
+            if world.lock.acquire(blocking=False):
+                try:
+                    next_due = world.wander_scheduler.next_due_time()
+                finally:
+                    world.lock.release()
+            else:
+                timeout = EVENT_LOCK_RETRY_SECONDS
+            if next_due is not None:
+                timeout = min(timeout, max(next_due - now, EVENT_MIN_WAIT_SECONDS))
+            try:
+                yield format_sse(subscription.get(timeout=timeout))
+                last_sent = time.time()
+            except queue.Empty:
+                if world.lock.acquire(blocking=False):
+                    try:
+                        world.update_npcs()
+                    finally:
+                        world.lock.release()
+                if subscription.empty() and time.time() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+                    yield ": keepalive\n\n"
+                    last_sent = time.time()
+    finally:
+        world.events.unsubscribe(subscription)
+
+def _stored_event_stream(session_id: str, version: int, snapshot: Dict[str, Any]):
+    """Event stream for worlds stored out of process.
+
+    Other workers cannot wake this stream, so it reloads the world on an
+    interval, ticks it and sends the change log entries it has not sent yet.
+    The tick is only saved if nobody else saved the world in the meantime.
+    """
+    yield f"retry: {EVENT_RETRY_MS}\n\n"
+    yield format_sse(snapshot)
+    last_sent = time.time()
+    while True:
+        time.sleep(EVENT_STORE_POLL_SECONDS)
+        world, messages = session_store.get_or_create(session_id)
+        with world.lock:
+            before_tick = world.version
+            world.update_npcs()
+            if world.version != before_tick and not session_store.save(
+                    session_id, world, messages, only_if_unchanged=True):
+                # Lost the race with a request, its state wins and we retick next time
+                continue
+            changes = world.changes_since(version)
+            version = world.version
+        if changes is None:
+            yield format_sse({'type': 'resync'})
+            last_sent = time.time()
+        for change in changes or []:
+            yield format_sse(change)
+            last_sent = time.time()
+        if time.time() - last_sent >= EVENT_KEEPALIVE_SECONDS:
+            yield ": keepalive\n\n"
+            last_sent = time.time()
 
 @app.route('/graphics/<path:filename>')
 def serve_graphic(filename):
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    return send_file(os.path.join(base_path, 'graphics', filename))
+    return _serve_asset(f'graphics/{filename}')
 
 @app.route('/sounds/<path:filename>')
 def serve_sound(filename):
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    return send_file(os.path.join(base_path, 'sounds', filename))
+    return _serve_asset(f'sounds/{filename}')
 
 @app.route('/static/<path:filename>')
 def serve_static(filename):
-    base_path = os.path.dirname(os.path.abspath(__file__))
-    return send_file(os.path.join(base_path, 'static', filename))
+    return _serve_asset(f'static/{filename}')
+
+def _serve_asset(path: str):
+    """Serve a fingerprinted or plain asset URL, compressed when the client accepts it"""
+    response = assets.response(path, request)
+    if response is None:
+        abort(404)
+    return response
 
 class InteractionHandler:
     """Handler for NPC interactions"""
@@ -239,20 +447,15 @@ class InteractionHandler:
 
     def handle_interaction(self, request_data: Dict[str, Any]) -> Dict[str, Any]:
         """Handle an interaction request"""
-        # Capture print output
-        import io
-        import sys
-        old_stdout = sys.stdout
-        sys.stdout = output = io.StringIO()
+        # Lines said during this interaction only, so concurrent requests never mix
+        output: List[str] = []
 
         if 'answer' in request_data:
             self._process_answer(request_data['answer'])
 
-        result = self.world.try_interact()
-        
-        # Get the printed message
-        sys.stdout = old_stdout
-        message = output.getvalue().strip()
+        result = self.world.try_interact(stream=STREAM_DIALOGUE and session_store.shares_worlds,
+                                         output=output)
+        message = "\n".join(output).strip()
         
         current_npc = self.world.current_interaction
         self._update_messages(message, current_npc)
@@ -290,7 +493,7 @@ class InteractionHandler:
             waiting_for_input = True
             current_node = current_npc.get_current_node()
             if current_node and isinstance(current_node, ChoiceNode):
-                choices = list(current_node.choices.keys())  # Get the choice texts from the dictionary keys
+                choices = list(current_node.options)  # Every choice text, with or without its own sequence
         
         return {
             'success': result,
@@ -305,85 +508,100 @@ class InteractionHandler:
 @app.route('/interact', methods=['POST'])
 def interact():
     world, messages = get_player_world()
-    
-    # Load and apply saved state
-    if state := GameState.from_request(request.json):
-        state.apply_to_world(world)
-    
-    handler = InteractionHandler(world, messages)
-    response = handler.handle_interaction(request.json)
-    return create_state_response(world, response)
+    with world.lock:
+        # Load and apply saved state
+        if state := GameState.from_request(request.json):
+            state.apply_to_world(world)
+        
+        handler = InteractionHandler(world, messages)
+        response = handler.handle_interaction(request.json)
+        return create_state_response(world, response)
+
+def generate_npc_data(description: str) -> Dict[str, Any]:
+    """Ask the model for a new NPC definition"""
+    npc_data = create_character_data(description)
+    if not npc_data or 'npc' not in npc_data:
+        raise ValueError("Failed to generate valid NPC data")
+    return npc_data
+
+def insert_generated_npc(session_id: str, npc_id: str, npc_data: Dict[str, Any],
+                         x: int, y: int) -> Dict[str, Any]:
+    """Add a finished NPC to its session's world and describe it"""
+    for _ in range(NPC_INSERT_ATTEMPTS):
+        world, messages = session_store.get_or_create(session_id)
+        with world.lock:
+            world.add_dynamic_npc(npc_id, npc_data, x, y)
+            if session_store.save(session_id, world, messages, only_if_unchanged=True):
+                break
+    else:
+        raise RuntimeError("Could not save the new NPC, the session kept changing")
+
+    logger.debug(f"Created NPC {npc_id} for session {session_id}")
+    return {
+        'id': npc_id,
+        'x': x,
+        'y': y,
+        'name': npc_data['npc'].get('name', 'Unknown'),
+        'emoji': npc_data['npc'].get('emoji', '👤')
+    }
 
 @app.route('/create_npc', methods=['POST'])
 def create_npc():
-    world, _ = get_player_world()
+    """Start generating an NPC, its job can be followed at /npc_jobs/<id>"""
+    # The world is not touched here, the job saves it once the NPC exists
+    session_id = get_session_id()
+    data = request.json or {}
+    description = data.get('description')
+    if not description:
+        return jsonify({'success': False, 'message': 'A description is required'}), 400
+
+    npc_id = str(uuid.uuid4())
+    x, y = data.get('x', 0), data.get('y', 0)
     try:
-        description = request.json['description']
-        # Create the NPC data
-        npc_data = create_character(description)
-        
-        # If npc_data is a string (YAML), parse it
-        if isinstance(npc_data, str):
-            npc_data = yaml.safe_load(npc_data)
-            
-        if not npc_data or 'npc' not in npc_data:
-            raise ValueError("Failed to generate valid NPC data")
-
-        # Generate unique ID for the NPC
-        npc_id = str(uuid.uuid4())
-        npc_filename = f'dynamic_{npc_id}'  # Remove .yaml extension from the ID
-        
-        # Add to dynamic NPCs list with position
-        dynamic_npc = {
-            'id': npc_id,
-            'x': request.json.get('x', 0),
-            'y': request.json.get('y', 0),
-            'data': npc_data  # Store the actual NPC data
-        }
-        DYNAMIC_NPCS.append(dynamic_npc)
-        
-        # Add initial position to NPC_POSITIONS
-        NPC_POSITIONS[npc_filename] = {
-            'x': request.json.get('x', 0),
-            'y': request.json.get('y', 0)
-        }
-        
-        # Log the data for debugging
-        logger.debug(f"Created NPC with data: {dynamic_npc}")
-        
-        # Reload the world to include the new NPC
-        world.reload_npcs()
-        
-        return jsonify({
-            'success': True, 
-            'message': 'NPC created successfully',
-            'npc': {
-                'id': npc_id,
-                'x': dynamic_npc['x'],
-                'y': dynamic_npc['y'],
-                'name': npc_data['npc'].get('name', 'Unknown'),
-                'emoji': npc_data['npc'].get('emoji', '👤')
-            }
-        })
-    except Exception as e:
-        logger.error(f"Error creating NPC: {str(e)}", exc_info=True)  # Add full traceback
-        return jsonify({'success': False, 'message': str(e)})
+        job = npc_jobs.submit(
+            session_id,
+            lambda: generate_npc_data(description),
+            lambda npc_data: insert_generated_npc(session_id, npc_id, npc_data, x, y))
+    except JobQueueFull:
+        logger.warning("Refused NPC creation, the generation queue is full")
+        return jsonify({'success': False, 'message': 'Too many NPCs are being created, try again shortly'}), 429
+
+    return jsonify({
+        'success': True,
+        'message': 'NPC generation started',
+        'job': job.to_dict()
+    }), 202
+
+@app.route('/npc_jobs/<job_id>')
+def npc_job_status(job_id):
+    """Status of an NPC generation job, with the NPC once it is done"""
+    job = npc_jobs.get(job_id, owner=session.get('session_id'))
+    if job is None:
+        return jsonify({'success': False, 'message': 'Unknown job'}), 404
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/metrics/llm')
+def llm_metrics():
+    """Model call queue depth and outcomes, with response cache counters"""
+    import character_generator
+    return jsonify({
+        'gateway': character_generator.gateway.metrics(),
+        'cache': character_generator.llm_cache.stats()
+    })
 
 @app.route('/reset_game', methods=['POST'])
 def reset_game():
     session_id = session.get('session_id')
     if session_id:
-        if session_id in game_worlds:
-            del game_worlds[session_id]
-        if session_id in game_messages:
-            del game_messages[session_id]
+        session_store.discard(session_id)
+        g.world_discarded = True
     return jsonify({'status': 'success'})
 
-# Cleanup function to remove inactive sessions periodically
 def cleanup_inactive_sessions():
     """Remove game worlds for sessions that haven't been active for a while"""
-    # This could be implemented with a timestamp-based cleanup mechanism
-    pass
+    evicted = session_store.evict_idle()
+    logger.debug(f"Session cleanup evicted {evicted} worlds, stats: {session_store.stats()}")
+    return evicted
 
 if __name__ == '__main__':
     app.run(debug=True) 
\ No newline at end of file
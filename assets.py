@@ -0,0 +1,142 @@
+"""
+Fingerprinted static files served with long-lived caching
+
+Brotli is optional. Without the brotli package text files are only
+precompressed with gzip.
+"""
+from dataclasses import dataclass, field
+from typing import Dict, Iterable, Optional
+from werkzeug.wrappers import Request, Response
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Content behind a fingerprinted URL never changes, so browsers may keep it for a year
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+# Hex digits of the content hash put into file names
+FINGERPRINT_LENGTH = 12
+
+# Types worth compressing, images and audio are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml')
+
+# Encodings in order of preference
+ENCODINGS = ('br', 'gzip')
+
+_CSS_URL = re.compile(r"""url\(\s*(['"]?)(/[^'")\s]+)\1\s*\)""")
+
+def compress(content: bytes) -> Dict[str, bytes]:
+    """gzip and, when available, brotli encodings of content that come out smaller"""
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+    return {encoding: data for encoding, data in variants.items() if len(data) < len(content)}
+
+@dataclass
+class Asset:
+    """A file's content, fingerprint and precompressed variants"""
+    path: str  # Relative to the asset root, like static/css/game.css
+    content: bytes
+    mimetype: str
+    digest: str
+    encodings: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def url(self) -> str:
+        base, extension = os.path.splitext(self.path)
+        return f"/{base}.{self.digest[:FINGERPRINT_LENGTH]}{extension}"
+
+class AssetStore:
+    """Static files read once at startup and addressed by their content hash.
+
+    ``url`` turns static/css/game.css into /static/css/game.<hash>.css.
+    New content means a new URL, so those URLs are served as immutable.
+    Plain URLs keep working but are revalidated against a strong ETag on
+    every use. Text files are compressed up front, and URLs in stylesheets
+    that point at other assets are rewritten to their fingerprinted form.
+    """
+    def __init__(self, root: str, directories: Iterable[str]):
+        self.root = root
+        self._assets: Dict[str, Asset] = {}
+        self._fingerprinted: Dict[str, Asset] = {}
+        paths = []
+        for directory in directories:
+            for dirpath, _, filenames in os.walk(os.path.join(root, directory)):
+                for filename in filenames:
+                    path = os.path.relpath(os.path.join(dirpath, filename), root)
+                    paths.append(path.replace(os.sep, '/'))
+        # Stylesheets go last since their content depends on the other URLs
+        for path in sorted(paths, key=lambda path: (path.endswith('.css'), path)):
+            self._load(path)
+        logger.info(f"Fingerprinted {len(self._assets)} static files")
+
+    def __len__(self) -> int:
+        return len(self._assets)
+
+    def _load(self, path: str) -> None:
+        with open(os.path.join(self.root, path), 'rb') as f:
+            content = f.read()
+        mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        if mimetype == 'text/css':
+            content = _CSS_URL.sub(self._rewrite_css_url, content.decode('utf-8')).encode('utf-8')
+        asset = Asset(path, content, mimetype, hashlib.sha256(content).hexdigest())
+        if mimetype.startswith(COMPRESSIBLE_TYPES):
+            asset.encodings = compress(content)
+        self._assets[path] = asset
+        self._fingerprinted[asset.url[1:]] = asset
+
+    def _rewrite_css_url(self, match: re.Match) -> str:
+        asset = self._assets.get(match.group(2)[1:])
+        if asset is None:
+            return match.group(0)
+        return f"url({match.group(1)}{asset.url}{match.group(1)})"
+
+    def get(self, path: str) -> Optional[Asset]:
+        return self._assets.get(path.lstrip('/'))
+
+    def url(self, path: str) -> str:
+        """Fingerprinted URL of an asset, or its plain URL if it is not known"""
+        asset = self.get(path)
+        if asset is None:
+            logger.warning(f"No static file {path} to fingerprint")
+            return '/' + path.lstrip('/')
+        return asset.url
+
+    def response(self, path: str, request: Request) -> Optional[Response]:
+        """Response for an asset URL path, or None when there is no such asset"""
+        asset = self._fingerprinted.get(path)
+        immutable = asset is not None
+        if asset is None:
+            asset = self._assets.get(path)
+            if asset is None:
+                return None
+
+        encoding = next((encoding for encoding in ENCODINGS
+                         if encoding in asset.encodings and request.accept_encodings[encoding]), None)
+        body = asset.encodings[encoding] if encoding else asset.content
+        response = Response(body, mimetype=asset.mimetype)
+        if asset.encodings:
+            response.vary.add('Accept-Encoding')
+        # Every encoding is a different representation with its own strong ETag
+        if encoding:
+            response.content_encoding = encoding
+            response.set_etag(f"{asset.digest}-{encoding}")
+        else:
+            response.set_etag(asset.digest)
+        if immutable:
+            response.cache_control.public = True
+            response.cache_control.max_age = IMMUTABLE_MAX_AGE
+            response.cache_control.immutable = True
+        else:
+            response.cache_control.no_cache = True
+        return response.make_conditional(request, accept_ranges=True, complete_length=len(body))
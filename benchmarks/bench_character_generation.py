@@ -0,0 +1,37 @@
+"""
+Compare character generation latency of the combined and two call modes
+
+This calls the real model, so it needs OPENAI_API_KEY and costs tokens.
+Run from the repository root with: python benchmarks/bench_character_generation.py [rounds]
+"""
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from character_generator import GENERATION_MODES, create_character_data
+
+PROMPT = "A friendly merchant who sells potions"
+
+def main():
+    if not os.getenv('OPENAI_API_KEY'):
+        sys.exit("OPENAI_API_KEY is not set")
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    logging.disable(logging.CRITICAL)
+
+    print(f"{'mode':>10} {'median s':>9} {'min s':>7} {'max s':>7} {'failed':>7}")
+    for mode in GENERATION_MODES:
+        timings, failed = [], 0
+        for _ in range(rounds):
+            start = time.perf_counter()
+            if create_character_data(PROMPT, mode=mode) is None:
+                failed += 1
+            timings.append(time.perf_counter() - start)
+        print(f"{mode:>10} {statistics.median(timings):>9.2f} {min(timings):>7.2f} "
+              f"{max(timings):>7.2f} {failed:>7}")
+
+if __name__ == '__main__':
+    main()
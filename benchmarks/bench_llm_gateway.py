@@ -0,0 +1,55 @@
+"""
+Load test the LLM gateway offline against the fake backend
+
+Run from the repository root with: python benchmarks/bench_llm_gateway.py
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from llm import FakeBackend, LLMBusy, LLMGateway
+from sequence_schema import SEQUENCE_FUNCTIONS
+
+CALLERS = 64
+LATENCY = 0.2
+SETTINGS = [
+    # (max_concurrency, calls per second)
+    (1, None),
+    (4, None),
+    (16, None),
+    (16, 20.0),
+]
+
+def run(max_concurrency, rate):
+    gateway = LLMGateway(FakeBackend(latency=LATENCY), max_concurrency=max_concurrency,
+                         rate=rate, burst=max_concurrency, max_queue=CALLERS, queue_timeout=60)
+    busy = []
+
+    def caller(i):
+        try:
+            gateway.call_function('gpt-4o', f"prompt {i}", SEQUENCE_FUNCTIONS, 'create_sequence')
+        except LLMBusy:
+            busy.append(i)
+
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(CALLERS)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return elapsed, gateway.metrics(), len(busy)
+
+def main():
+    print(f"{CALLERS} callers, {LATENCY * 1000:.0f} ms per fake call")
+    print(f"{'concurrency':>11} {'rate/s':>7} {'calls/s':>8} {'max queue':>9} {'avg wait s':>10} {'refused':>7}")
+    for max_concurrency, rate in SETTINGS:
+        elapsed, metrics, refused = run(max_concurrency, rate)
+        print(f"{max_concurrency:>11} {rate or '-':>7} {metrics['calls'] / elapsed:>8.1f} "
+              f"{metrics['max_waiting']:>9} {metrics['avg_wait']:>10.2f} {refused:>7}")
+
+if __name__ == '__main__':
+    main()
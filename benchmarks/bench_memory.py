@@ -0,0 +1,77 @@
+"""
+Benchmark the memory held per world and per NPC instance
+
+Run from the repository root with: python benchmarks/bench_memory.py
+"""
+import gc
+import logging
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npc import NPCTemplate
+from npc_registry import registry
+from world import World
+
+WORLDS = 200
+NPCS = 5000
+
+TEMPLATE_DATA = {
+    'npc': {'name': 'Walker', 'emoji': '🚶', 'wander': {'enabled': True, 'interval': 1}},
+    'sequence': [
+        {'type': 'talk', 'text': 'Hello!'},
+        {'type': 'ask', 'text': 'What is your name?', 'user_input': 'name'},
+        {'type': 'talk', 'text': 'Nice to meet you, {name}!'},
+    ],
+}
+
+def measure(build) -> int:
+    """Bytes still allocated after build(), keeping its result alive"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    gc.collect()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del kept
+    return after - before
+
+def build_worlds():
+    return [World() for _ in range(WORLDS)]
+
+def build_npcs(template: NPCTemplate, talking: bool):
+    world = World(load_npcs=False)
+    output = []
+    for i in range(NPCS):
+        npc = template.instantiate()
+        npc.id = f'bench_{i}'
+        npc.x, npc.y = i, 0
+        world.add_location(npc)
+        if talking:
+            npc.interact(world.character, output)
+            npc.interact(world.character, output)
+            npc.provide_response('Bench', world.character)
+    return world
+
+def main():
+    logging.disable(logging.CRITICAL)
+    # Shared templates are paid for once per process, not per world
+    registry.static_templates()
+    template = NPCTemplate('bench', TEMPLATE_DATA)
+    # Warm up so lazy imports and caches are not counted
+    build_npcs(template, talking=True)
+
+    rows = [
+        ('world with static NPCs', measure(build_worlds) / WORLDS),
+        ('idle NPC', measure(lambda: build_npcs(template, talking=False)) / NPCS),
+        ('NPC in conversation', measure(lambda: build_npcs(template, talking=True)) / NPCS),
+    ]
+    print(f"{'object':<24} {'bytes':>10}")
+    for name, size in rows:
+        print(f"{name:<24} {size:>10.0f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Benchmark the cost of World.update_npcs against the number of NPCs
+
+Run from the repository root with: python benchmarks/bench_npc_tick.py
+"""
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npc import NPCTemplate
+from walkability import WalkabilityGrid
+from world import World, OBJECTS, VECTORIZED
+import vector_wander
+
+NPC_COUNTS = [10, 100, 1000, 5000]
+TICKS = 20
+DUE_FRACTIONS = [1.0, 0.01]
+MAP_SIZE = 200
+SIMULATIONS = [OBJECTS, VECTORIZED] if vector_wander.AVAILABLE else [OBJECTS]
+
+TEMPLATE_DATA = {
+    'npc': {'name': 'Walker', 'emoji': '🚶', 'wander': {'enabled': True, 'interval': 1}},
+    'sequence': [{'type': 'talk', 'text': 'Hello!'}],
+}
+
+def build_world(npc_count: int, simulation: str) -> World:
+    """Create a world on an open map populated with wandering NPCs"""
+    world = World(simulation=simulation)
+    world.grid = WalkabilityGrid(MAP_SIZE, MAP_SIZE, bytes([1]) * (MAP_SIZE * MAP_SIZE))
+    template = NPCTemplate('bench', TEMPLATE_DATA)
+    half = MAP_SIZE // 2
+    for i in range(npc_count):
+        npc = template.instantiate()
+        npc.id = f'bench_{i}'
+        npc.x, npc.y = (i % MAP_SIZE) - half, (i // MAP_SIZE) - half
+        world.add_location(npc)
+    return world
+
+def bench(npc_count: int, due_fraction: float, simulation: str) -> float:
+    """Average seconds per tick with the given fraction of NPCs due to wander"""
+    world = build_world(npc_count, simulation)
+    npcs = world.locations
+    due_count = max(1, int(npc_count * due_fraction))
+    total = 0.0
+    for _ in range(TICKS):
+        for i, npc in enumerate(npcs):
+            npc.last_wander_time = 0 if i < due_count else time.time() + 1000
+        world.reschedule_wandering()
+        start = time.perf_counter()
+        world.update_npcs()
+        total += time.perf_counter() - start
+    return total / TICKS
+
+def main():
+    print(f"{'simulation':>11} {'NPCs':>8} {'due':>6} {'ms/tick':>10} {'us/NPC':>10}")
+    for simulation in SIMULATIONS:
+        for npc_count in NPC_COUNTS:
+            for due_fraction in DUE_FRACTIONS:
+                seconds = bench(npc_count, due_fraction, simulation)
+                print(f"{simulation:>11} {npc_count:>8} {due_fraction:>6.0%} {seconds * 1000:>10.3f} "
+                      f"{seconds * 1e6 / npc_count:>10.2f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+Benchmark path queries on the game map, with and without cached distance fields
+
+Run from the repository root with: python benchmarks/bench_pathfinding.py
+"""
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from pathfinding import Pathfinder
+from walkability import load_grid
+
+QUERIES = 200
+TARGETS = 8
+
+def bench(pathfinder: Pathfinder, pairs, query) -> float:
+    """Average milliseconds per query over the given start and goal pairs"""
+    start = time.perf_counter()
+    for a, b in pairs:
+        query(a, b)
+    return (time.perf_counter() - start) * 1000 / len(pairs)
+
+def main():
+    grid = load_grid()
+    rng = random.Random(0)
+    cells = grid.region_positions(grid.largest_region())
+    targets = rng.sample(cells, TARGETS)
+    pairs = [(rng.choice(cells), rng.choice(targets)) for _ in range(QUERIES)]
+
+    cold = Pathfinder(grid)
+    start = time.perf_counter()
+    warm = Pathfinder(grid)
+    warm.warm(targets)
+    field_ms = (time.perf_counter() - start) * 1000 / TARGETS
+
+    print(f"{'query':>22} {'ms/query':>10}")
+    print(f"{'distance field build':>22} {field_ms:>10.3f}")
+    print(f"{'A* path':>22} {bench(cold, pairs, cold.find_path):>10.3f}")
+    print(f"{'cached field path':>22} {bench(warm, pairs, warm.find_path):>10.3f}")
+    print(f"{'cached next step':>22} {bench(warm, pairs, warm.next_step):>10.3f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark world snapshots against the JSON game state path and pickle
+
+The JSON path only carries what the browser saves, player, NPC positions and
+dynamic NPCs, so it loses dialogue progress and the change log.
+
+Run from the repository root with: python benchmarks/bench_snapshot.py
+"""
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('OPENAI_API_KEY', 'benchmark')
+
+from app import GameState, GameStateBuilder
+from snapshot import decode_world, encode_world
+from world import World
+
+ROUNDS = 200
+DYNAMIC_NPC_COUNTS = [0, 50, 500]
+
+def build_world(dynamic_count: int) -> World:
+    """A world with some inventory, a conversation in progress and generated NPCs"""
+    world = World()
+    world.character.add_item('fish', 3)
+    world.character.add_item('coins', 12)
+    for i in range(dynamic_count):
+        world.dynamic_npcs.append({
+            'id': f'bench{i}',
+            'x': i % 9,
+            'y': i // 9 % 9,
+            'data': {
+                'npc': {'name': f'Generated {i}', 'emoji': '🧙', 'personality': 'A benchmark wizard'},
+                'sequence': [
+                    {'type': 'talk', 'text': 'Greetings, traveller.'},
+                    {'type': 'ask', 'text': 'What is your quest?', 'user_input': 'quest'},
+                    {'type': 'give', 'text': 'Take this for {quest}.', 'item': {'name': 'Scroll', 'quantity': 1}},
+                ],
+            },
+        })
+    world.reload_npcs()
+    leo = next(npc for npc in world.locations if npc.id == 'leo.yaml')
+    world.character.x, world.character.y = leo.x, leo.y
+    world.try_interact()
+    world.try_interact()
+    leo.provide_response('Bench')
+    return world
+
+def json_encode(world: World) -> bytes:
+    return json.dumps(GameStateBuilder(world).build_state()).encode('utf-8')
+
+def json_decode(data: bytes) -> World:
+    state = GameState.from_request({'savedState': json.loads(data)})
+    world = World()
+    state.apply_to_world(world)
+    return world
+
+def pickle_encode(world: World) -> bytes:
+    return pickle.dumps(world, protocol=pickle.HIGHEST_PROTOCOL)
+
+def timed(function, argument) -> float:
+    start = time.perf_counter()
+    for _ in range(ROUNDS):
+        function(argument)
+    return (time.perf_counter() - start) / ROUNDS
+
+def main():
+    # Dialogue and world debug logging would dominate the timings
+    logging.disable(logging.CRITICAL)
+    print(f"{'dynamic':>8} {'format':>9} {'bytes':>8} {'encode us':>10} {'decode us':>10}")
+    for dynamic_count in DYNAMIC_NPC_COUNTS:
+        world = build_world(dynamic_count)
+        formats = [
+            ('json', json_encode, json_decode),
+            ('pickle', pickle_encode, pickle.loads),
+            ('snapshot', encode_world, decode_world),
+        ]
+        for name, encode, decode in formats:
+            data = encode(world)
+            print(f"{dynamic_count:>8} {name:>9} {len(data):>8} "
+                  f"{timed(encode, world) * 1e6:>10.1f} {timed(decode, data) * 1e6:>10.1f}")
+
+if __name__ == '__main__':
+    main()
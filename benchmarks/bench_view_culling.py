@@ -0,0 +1,63 @@
+"""
+Benchmark full state payloads with and without culling them to the player's view
+
+Run from the repository root with: python benchmarks/bench_view_culling.py
+"""
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from npc import NPC
+from walkability import WalkabilityGrid
+from world import World, VIEW_MARGIN
+
+NPC_COUNTS = [100, 1000, 10000]
+MAP_SIZE = 200
+VIEW_DISTANCE = 10 + VIEW_MARGIN  # Half the width of the displayed map
+REPEATS = 20
+
+def build_world(npc_count: int) -> World:
+    """An open map with NPCs scattered over it, the player in the middle"""
+    world = World(load_npcs=False)
+    world.grid = WalkabilityGrid(MAP_SIZE, MAP_SIZE, bytes([1]) * (MAP_SIZE * MAP_SIZE))
+    world.view_distance = VIEW_DISTANCE
+    half = MAP_SIZE // 2
+    cells = random.Random(0).sample(range(MAP_SIZE * MAP_SIZE), npc_count)
+    for i, cell in enumerate(cells):
+        npc = NPC(cell % MAP_SIZE - half, cell // MAP_SIZE - half, name=f'npc_{i}', should_wander=False)
+        npc.id = npc.name
+        world.add_location(npc)
+    world.commit_player_state()
+    return world
+
+def bench(build) -> tuple:
+    """Average milliseconds to build and serialize a payload, and its size in bytes"""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        body = json.dumps(build())
+    return (time.perf_counter() - start) * 1000 / REPEATS, len(body)
+
+def main():
+    print(f"{'NPCs':>8} {'payload':>8} {'ms':>8} {'bytes':>10}")
+    for npc_count in NPC_COUNTS:
+        world = build_world(npc_count)
+
+        def every_npc():
+            return {'locations': world.locations_payload(),
+                    'npcPositions': {loc.id: {'x': loc.x, 'y': loc.y} for loc in world.locations}}
+
+        def in_view():
+            world._visible = None  # Time the cell index lookup as well
+            return {'locations': world.visible_locations_payload(),
+                    'npcPositions': world.npc_positions_payload()}
+
+        for name, build in (('all', every_npc), ('view', in_view)):
+            ms, size = bench(build)
+            print(f"{npc_count:>8} {name:>8} {ms:>8.3f} {size:>10}")
+
+if __name__ == '__main__':
+    main()
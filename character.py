@@ -1,6 +1,10 @@
 from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
 
 class Character:
+    # Slotted, worlds hold one of these for the player and every NPC
+    __slots__ = ('x', 'y', 'inventory', 'emoji')
+
     def __init__(self, x: int, y: int, emoji: str='🐱'):
         self.x = x
         self.y = y
@@ -10,8 +14,13 @@ class Character:
     def interact(self, character: "Character") -> None:
         pass 
 
-    def talk(self, text):
-        print(f"{self.emoji}: {text}")
+    def talk(self, text, output: Optional[List[str]] = None):
+        """Say a line into output, or print it when there is no output"""
+        line = f"{self.emoji}: {text}"
+        if output is None:
+            print(line)
+        else:
+            output.append(line)
     
     def move(self, dx: int, dy: int):
         self.x += dx
@@ -19,17 +28,46 @@ class Character:
 
     def has_item(self, item: str, amount: int = 1) -> bool:
         """Check if character has at least the specified amount of an item"""
-        return item in self.inventory and self.inventory[item] >= amount
+        return self.inventory.get(item, 0) >= amount
+
+    def has_items(self, items: Dict[str, int]) -> bool:
+        """Check if character has at least the given amount of every item"""
+        return all(self.has_item(item, amount) for item, amount in items.items())
 
     def add_item(self, item: str, amount: int = 1):
-        if item not in self.inventory:
-            self.inventory[item] = 0
-        self.inventory[item] += amount
+        """Add any number of an item at once"""
+        if amount < 0:
+            raise ValueError(f"Cannot add {amount} {item}")
+        if amount:
+            self.inventory[item] = self.inventory.get(item, 0) + amount
 
     def remove_item(self, item: str, amount: int = 1) -> bool:
-        if item in self.inventory and self.inventory[item] >= amount:
-            self.inventory[item] -= amount
-            # if self.inventory[item] == 0:
-            #     del self.inventory[item]
-            return True
-        return False 
\ No newline at end of file
+        """Remove any number of an item at once, or nothing if there are not enough"""
+        if amount < 0:
+            raise ValueError(f"Cannot remove {amount} {item}")
+        have = self.inventory.get(item, 0)
+        if have < amount:
+            return False
+        if have == amount:
+            # Used up items leave the inventory instead of lingering at zero
+            self.inventory.pop(item, None)
+        else:
+            self.inventory[item] = have - amount
+        return True
+
+    def trade(self, give: Dict[str, int], receive: Dict[str, int]) -> bool:
+        """Hand over every item in give and get every item in receive, or change nothing.
+
+        Amounts are checked before anything is moved, so a trade the
+        character cannot afford, or one with an invalid amount, leaves the
+        inventory exactly as it was.
+        """
+        if any(amount < 0 for amount in (*give.values(), *receive.values())):
+            raise ValueError("Trade amounts cannot be negative")
+        if not self.has_items(give):
+            return False
+        for item, amount in give.items():
+            self.remove_item(item, amount)
+        for item, amount in receive.items():
+            self.add_item(item, amount)
+        return True 
\ No newline at end of file
@@ -1,92 +1,165 @@
-import json
 import yaml
-from openai import OpenAI
 import os
 import dotenv
 from npc_schema import NPC_FUNCTIONS
 from sequence_schema import SEQUENCE_FUNCTIONS
+from character_schema import CHARACTER_FUNCTIONS
+from llm_cache import LLMCache
+from llm import create_gateway
+from partial_json import parse_partial_json
+import json
 import logging
+import tempfile
+import time
 
 dotenv.load_dotenv()
 
 logger = logging.getLogger(__name__)
 
-# Initialize OpenAI client with explicit API key from environment
-client = OpenAI(
-    api_key=os.getenv('OPENAI_API_KEY')
+# Character generation modes: one structured call, or NPC then sequence
+COMBINED = 'combined'
+TWO_CALL = 'two_call'
+GENERATION_MODES = (COMBINED, TWO_CALL)
+DEFAULT_GENERATION_MODE = os.getenv('NPC_GENERATION_MODE', COMBINED)
+
+MODEL = "gpt-4o"
+
+# All model calls go through one gateway that bounds and paces them
+gateway = create_gateway()
+
+# Identical requests are answered from disk instead of the API
+llm_cache = LLMCache(
+    os.getenv('LLM_CACHE_DIR', os.path.join(tempfile.gettempdir(), 'ai-playground-llm-cache')),
+    max_bytes=int(float(os.getenv('LLM_CACHE_MAX_MB', 64)) * 1024 * 1024),
+    ttl=float(os.getenv('LLM_CACHE_TTL')) if os.getenv('LLM_CACHE_TTL') else None
 )
 
-def create_sequence(prompt):
+def call_function(prompt, functions, function_name, on_partial=None):
+    """
+    Makes the model call the named function for a prompt and returns its arguments.
+    Results are cached and concurrent identical calls share one request.
+    With on_partial the response is streamed and on_partial gets the arguments
+    parsed so far after every piece, or the whole arguments once on a cache hit.
+    """
+    def request():
+        return gateway.call_function(MODEL, prompt, functions, function_name)
+
+    def stream():
+        buffer = ""
+        for piece in gateway.stream_function(MODEL, prompt, functions, function_name):
+            buffer += piece
+            partial = parse_partial_json(buffer)
+            if partial is not None:
+                on_partial(partial)
+        return json.loads(buffer)
+
+    key = llm_cache.key(MODEL, {"functions": functions, "function_call": function_name}, prompt)
+    if on_partial is None:
+        return llm_cache.get_or_compute(key, request)
+
+    streamed = False
+    def compute():
+        nonlocal streamed
+        streamed = True
+        return stream()
+
+    result = llm_cache.get_or_compute(key, compute)
+    if not streamed and result is not None:
+        on_partial(result)
+    return result
+
+class FirstTalkLine:
+    """Passes the text of a sequence's opening talk node to on_text as it grows"""
+    def __init__(self, on_text):
+        self.on_text = on_text
+        self.text = ""
+
+    def __call__(self, partial):
+        sequence = partial.get("sequence") if isinstance(partial, dict) else None
+        if not sequence or not isinstance(sequence[0], dict):
+            return
+        first = sequence[0]
+        text = first.get("text")
+        if first.get("type") == "talk" and isinstance(text, str) and len(text) > len(self.text):
+            self.text = text
+            self.on_text(text)
+
+def create_sequence(prompt, on_text=None):
     """
     Creates just a sequence based on the given prompt using OpenAI's API.
     Returns the sequence directly without NPC wrapper.
+    When the sequence opens with a talk line, on_text receives that line as it streams in.
     """
     logger.info(f"Creating sequence with prompt:\n {prompt}")
     try:
-        sequence_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": prompt}
-            ],
-            functions=SEQUENCE_FUNCTIONS,
-            function_call={"name": "create_sequence"}
-        )
-
-        # Extract the sequence data
-        sequence_data = json.loads(sequence_response.choices[0].message.function_call.arguments)
+        on_partial = FirstTalkLine(on_text) if on_text else None
+        sequence_data = call_function(prompt, SEQUENCE_FUNCTIONS, "create_sequence", on_partial)
         logger.info(f"Sequence data:\n {sequence_data}")
         return sequence_data["sequence"]
 
     except Exception as e:
-        print(f"Error creating sequence: {str(e)}")
+        logger.error(f"Error creating sequence: {str(e)}")
         return None
 
-def create_character(prompt):
+def _generate_combined(prompt):
+    """NPC attributes and sequence from a single call with the merged schema"""
+    character_data = call_function(
+        f"Create an NPC character and its conversation sequence based on this description: {prompt}",
+        CHARACTER_FUNCTIONS, "create_character")
+    return {
+        "npc": character_data["npc"],
+        "sequence": character_data["sequence"]
+    }
+
+def _generate_two_call(prompt):
+    """NPC attributes first, then a sequence written for that NPC"""
+    # First, create the NPC character
+    npc_data = call_function(
+        f"Create an NPC character based on this description: {prompt}",
+        NPC_FUNCTIONS, "create_npc")
+
+    # Then, create the sequence based on the NPC's personality
+    sequence_prompt = f"Create a conversation sequence for an NPC named {npc_data['name']} who is {npc_data['personality']}. {prompt}"
+    sequence_data = call_function(sequence_prompt, SEQUENCE_FUNCTIONS, "create_sequence")
+    
+    # Combine NPC and sequence data
+    return {
+        "npc": npc_data,
+        "sequence": sequence_data["sequence"]
+    }
+
+def create_character_data(prompt, mode=None):
     """
-    Creates a character based on the given prompt using OpenAI's API.
-    Generates both NPC attributes and conversation sequence.
+    Creates a character as a dict with 'npc' and 'sequence' keys.
+    The combined mode makes one model call, the two_call mode makes two.
+    Returns None if generation fails.
     """
-    try:
-        # First, create the NPC character
-        npc_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": f"Create an NPC character based on this description: {prompt}"}
-            ],
-            functions=NPC_FUNCTIONS,
-            function_call={"name": "create_npc"}
-        )
-
-        # Extract the NPC data
-        npc_data = json.loads(npc_response.choices[0].message.function_call.arguments)
-
-        # Then, create the sequence based on the NPC's personality
-        sequence_prompt = f"Create a conversation sequence for an NPC named {npc_data['name']} who is {npc_data['personality']}. {prompt}"
-        sequence_response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "user", "content": sequence_prompt}
-            ],
-            functions=SEQUENCE_FUNCTIONS,
-            function_call={"name": "create_sequence"}
-        )
-
-        # Extract the sequence data
-        sequence_data = json.loads(sequence_response.choices[0].message.function_call.arguments)
-        
-        # Combine NPC and sequence data
-        combined_data = {
-            "npc": npc_data,
-            "sequence": sequence_data["sequence"]
-        }
-        
-        # Convert to YAML
-        yaml_output = yaml.dump(combined_data, sort_keys=False, allow_unicode=True)
-        return yaml_output
+    mode = mode or DEFAULT_GENERATION_MODE
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown generation mode: {mode}")
 
+    start = time.perf_counter()
+    try:
+        if mode == COMBINED:
+            character_data = _generate_combined(prompt)
+        else:
+            character_data = _generate_two_call(prompt)
     except Exception as e:
-        print(f"Error creating character: {str(e)}")
+        logger.error(f"Error creating character: {str(e)}")
+        return None
+    finally:
+        logger.info(f"Character generation ({mode}) took {time.perf_counter() - start:.2f}s")
+    return character_data
+
+def create_character(prompt, mode=None):
+    """
+    Creates a character based on the given prompt using OpenAI's API.
+    Generates both NPC attributes and conversation sequence as YAML.
+    """
+    character_data = create_character_data(prompt, mode)
+    if character_data is None:
         return None
+    return yaml.dump(character_data, sort_keys=False, allow_unicode=True)
 
 def main():
     # Example prompts
@@ -0,0 +1,21 @@
+"""
+Combined NPC and sequence schema for single call character generation
+"""
+import copy
+from npc_schema import NPC_FUNCTIONS
+from sequence_schema import SEQUENCE_FUNCTIONS
+
+CHARACTER_FUNCTIONS = [
+    {
+        "name": "create_character",
+        "description": "Creates an NPC character together with the sequence of actions it uses to interact with players.",
+        "parameters": {
+            "type": "object",
+            "properties": {
+                "npc": copy.deepcopy(NPC_FUNCTIONS[0]["parameters"]),
+                "sequence": copy.deepcopy(SEQUENCE_FUNCTIONS[0]["parameters"]["properties"]["sequence"])
+            },
+            "required": ["npc", "sequence"]
+        }
+    }
+]
@@ -0,0 +1,57 @@
+"""
+Fan-out of world events to connected clients
+"""
+from typing import Any, Dict, List
+import json
+import queue
+import threading
+
+class EventBus:
+    """Delivers published events to every subscriber queue.
+
+    A subscriber that falls too far behind gets its backlog replaced by a
+    single ``resync`` event telling it to fetch the full state again.
+    """
+    def __init__(self, max_queue_size: int = 256):
+        self.max_queue_size = max_queue_size
+        self._subscribers: List[queue.Queue] = []
+        self._lock = threading.Lock()
+
+    @property
+    def subscriber_count(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> queue.Queue:
+        subscription = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: queue.Queue) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        if not self._subscribers:
+            return
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            try:
+                subscription.put_nowait(event)
+            except queue.Full:
+                self._resync(subscription)
+
+    def _resync(self, subscription: queue.Queue) -> None:
+        """Drop a lagging subscriber's backlog in favour of a resync request"""
+        try:
+            while True:
+                subscription.get_nowait()
+        except queue.Empty:
+            pass
+        subscription.put_nowait({'type': 'resync'})
+
+def format_sse(event: Dict[str, Any]) -> str:
+    """Encode an event as a server-sent events message"""
+    return f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
@@ -0,0 +1,115 @@
+"""
+Background jobs for slow work such as NPC generation
+"""
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+import logging
+import threading
+import time
+import uuid
+
+logger = logging.getLogger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+class JobQueueFull(RuntimeError):
+    """Raised when too many jobs are already waiting or running"""
+
+@dataclass
+class Job:
+    """A unit of background work and its outcome"""
+    id: str
+    owner: str
+    status: str = QUEUED
+    result: Any = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+    @property
+    def is_finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+    def to_dict(self) -> Dict[str, Any]:
+        job = {'id': self.id, 'status': self.status}
+        if self.status == DONE:
+            job['result'] = self.result
+        elif self.status == FAILED:
+            job['error'] = self.error
+        return job
+
+class JobPool:
+    """A bounded worker pool that tracks jobs by id.
+
+    At most ``max_pending`` jobs may be queued or running at once, further
+    submissions are refused instead of piling up behind slow workers. The
+    last ``max_finished`` finished jobs are kept so their owners can collect
+    the outcome. Jobs live in this process only.
+    """
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, max_finished: int = 256):
+        self.max_pending = max_pending
+        self.max_finished = max_finished
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job')
+        self._jobs: 'OrderedDict[str, Job]' = OrderedDict()
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def submit(self, owner: str, work: Callable[[], Any],
+               on_done: Optional[Callable[[Any], Any]] = None) -> Job:
+        """Queue work for an owner, returning its job straight away.
+
+        ``on_done`` runs on the worker with the result of ``work`` and its
+        return value becomes the job result. An exception from either
+        marks the job failed.
+        """
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise JobQueueFull(f"{self._pending} jobs already pending")
+            job = Job(id=str(uuid.uuid4()), owner=owner)
+            self._jobs[job.id] = job
+            self._pending += 1
+        self._executor.submit(self._run, job, work, on_done)
+        return job
+
+    def get(self, job_id: str, owner: Optional[str] = None) -> Optional[Job]:
+        """Look up a job, only returning it to its owner when one is given"""
+        job = self._jobs.get(job_id)
+        if job is None or (owner is not None and job.owner != owner):
+            return None
+        return job
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, work: Callable[[], Any],
+             on_done: Optional[Callable[[Any], Any]]) -> None:
+        job.status = RUNNING
+        try:
+            result = work()
+            if on_done is not None:
+                result = on_done(result)
+            job.result = result
+            job.status = DONE
+        except Exception as e:
+            logger.error(f"Job {job.id} failed: {str(e)}", exc_info=True)
+            job.error = str(e)
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            with self._lock:
+                self._pending -= 1
+                self._forget_finished()
+
+    def _forget_finished(self) -> None:
+        finished = [job_id for job_id, job in self._jobs.items() if job.is_finished]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
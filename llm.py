@@ -0,0 +1,331 @@
+"""
+Gateway between the game and the language model provider
+"""
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+class LLMError(RuntimeError):
+    """Raised when a model call cannot be completed"""
+
+class LLMTimeout(LLMError, TimeoutError):
+    """Raised when a model call takes longer than its timeout"""
+
+class LLMBusy(LLMError):
+    """Raised when the gateway refuses a call because too many are waiting"""
+
+class LLMBackend(ABC):
+    """Something that can answer a forced function call"""
+    @abstractmethod
+    def call_function(self, model: str, prompt: str, functions: List[Dict],
+                      function_name: str, timeout: float) -> Dict[str, Any]:
+        """Return the arguments the model passes to function_name"""
+
+    def stream_function(self, model: str, prompt: str, functions: List[Dict],
+                        function_name: str, timeout: float) -> Iterator[str]:
+        """Yield the JSON arguments for function_name in pieces as they are produced"""
+        yield json.dumps(self.call_function(model, prompt, functions, function_name, timeout))
+
+class OpenAIBackend(LLMBackend):
+    """The OpenAI chat completions API, with the client created on first use"""
+    def __init__(self, api_key: Optional[str] = None):
+        self.api_key = api_key
+        self._client = None
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            with self._lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    self._client = OpenAI(api_key=self.api_key or os.getenv('OPENAI_API_KEY'))
+        return self._client
+
+    def call_function(self, model: str, prompt: str, functions: List[Dict],
+                      function_name: str, timeout: float) -> Dict[str, Any]:
+        import openai
+        try:
+            response = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                functions=functions,
+                function_call={"name": function_name},
+                timeout=timeout
+            )
+        except openai.APITimeoutError as e:
+            raise LLMTimeout(str(e))
+        return json.loads(response.choices[0].message.function_call.arguments)
+
+    def stream_function(self, model: str, prompt: str, functions: List[Dict],
+                        function_name: str, timeout: float) -> Iterator[str]:
+        import openai
+        try:
+            stream = self.client.chat.completions.create(
+                model=model,
+                messages=[
+                    {"role": "user", "content": prompt}
+                ],
+                functions=functions,
+                function_call={"name": function_name},
+                timeout=timeout,
+                stream=True
+            )
+            for chunk in stream:
+                if not chunk.choices:
+                    continue
+                function_call = chunk.choices[0].delta.function_call
+                if function_call and function_call.arguments:
+                    yield function_call.arguments
+        except openai.APITimeoutError as e:
+            raise LLMTimeout(str(e))
+
+class FakeBackend(LLMBackend):
+    """Deterministic local answers shaped by the function schema.
+
+    Each call waits ``latency`` seconds plus up to ``jitter`` seconds derived
+    from the prompt, so the same prompt always takes as long and returns the
+    same arguments. Enums take their first value, which keeps generated
+    dialogue to plain talk nodes.
+    """
+    def __init__(self, latency: float = 0.0, jitter: float = 0.0,
+                 sleep: Callable[[float], None] = time.sleep):
+        self.latency = latency
+        self.jitter = jitter
+        self.sleep = sleep
+        self.calls = 0
+
+    # Characters per streamed piece
+    CHUNK_SIZE = 8
+
+    def call_function(self, model: str, prompt: str, functions: List[Dict],
+                      function_name: str, timeout: float) -> Dict[str, Any]:
+        delay, arguments = self._answer(model, prompt, functions, function_name)
+        self._wait(delay, timeout)
+        return arguments
+
+    def stream_function(self, model: str, prompt: str, functions: List[Dict],
+                        function_name: str, timeout: float) -> Iterator[str]:
+        delay, arguments = self._answer(model, prompt, functions, function_name)
+        if delay > timeout:
+            self._wait(delay, timeout)
+        text = json.dumps(arguments, ensure_ascii=False)
+        pieces = [text[i:i + self.CHUNK_SIZE] for i in range(0, len(text), self.CHUNK_SIZE)]
+        # The latency is spread over the pieces like tokens arriving
+        for piece in pieces:
+            self.sleep(delay / len(pieces))
+            yield piece
+
+    def _answer(self, model: str, prompt: str, functions: List[Dict], function_name: str):
+        """Latency and arguments for a call, both derived from its content"""
+        self.calls += 1
+        digest = hashlib.sha256(f"{model}\n{function_name}\n{prompt}".encode('utf-8')).hexdigest()
+        delay = self.latency + self.jitter * int(digest[:8], 16) / 0xFFFFFFFF
+        function = next((f for f in functions if f['name'] == function_name), None)
+        if function is None:
+            raise LLMError(f"Unknown function: {function_name}")
+        return delay, self._fake_value(function['parameters'], function_name, digest[:6])
+
+    def _wait(self, delay: float, timeout: float) -> None:
+        if delay > timeout:
+            self.sleep(timeout)
+            raise LLMTimeout(f"Fake call took longer than {timeout}s")
+        self.sleep(delay)
+
+    def _fake_value(self, schema: Dict, name: str, tag: str) -> Any:
+        if 'enum' in schema:
+            return schema['enum'][0]
+        kind = schema.get('type')
+        if kind == 'object':
+            properties = schema.get('properties', {})
+            return {key: self._fake_value(properties[key], key, tag)
+                    for key in schema.get('required', properties)}
+        if kind == 'array':
+            return [self._fake_value(schema.get('items', {}), name, f"{tag}-{i}") for i in range(2)]
+        if kind == 'integer':
+            return schema.get('default', 1)
+        if kind == 'boolean':
+            return schema.get('default', False)
+        if name == 'emoji':
+            return "🤖"
+        return f"Fake {name} {tag}"
+
+class TokenBucket:
+    """Allows ``rate`` acquisitions per second with bursts of up to ``burst``"""
+    def __init__(self, rate: float, burst: Optional[float] = None,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self.clock = clock
+        self._tokens = self.burst
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def try_acquire(self) -> float:
+        """Take a token, returning 0, or the seconds until one is available"""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """Wait for a token, returning False if none came within timeout"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire()
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+class LLMGateway:
+    """Bounds, paces and measures every call made to a backend.
+
+    At most ``max_concurrency`` calls run at once and, with a ``rate``, no
+    more than that many start per second. Callers wait in line for both.
+    When ``max_queue`` callers are already waiting, or a caller waited
+    ``queue_timeout`` seconds, the call is refused with LLMBusy instead of
+    tying up yet another thread.
+    """
+    def __init__(self, backend: LLMBackend, max_concurrency: int = 4, timeout: float = 60.0,
+                 rate: Optional[float] = None, burst: Optional[float] = None,
+                 max_queue: int = 32, queue_timeout: float = 30.0):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.backend = backend
+        self.max_concurrency = max_concurrency
+        self.timeout = timeout
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self.waiting = 0
+        self.in_flight = 0
+        self.max_waiting = 0
+        self.calls = 0
+        self.failures = 0
+        self.timeouts = 0
+        self.rejected = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+
+    def call_function(self, model: str, prompt: str, functions: List[Dict],
+                      function_name: str, timeout: Optional[float] = None) -> Dict[str, Any]:
+        """Run a forced function call through the limits and return its arguments"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._slot():
+            return self.backend.call_function(model, prompt, functions, function_name, timeout)
+
+    def stream_function(self, model: str, prompt: str, functions: List[Dict],
+                        function_name: str, timeout: Optional[float] = None) -> Iterator[str]:
+        """Stream a forced function call's arguments, holding a slot until the stream ends"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._slot():
+            yield from self.backend.stream_function(model, prompt, functions, function_name, timeout)
+
+    @contextmanager
+    def _slot(self):
+        """Wait in line for a call slot and a rate token, then account for the call"""
+        queued_at = time.monotonic()
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self.rejected += 1
+                raise LLMBusy(f"{self.waiting} model calls already waiting")
+            self.waiting += 1
+            self.max_waiting = max(self.max_waiting, self.waiting)
+
+        acquired = False
+        try:
+            acquired = self._slots.acquire(timeout=self.queue_timeout)
+            if acquired and self.bucket is not None:
+                remaining = self.queue_timeout - (time.monotonic() - queued_at)
+                if not self.bucket.acquire(timeout=max(0.0, remaining)):
+                    self._slots.release()
+                    acquired = False
+        finally:
+            with self._lock:
+                self.waiting -= 1
+                if acquired:
+                    self.in_flight += 1
+                    self.total_wait += time.monotonic() - queued_at
+                else:
+                    self.rejected += 1
+        if not acquired:
+            raise LLMBusy(f"No model call slot within {self.queue_timeout}s")
+
+        started = time.monotonic()
+        try:
+            yield
+        except LLMTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise
+        except Exception:
+            with self._lock:
+                self.failures += 1
+            raise
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+                self.calls += 1
+                self.total_latency += time.monotonic() - started
+            self._slots.release()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Queue depth, concurrency and outcome counters"""
+        with self._lock:
+            started = self.calls + self.in_flight
+            return {
+                'waiting': self.waiting,
+                'in_flight': self.in_flight,
+                'max_waiting': self.max_waiting,
+                'calls': self.calls,
+                'failures': self.failures,
+                'timeouts': self.timeouts,
+                'rejected': self.rejected,
+                'avg_wait': self.total_wait / started if started else 0.0,
+                'avg_latency': self.total_latency / self.calls if self.calls else 0.0,
+            }
+
+def create_backend(name: Optional[str] = None) -> LLMBackend:
+    """Backend selected by LLM_BACKEND, openai or fake"""
+    name = (name or os.getenv('LLM_BACKEND', 'openai')).lower()
+    if name == 'openai':
+        return OpenAIBackend()
+    if name == 'fake':
+        return FakeBackend(latency=float(os.getenv('LLM_FAKE_LATENCY', 0.5)),
+                           jitter=float(os.getenv('LLM_FAKE_JITTER', 0.0)))
+    raise ValueError(f"Unknown LLM_BACKEND: {name}")
+
+def create_gateway(backend: Optional[LLMBackend] = None) -> LLMGateway:
+    """Gateway configured from the LLM_* environment variables"""
+    rate = os.getenv('LLM_RATE_PER_SECOND')
+    return LLMGateway(
+        backend or create_backend(),
+        max_concurrency=int(os.getenv('LLM_MAX_CONCURRENCY', 4)),
+        timeout=float(os.getenv('LLM_TIMEOUT', 60)),
+        rate=float(rate) if rate else None,
+        max_queue=int(os.getenv('LLM_MAX_QUEUE', 32)),
+        queue_timeout=float(os.getenv('LLM_QUEUE_TIMEOUT', 30)),
+    )
@@ -0,0 +1,201 @@
+"""
+Disk-backed cache of model responses with single-flight deduplication
+"""
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, Optional
+import hashlib
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r'\s+')
+
+def normalize_prompt(prompt: str) -> str:
+    """Collapse whitespace so trivially different prompts share an entry"""
+    return _WHITESPACE.sub(' ', prompt).strip()
+
+class LLMCache:
+    """Content-addressed model responses stored as JSON files.
+
+    Entries are keyed on the model, the function schema and the normalized
+    prompt. The directory is kept under ``max_bytes`` by removing the least
+    recently used entries, and entries older than ``ttl`` seconds count as
+    misses. Concurrent misses for one key share a single computation.
+
+    The recency index is per process. Several processes may share a
+    directory, each one only evicts the entries it knows about.
+    """
+    def __init__(self, directory: str, max_bytes: int = 64 * 1024 * 1024,
+                 ttl: Optional[float] = None, clock: Callable[[], float] = time.time):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self._index: 'OrderedDict[str, int]' = OrderedDict()
+        self._size = 0
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    @staticmethod
+    def key(model: str, schema: Any, prompt: str) -> str:
+        """Content address of a request"""
+        material = json.dumps({'model': model, 'schema': schema, 'prompt': normalize_prompt(prompt)},
+                              sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Any]:
+        """Cached value for a key, or None"""
+        path = self._path(key)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            with self._lock:
+                self._forget(key)
+            return None
+
+        if self.ttl is not None and self.clock() - entry['created'] > self.ttl:
+            self._remove(key)
+            return None
+
+        with self._lock:
+            if key in self._index:
+                self._index.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return entry['value']
+
+    def put(self, key: str, value: Any) -> None:
+        """Store a JSON serializable value"""
+        data = json.dumps({'created': self.clock(), 'value': value}, ensure_ascii=False).encode('utf-8')
+        path = self._path(key)
+        # Write beside the target and rename so readers never see half an entry
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(temp_path, path)
+        except OSError as e:
+            logger.warning(f"Could not write cache entry {key}: {str(e)}")
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            return
+
+        with self._lock:
+            self._forget(key)
+            self._index[key] = len(data)
+            self._size += len(data)
+            evicted = self._evict_overflow()
+        for old_key in evicted:
+            self._unlink(old_key)
+
+    def get_or_compute(self, key: str, compute: Callable[[], Any]) -> Any:
+        """Return the cached value or compute it once for all concurrent callers.
+
+        None results and exceptions are shared with the callers waiting on
+        the same key but are not cached.
+        """
+        value = self.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+
+        with self._lock:
+            future = self._inflight.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._inflight[key] = future
+        if not leader:
+            self.coalesced += 1
+            return future.result()
+
+        try:
+            # A leader that finished just before we took the lock has stored its value
+            value = self.get(key)
+            if value is None:
+                self.misses += 1
+                value = compute()
+                if value is not None:
+                    self.put(key, value)
+            else:
+                self.hits += 1
+            future.set_result(value)
+            return value
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'entries': len(self._index),
+            'bytes': self._size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+        }
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self) -> None:
+        """Index existing entries, oldest use first"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, name[:-len('.json')], stat.st_size))
+        for _, key, size in sorted(entries):
+            self._index[key] = size
+            self._size += size
+        for old_key in self._evict_overflow():
+            self._unlink(old_key)
+
+    def _evict_overflow(self) -> list:
+        evicted = []
+        while self._size > self.max_bytes and self._index:
+            key, size = self._index.popitem(last=False)
+            self._size -= size
+            evicted.append(key)
+        if evicted:
+            logger.debug(f"Evicted {len(evicted)} cached responses")
+        return evicted
+
+    def _forget(self, key: str) -> None:
+        size = self._index.pop(key, None)
+        if size is not None:
+            self._size -= size
+
+    def _remove(self, key: str) -> None:
+        with self._lock:
+            self._forget(key)
+        self._unlink(key)
+
+    def _unlink(self, key: str) -> None:
+        try:
+            os.unlink(self._path(key))
+        except OSError:
+            pass
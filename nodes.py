@@ -9,7 +9,17 @@ from abc import ABC, abstractmethod
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
+def item_quantity(item: Dict[str, Union[str, int]]) -> Optional[int]:
+    """Quantity of a dialogue item, or None when generated data gives no usable one"""
+    quantity = item.get('quantity', 1)
+    if isinstance(quantity, bool) or not isinstance(quantity, int) or quantity < 1:
+        return None
+    return quantity
+
 class Node(ABC):
+    # Nodes are many and small, subclasses declare their extra fields too
+    __slots__ = ('text', 'next')
+
     def __init__(self, text: str = None):
         self.text = text
         self.next: Optional[Node] = None
@@ -27,6 +37,8 @@ class Node(ABC):
 
 class EndNode(Node):
     """Special node that handles the end of a conversation"""
+    __slots__ = ()
+
     def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
         logger.debug("Handling EndNode - closing conversation")
         npc.is_talking = False
@@ -38,11 +50,13 @@ class EndNode(Node):
         return cls()
 
 class TalkNode(Node):
+    __slots__ = ()
+
     def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
         logger.debug(f"Handling TalkNode with text: {self.text}")
         formatted_text = sequence.format_text(self.text)
         message = f"{npc.name}: {formatted_text}"
-        npc.talk(message)
+        npc.talk(message, sequence.output)
         sequence.history.append({"role": "npc", "text": formatted_text})
         npc.is_talking = True
         return self.next
@@ -52,6 +66,8 @@ class TalkNode(Node):
         return cls(action['text'])
 
 class GiveNode(Node):
+    __slots__ = ('item',)
+
     def __init__(self, text: str, item: Dict[str, Union[str, int]]):
         super().__init__(text)
         self.item = item
@@ -61,14 +77,16 @@ class GiveNode(Node):
         if self.text:
             formatted_text = sequence.format_text(self.text)
             message = f"{npc.name}: {formatted_text}"
-            npc.talk(message)
+            npc.talk(message, sequence.output)
             sequence.history.append({"role": "npc", "text": formatted_text})
             npc.is_talking = True
 
-        if self.item:
-            quantity = self.item.get('quantity', 1)
-            for _ in range(quantity):
-                character.add_item(self.item['name'])
+        # A quantity below one is no gift rather than an error mid-conversation
+        quantity = item_quantity(self.item) if self.item else None
+        if quantity is not None:
+            character.add_item(self.item['name'], quantity)
+        elif self.item:
+            logger.warning(f"Skipping gift with invalid quantity: {self.item}")
 
         return self.next
 
@@ -77,6 +95,8 @@ class GiveNode(Node):
         return cls(action.get('text'), action.get('item'))
 
 class AskNode(Node):
+    __slots__ = ('user_input',)
+
     def __init__(self, text: str, user_input: str):
         super().__init__(text)
         self.user_input = user_input
@@ -84,7 +104,7 @@ class AskNode(Node):
     def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
         formatted_text = sequence.format_text(self.text)
         message = f"{npc.name}: {formatted_text}"
-        npc.talk(message)
+        npc.talk(message, sequence.output)
         sequence.history.append({"role": "npc", "text": formatted_text})
         sequence.waiting_for_response = True
         sequence.current_node = self  # Store current node while waiting for response
@@ -95,18 +115,27 @@ class AskNode(Node):
         return cls(action['text'], action.get('user_input'))
 
 class ChoiceNode(Node):
+    __slots__ = ('choices', 'options')
+
     def __init__(self, text: str):
         super().__init__(text)
         self.choices: Dict[str, Node] = {}  # Maps choice text to its node sequence
+        self.options: List[str] = []  # Every choice text in order, with or without a sequence
+
+    def add_option(self, choice_text: str) -> None:
+        """Add a choice that simply continues with the next node"""
+        if choice_text not in self.options:
+            self.options.append(choice_text)
 
     def add_choice(self, choice_text: str, node: Node) -> None:
         """Add a choice and its corresponding node sequence"""
+        self.add_option(choice_text)
         self.choices[choice_text] = node
 
     def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
         formatted_text = sequence.format_text(self.text)
         message = f"{npc.name}: {formatted_text}"
-        npc.talk(message)
+        npc.talk(message, sequence.output)
         sequence.history.append({"role": "npc", "text": formatted_text})
         npc.is_talking = True
         sequence.waiting_for_response = True
@@ -122,16 +151,23 @@ class ChoiceNode(Node):
                 # Create the node sequence for this choice
                 choice_node = NodeFactory.create_node(choice)
                 node.add_choice(choice['choice_text'], choice_node)
+            else:
+                node.add_option(choice['choice_text'])
         return node
 
 class GenerateNode(Node):
+    __slots__ = ('context',)
+
     def __init__(self, text: str = None, context: str = None):
         super().__init__(text)
         self.context = context
 
-    def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
+    def build_prompt(self, sequence: 'Sequence', history: Optional[List[dict]] = None):
+        """Return the generation prompt and the history kept after generating"""
+        history = sequence.history if history is None else history
+
         # Get the user's choice from the last interaction
-        last_response = sequence.history[-1]['text'] if sequence.history and sequence.history[-1]['role'] == 'player' else None
+        last_response = history[-1]['text'] if history and history[-1]['role'] == 'player' else None
         
         # Build context with the user's choice
         context = sequence.format_text(self.context) if self.context else "Continue the conversation naturally based on the history"
@@ -140,21 +176,28 @@ class GenerateNode(Node):
         
         # Only include the initial greeting in history
         relevant_history = []
-        if sequence.history:
-            first_message = next((h for h in sequence.history if h['role'] == 'npc'), None)
+        if history:
+            first_message = next((h for h in history if h['role'] == 'npc'), None)
             if first_message:
                 relevant_history.append(first_message)
             if last_response:
                 relevant_history.append({"role": "player", "text": last_response})
         
         history_text = "\n".join([f"{'NPC' if h['role'] == 'npc' else 'Player'}: {h['text']}" for h in relevant_history])
-        context_with_history = f"{context}\nConversation history:\n{history_text}"
+        return f"{context}\nConversation history:\n{history_text}", relevant_history
+
+    def handle(self, npc: Character, character: Character, sequence: 'Sequence') -> Optional[Node]:
+        context_with_history, relevant_history = self.build_prompt(sequence)
         
         from character_generator import create_sequence
-        new_sequence = create_sequence(context_with_history)
+        new_sequence = create_sequence(context_with_history, on_text=sequence.stream_text)
         if new_sequence:
             sequence.history = relevant_history
-            new_head = sequence._build_node_chain(new_sequence)
+            new_head = sequence.use_generated(new_sequence)
+            if sequence.stream_text and isinstance(new_head, TalkNode):
+                # The player already watched this line arrive, say it now rather than on the next interaction
+                sequence.current_node = new_head
+                return new_head.handle(npc, character, sequence)
             return new_head
         return None
 
@@ -163,6 +206,8 @@ class GenerateNode(Node):
         return cls(action.get('text'), action.get('context'))
 
 class TradeNode(Node):
+    __slots__ = ('trade',)
+
     def __init__(self, text: str, trade: Dict[str, Union[Dict[str, Union[str, int]], str]]):
         super().__init__(text)
         self.trade = trade
@@ -174,38 +219,29 @@ class TradeNode(Node):
         if self.text:
             formatted_text = sequence.format_text(self.text)
             message = f"{npc.name}: {formatted_text}"
-            npc.talk(message)
+            npc.talk(message, sequence.output)
             sequence.history.append({"role": "npc", "text": formatted_text})
             npc.is_talking = True
 
         want = self.trade['want']
         offer = self.trade['offer']
-        want_quantity = want.get('quantity', 1)
-        
-        has_items = character.has_item(want['name'], want_quantity)
-        
-        if has_items:
-            self._process_successful_trade(want, offer, character)
+
+        # What the player hands over and what they get change together or not at all.
+        # A trade with an unusable quantity fails like one the player cannot afford.
+        want_quantity, offer_quantity = item_quantity(want), item_quantity(offer)
+        if want_quantity is not None and offer_quantity is not None and character.trade(
+                {want['name']: want_quantity}, {offer['name']: offer_quantity}):
             formatted_text = sequence.format_text(self.trade['success_text'])
         else:
             formatted_text = sequence.format_text(self.trade['failure_text'])
         
         message = f"{npc.name}: {formatted_text}"
-        npc.talk(message)
+        npc.talk(message, sequence.output)
         sequence.history.append({"role": "npc", "text": formatted_text})
         npc.is_talking = True
         
         return self.next
 
-    def _process_successful_trade(self, want: dict, offer: dict, character: Character) -> None:
-        want_quantity = want.get('quantity', 1)
-        for _ in range(want_quantity):
-            character.remove_item(want['name'])
-        
-        offer_quantity = offer.get('quantity', 1)
-        for _ in range(offer_quantity):
-            character.add_item(offer['name'])
-
     @classmethod
     def from_action(cls, action: dict) -> 'Node':
         return cls(action.get('text'), action.get('trade'))
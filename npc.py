@@ -1,49 +1,77 @@
 from character import Character
-from typing import List, Dict, Union, Optional
+from typing import List, Dict, Union, Optional, Tuple
 import yaml
 import os
 from dataclasses import dataclass
 import random
 import time
-from sequence import Sequence, Node
+from sequence import Sequence, Node, DialogueGraph
 
-class NPC(Character):
-    @classmethod
-    def from_yaml(cls, yaml_path: str) -> 'NPC':
-        with open(yaml_path, 'r') as f:
-            data = yaml.safe_load(f)
-        return cls.from_yaml_data(data)
-    
-    @classmethod
-    def from_yaml_data(cls, data: dict) -> 'NPC':
+class NPCTemplate:
+    """Parsed NPC definition whose dialogue nodes are shared by every instance"""
+    def __init__(self, template_id: str, data: dict):
         npc_data = data['npc']
         sequence_data = data['sequence']
-        
+
+        self.id = template_id
+        self.data = data
+        self.name = npc_data['name']
+        self.emoji = npc_data['emoji']
+        self.personality = npc_data.get('personality', '')
+
         # Get position from data or let the world decide later
-        position = npc_data.get('position', None)
-        x, y = position if position else (0, 0)
-        
+        self.position = npc_data.get('position', None)
+
+        # Cell the NPC walks to before it starts wandering, if any
+        goal = npc_data.get('goal')
+        self.goal = (int(goal[0]), int(goal[1])) if goal else None
+
         # Get wandering behavior settings
         wander_settings = npc_data.get('wander', {})
         if isinstance(wander_settings, bool):
             # Handle case where wander is just a boolean
-            should_wander = wander_settings
-            wander_interval = 5
+            self.should_wander = wander_settings
+            self.wander_interval = 5
         else:
             # Default wandering behavior based on NPC type
             default_should_wander = not any(word in npc_data.get('name', '').lower() for word in ['shop', 'lake', 'store'])
-            should_wander = wander_settings.get('enabled', default_should_wander)
-            wander_interval = wander_settings.get('interval', 5)
-        
-        # Create sequence
-        sequence = Sequence(sequence_data)
-        
-        npc = cls(x, y, npc_data['emoji'], sequence, npc_data['name'], 
-                 should_wander=should_wander, wander_interval=wander_interval)
-        npc.needs_position = position is None
-        npc.personality = npc_data.get('personality', '')
+            self.should_wander = wander_settings.get('enabled', default_should_wander)
+            self.wander_interval = wander_settings.get('interval', 5)
+
+        # Compile the dialogue once, instances only keep their own cursor
+        self.graph = DialogueGraph(sequence_data)
+
+    @property
+    def needs_position(self) -> bool:
+        return self.position is None
+
+    def instantiate(self) -> 'NPC':
+        """Create a fresh NPC that shares this template's dialogue nodes"""
+        x, y = self.position if self.position else (0, 0)
+        npc = NPC(x, y, self.emoji, Sequence.from_graph(self.graph), self.name,
+                  should_wander=self.should_wander, wander_interval=self.wander_interval)
+        npc.needs_position = self.needs_position
+        npc.goal = self.goal
+        npc.personality = self.personality
+        npc.template = self
+        npc.id = self.id
         return npc
 
+class NPC(Character):
+    __slots__ = ('sequence', 'is_talking', 'name', 'personality', 'needs_position',
+                 'last_wander_time', 'wander_interval', 'wander_interval_offset',
+                 'should_wander', 'goal', 'template', 'id')
+
+    @classmethod
+    def from_yaml(cls, yaml_path: str) -> 'NPC':
+        with open(yaml_path, 'r') as f:
+            data = yaml.safe_load(f)
+        return cls.from_yaml_data(data)
+    
+    @classmethod
+    def from_yaml_data(cls, data: dict) -> 'NPC':
+        return NPCTemplate(data['npc'].get('name', ''), data).instantiate()
+
     def __init__(self, x: int, y: int, emoji: str='', sequence: Sequence = None, 
                  name: str = "Unknown", should_wander: bool = True, 
                  wander_interval: int = 5):
@@ -57,6 +85,9 @@ class NPC(Character):
         self.wander_interval = wander_interval  # Default wander interval in seconds
         self.wander_interval_offset = random.uniform(-0.5, 0.5)  # Smaller random offset
         self.should_wander = should_wander  # Whether this NPC should wander
+        self.goal: Optional[Tuple[int, int]] = None  # Cell to walk to instead of wandering randomly
+        self.template: Optional[NPCTemplate] = None  # Shared definition this NPC was created from
+        self.id: Optional[str] = None  # Stable id, the YAML file name or dynamic_<uuid>
 
     @property
     def waiting_for_response(self) -> bool:
@@ -74,37 +105,57 @@ class NPC(Character):
         
         self.sequence.provide_response(response)
 
-    def interact(self, character: Character) -> None:
-        """Handle interaction with a character"""
+    def interact(self, character: Character, output: Optional[List[str]] = None) -> None:
+        """Handle interaction with a character, saying lines into output"""
         if not self.is_talking:
             self.is_talking = True
             self.sequence.reset()  # Reset sequence to initial state
         
-        self.sequence.interact(self, character)
+        self.sequence.interact(self, character, output)
+
+    @property
+    def wants_to_move(self) -> bool:
+        """Whether the NPC wanders or is on its way to a goal"""
+        return self.should_wander or self.goal is not None
+
+    @property
+    def next_wander_time(self) -> float:
+        """Earliest time this NPC may wander again"""
+        return self.last_wander_time + self.wander_interval + self.wander_interval_offset
 
     def try_wander(self, world, current_time: float) -> bool:
         """Attempt to make the NPC wander if enough time has passed."""
-        if not self.should_wander or self.is_talking:
+        if not self.wants_to_move or self.is_talking:
             return False
 
         # Check if enough time has passed since last wander
-        actual_interval = self.wander_interval + self.wander_interval_offset
-        time_since_last = current_time - self.last_wander_time
-        if time_since_last < actual_interval:
+        if current_time < self.next_wander_time:
             return False
 
-        # Choose a random direction
-        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
-        dx, dy = random.choice(directions)
-        new_x, new_y = self.x + dx, self.y + dy
+        new_x, new_y = self._next_cell(world)
 
         # Check if the new position is valid and unoccupied
         if world.can_move_to(new_x, new_y) and not world.get_location_at(new_x, new_y):
-            self.x = new_x
-            self.y = new_y
+            world.move_location(self, new_x, new_y)
+            if (new_x, new_y) == self.goal:
+                self.goal = None
             self.last_wander_time = current_time
             # Add some randomness to next interval
             self.wander_interval_offset = random.uniform(-1, 1)  # Reduced randomness
             return True
 
-        return False
\ No newline at end of file
+        return False
+
+    def _next_cell(self, world) -> Tuple[int, int]:
+        """A step toward the goal, or in a random direction without one"""
+        if self.goal is not None:
+            step = world.pathfinder.next_step((self.x, self.y), self.goal)
+            if step is not None:
+                return step
+            # Already there or out of reach, wander from here on
+            self.goal = None
+
+        # Choose a random direction
+        directions = [(0, 1), (0, -1), (1, 0), (-1, 0)]
+        dx, dy = random.choice(directions)
+        return self.x + dx, self.y + dy
@@ -0,0 +1,71 @@
+"""
+Process-wide registry of compiled NPC templates
+"""
+from collections import OrderedDict
+from typing import Dict, List, Optional
+import glob
+import logging
+import os
+import threading
+import yaml
+from npc import NPCTemplate
+
+logger = logging.getLogger(__name__)
+
+class NPCRegistry:
+    """Parses every NPC definition once and hands out templates to all worlds"""
+    def __init__(self, npc_dir: str, max_dynamic: int = 1024):
+        self.npc_dir = npc_dir
+        self.max_dynamic = max_dynamic
+        self._static: Optional[List[NPCTemplate]] = None
+        self._dynamic: 'OrderedDict[str, NPCTemplate]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def static_templates(self) -> List[NPCTemplate]:
+        """Templates for the NPCs in the npcs directory, loaded on first use"""
+        if self._static is None:
+            with self._lock:
+                if self._static is None:
+                    self._static = self._load_static()
+        return self._static
+
+    def static_template(self, template_id: str) -> Optional[NPCTemplate]:
+        """Template for a static NPC by its file name"""
+        return next((t for t in self.static_templates() if t.id == template_id), None)
+
+    def _load_static(self) -> List[NPCTemplate]:
+        templates = []
+        for npc_file in glob.glob(os.path.join(self.npc_dir, '*.yaml')):
+            try:
+                with open(npc_file, 'r') as f:
+                    data = yaml.safe_load(f)
+                templates.append(NPCTemplate(os.path.basename(npc_file), data))
+            except Exception as e:
+                logger.error(f"Error loading static NPC from {npc_file}: {str(e)}")
+                continue
+        logger.debug(f"Compiled {len(templates)} static NPC templates")
+        return templates
+
+    def dynamic_template(self, npc_id: str, data: dict) -> NPCTemplate:
+        """Template for a generated NPC, compiled again only if its data changed"""
+        with self._lock:
+            template = self._dynamic.get(npc_id)
+            if template is not None and template.data == data:
+                self._dynamic.move_to_end(npc_id)
+                return template
+
+        template = NPCTemplate(npc_id, data)
+        with self._lock:
+            self._dynamic[npc_id] = template
+            self._dynamic.move_to_end(npc_id)
+            while len(self._dynamic) > self.max_dynamic:
+                self._dynamic.popitem(last=False)
+        return template
+
+    def invalidate(self) -> None:
+        """Drop all compiled templates so they are re-read on next use"""
+        with self._lock:
+            self._static = None
+            self._dynamic.clear()
+
+registry = NPCRegistry(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs'))
@@ -0,0 +1,98 @@
+"""
+Best-effort parsing of JSON documents that are still streaming in
+"""
+from typing import Any, List, Optional
+import json
+
+# What an open container expects next
+_KEY = 'key'
+_COLON = 'colon'
+_VALUE = 'value'
+_COMMA = 'comma'
+
+class _Container:
+    __slots__ = ('closer', 'state', 'last_complete')
+
+    def __init__(self, closer: str, state: str, last_complete: int):
+        self.closer = closer
+        self.state = state
+        self.last_complete = last_complete  # End of the last whole member
+
+def parse_partial_json(text: str) -> Optional[Any]:
+    """Parse the complete part of a JSON prefix.
+
+    A string value that is still arriving is kept as far as it goes. Any
+    other unfinished member, such as a key without its value or a number
+    that may have more digits coming, is dropped. Open arrays and objects
+    are closed. Returns None when nothing usable has arrived yet.
+    """
+    stack: List[_Container] = []
+    in_string = False
+    string_is_key = False
+    escaped = False
+    in_scalar = False  # Inside a number, true, false or null
+
+    def value_done(end: int) -> None:
+        if stack:
+            stack[-1].state = _COMMA
+            stack[-1].last_complete = end
+
+    for i, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+                if string_is_key:
+                    stack[-1].state = _COLON
+                else:
+                    value_done(i + 1)
+            continue
+        if in_scalar and (char in ',}]' or char.isspace()):
+            in_scalar = False
+            value_done(i)
+        if char == '"':
+            in_string = True
+            string_is_key = bool(stack) and stack[-1].closer == '}' and stack[-1].state == _KEY
+        elif char == '{':
+            stack.append(_Container('}', _KEY, i + 1))
+        elif char == '[':
+            stack.append(_Container(']', _VALUE, i + 1))
+        elif char in '}]':
+            if stack:
+                stack.pop()
+            value_done(i + 1)
+        elif char == ':':
+            if stack:
+                stack[-1].state = _VALUE
+        elif char == ',':
+            if stack:
+                stack[-1].state = _KEY if stack[-1].closer == '}' else _VALUE
+        elif not char.isspace():
+            in_scalar = True
+
+    if not stack:
+        try:
+            return json.loads(text)
+        except ValueError:
+            return None
+
+    top = stack[-1]
+    if in_string and not string_is_key:
+        # Keep the partial string, minus an escape sequence cut in half
+        body = text[:-1] if escaped else text
+        unicode_start = body.rfind('\\u')
+        if unicode_start != -1 and len(body) - unicode_start < 6:
+            body = body[:unicode_start]
+        body += '"'
+    elif top.state != _COMMA:
+        body = text[:top.last_complete]
+    else:
+        body = text
+
+    try:
+        return json.loads(body + ''.join(container.closer for container in reversed(stack)))
+    except ValueError:
+        return None
@@ -0,0 +1,181 @@
+"""
+Shortest paths over the shared walkability grid
+"""
+from array import array
+from collections import OrderedDict, deque
+from functools import lru_cache
+from typing import Callable, Iterable, List, Optional, Tuple
+import heapq
+import threading
+from walkability import WalkabilityGrid
+
+Cell = Tuple[int, int]
+
+# Distance fields kept per grid, each one is four bytes per map cell
+MAX_DISTANCE_FIELDS = 64
+
+class Pathfinder:
+    """Shortest 4-connected paths on one walkability grid.
+
+    Breadth first distance fields to frequently used targets, such as the
+    spawn point and shops, are cached. With a field, the next step toward
+    its target or a whole path to it is a walk down the distances. Other
+    queries run A* with the Manhattan distance. Queries between different
+    regions of the grid fail immediately.
+
+    Paths only consider the grid. Callers that must avoid other entities
+    pass ``blocked``.
+    """
+    def __init__(self, grid: WalkabilityGrid, max_fields: int = MAX_DISTANCE_FIELDS):
+        self.grid = grid
+        self.max_fields = max_fields
+        self._fields: 'OrderedDict[int, array]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _index(self, cell: Cell) -> int:
+        """Flat index of a walkable cell, or -1"""
+        grid = self.grid
+        img_x = grid.center_x + cell[0]
+        img_y = grid.center_y + cell[1]
+        if 0 <= img_x < grid.width and 0 <= img_y < grid.height:
+            index = img_y * grid.width + img_x
+            if grid.cells[index]:
+                return index
+        return -1
+
+    def _cell(self, index: int) -> Cell:
+        grid = self.grid
+        return (index % grid.width - grid.center_x, index // grid.width - grid.center_y)
+
+    def _neighbors(self, index: int) -> List[int]:
+        grid = self.grid
+        width, cells = grid.width, grid.cells
+        x = index % width
+        neighbors = []
+        if index >= width and cells[index - width]:
+            neighbors.append(index - width)
+        if index < width * (grid.height - 1) and cells[index + width]:
+            neighbors.append(index + width)
+        if x > 0 and cells[index - 1]:
+            neighbors.append(index - 1)
+        if x < width - 1 and cells[index + 1]:
+            neighbors.append(index + 1)
+        return neighbors
+
+    def distance_field(self, target: Cell) -> Optional[array]:
+        """Steps from every cell to target, -1 where it cannot be reached"""
+        goal = self._index(target)
+        if goal < 0:
+            return None
+        with self._lock:
+            field = self._fields.get(goal)
+            if field is not None:
+                self._fields.move_to_end(goal)
+                return field
+
+        field = array('i', [-1]) * (self.grid.width * self.grid.height)
+        field[goal] = 0
+        pending = deque([goal])
+        while pending:
+            index = pending.popleft()
+            distance = field[index] + 1
+            for neighbor in self._neighbors(index):
+                if field[neighbor] < 0:
+                    field[neighbor] = distance
+                    pending.append(neighbor)
+
+        with self._lock:
+            self._fields[goal] = field
+            while len(self._fields) > self.max_fields:
+                self._fields.popitem(last=False)
+        return field
+
+    def warm(self, targets: Iterable[Cell]) -> None:
+        """Compute the distance fields of targets ahead of their first query"""
+        for target in targets:
+            self.distance_field(target)
+
+    def has_field(self, target: Cell) -> bool:
+        with self._lock:
+            return self._index(target) in self._fields
+
+    def distance(self, start: Cell, goal: Cell) -> Optional[int]:
+        """Number of steps on the shortest path, or None without a path"""
+        if not self._connected(start, goal):
+            return None
+        return self.distance_field(goal)[self._index(start)]
+
+    def next_step(self, start: Cell, goal: Cell) -> Optional[Cell]:
+        """First cell on a shortest path from start to goal, None at the goal or without a path"""
+        if start == goal or not self._connected(start, goal):
+            return None
+        field = self.distance_field(goal)
+        index = self._index(start)
+        return self._cell(self._downhill(field, index))
+
+    def find_path(self, start: Cell, goal: Cell,
+                  blocked: Optional[Callable[[int, int], bool]] = None) -> Optional[List[Cell]]:
+        """Cells from the one after start up to goal, [] at the goal, None without a path"""
+        if start == goal:
+            return [] if self._index(goal) >= 0 else None
+        if not self._connected(start, goal):
+            return None
+        if blocked is None and self.has_field(goal):
+            return self._follow_field(self.distance_field(goal), self._index(start))
+        return self._astar(self._index(start), self._index(goal), blocked)
+
+    def _connected(self, start: Cell, goal: Cell) -> bool:
+        region = self.grid.region_at(*start)
+        return region != 0 and region == self.grid.region_at(*goal)
+
+    def _downhill(self, field: array, index: int) -> int:
+        distance = field[index]
+        return next(n for n in self._neighbors(index) if field[n] == distance - 1)
+
+    def _follow_field(self, field: array, index: int) -> List[Cell]:
+        path = []
+        while field[index] > 0:
+            index = self._downhill(field, index)
+            path.append(self._cell(index))
+        return path
+
+    def _astar(self, start: int, goal: int,
+               blocked: Optional[Callable[[int, int], bool]]) -> Optional[List[Cell]]:
+        width = self.grid.width
+        goal_x, goal_y = goal % width, goal // width
+
+        def heuristic(index: int) -> int:
+            return abs(index % width - goal_x) + abs(index // width - goal_y)
+
+        came_from = {start: -1}
+        cost = {start: 0}
+        frontier = [(heuristic(start), 0, start)]
+        while frontier:
+            _, steps, index = heapq.heappop(frontier)
+            if index == goal:
+                break
+            if steps > cost[index]:
+                continue
+            for neighbor in self._neighbors(index):
+                if cost.get(neighbor, steps + 2) <= steps + 1:
+                    continue
+                if blocked is not None and neighbor != goal and blocked(*self._cell(neighbor)):
+                    continue
+                cost[neighbor] = steps + 1
+                came_from[neighbor] = index
+                heapq.heappush(frontier, (steps + 1 + heuristic(neighbor), steps + 1, neighbor))
+        else:
+            return None
+
+        path = []
+        index = goal
+        while index != start:
+            path.append(self._cell(index))
+            index = came_from[index]
+        path.reverse()
+        return path
+
+@lru_cache(maxsize=8)
+def pathfinder_for(grid: WalkabilityGrid) -> Pathfinder:
+    """The pathfinder shared by every world on a grid"""
+    return Pathfinder(grid)
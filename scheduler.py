@@ -0,0 +1,67 @@
+"""
+Priority queue scheduling NPC wandering by next due time
+"""
+from typing import Dict, Iterable, List, Optional
+import heapq
+import itertools
+
+class WanderScheduler:
+    """Min-heap of NPCs keyed on the time they are next allowed to wander.
+
+    Removed or rescheduled NPCs leave stale heap entries behind, which are
+    skipped lazily when they reach the top.
+    """
+    def __init__(self):
+        self._heap: List[list] = []
+        self._entries: Dict[int, list] = {}
+        self._counter = itertools.count()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, npc) -> bool:
+        return id(npc) in self._entries
+
+    def schedule(self, npc, due_time: Optional[float] = None) -> None:
+        """Add or move an NPC, due at its next wander time unless given"""
+        self.unschedule(npc)
+        if due_time is None:
+            due_time = npc.next_wander_time
+        entry = [due_time, next(self._counter), npc]
+        self._entries[id(npc)] = entry
+        heapq.heappush(self._heap, entry)
+
+    def unschedule(self, npc) -> None:
+        """Remove an NPC from the schedule"""
+        entry = self._entries.pop(id(npc), None)
+        if entry is not None:
+            entry[2] = None
+
+    def pop_due(self, current_time: float) -> List:
+        """Remove and return every NPC due at or before current_time"""
+        due = []
+        while self._heap and self._heap[0][0] <= current_time:
+            _, _, npc = heapq.heappop(self._heap)
+            if npc is not None:
+                del self._entries[id(npc)]
+                due.append(npc)
+        return due
+
+    def moved(self, npc) -> None:
+        """Positions are read from the NPCs when they wander, nothing to update"""
+
+    def next_due_time(self) -> Optional[float]:
+        """Time the earliest scheduled NPC becomes due"""
+        while self._heap and self._heap[0][2] is None:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def rebuild(self, npcs: Iterable) -> None:
+        """Reschedule the given NPCs from their current wander times"""
+        self.clear()
+        for npc in npcs:
+            self.schedule(npc)
+
+    def clear(self) -> None:
+        self._heap.clear()
+        self._entries.clear()
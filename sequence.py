@@ -1,8 +1,9 @@
 """
-Sequence class for handling NPC conversations using a linked list structure
+Sequence class for handling NPC conversations on top of compiled dialogue graphs
 """
 from dataclasses import dataclass
-from typing import Dict, List, Union, Optional
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Tuple, Union, Optional
 from character_generator import create_sequence
 import yaml
 from character import Character
@@ -11,47 +12,191 @@ from nodes import Node, EndNode, TalkNode, GiveNode, AskNode, ChoiceNode, Genera
 
 logger = logging.getLogger(__name__)
 
-class Sequence:
+def build_node_chain(sequence_data: List[dict]) -> Optional[Node]:
+    """Build a chain of nodes from sequence data and return the head"""
+    if not sequence_data:
+        return None
+
+    # Create the first node
+    head = NodeFactory.create_node(sequence_data[0])
+    current = head
+
+    # Create and link the rest of the nodes
+    for action in sequence_data[1:]:
+        next_node = NodeFactory.create_node(action)
+        current.next = next_node
+        current = next_node
+
+    # Always append an EndNode as the last node
+    end_node = EndNode()
+    current.next = end_node
+    logger.debug("Added EndNode as the final node in sequence")
+
+    return head
+
+def enumerate_nodes(head: Optional[Node]) -> List[Node]:
+    """List every node reachable from head in a stable order.
+
+    The main chain comes first, then choice branches depth first. Following
+    next before branches keeps the order the same whether or not a branch
+    has already been linked back into the main chain.
+    """
+    nodes: List[Node] = []
+    seen = set()
+    pending = [head] if head else []
+    while pending:
+        node = pending.pop()
+        chain_choices = []
+        while node is not None and id(node) not in seen:
+            seen.add(id(node))
+            nodes.append(node)
+            if isinstance(node, ChoiceNode):
+                chain_choices.append(node)
+            node = node.next
+        for choice_node in reversed(chain_choices):
+            pending.extend(reversed(list(choice_node.choices.values())))
+    return nodes
+
+def link_branch(choice_node: ChoiceNode, branch: Node) -> None:
+    """Point a choice branch's tail at the node after its choice.
+
+    Node chains are shared between NPC instances, so the branch may already
+    be linked. Stopping at the continuation keeps this from looping the
+    main chain back onto itself.
+    """
+    tail = branch
+    while tail.next is not None and tail.next is not choice_node.next:
+        tail = tail.next
+    tail.next = choice_node.next
+
+def link_choice_branches(head: Optional[Node]) -> None:
+    """Link every choice branch reachable from head back into its chain.
+
+    Done once when a graph is compiled, so picking a branch later is just
+    a move of the cursor.
+    """
+    for node in enumerate_nodes(head):
+        if isinstance(node, ChoiceNode):
+            for branch in node.choices.values():
+                link_branch(node, branch)
+
+_NO_CHOICES: Mapping[str, int] = MappingProxyType({})
+
+class DialogueGraph:
+    """Dialogue compiled once into index-addressed nodes.
+
+    Choice branches are linked back into their chain at compile time, and
+    every transition is precomputed as a node index. Nothing changes the
+    graph after that, so any number of NPC instances and sessions share it
+    while each keeps only a cursor into it.
+    """
+    __slots__ = ('_indexes', 'nodes', 'next_index', 'choice_index')
+
     def __init__(self, sequence_data: List[dict]):
-        self.head: Optional[Node] = None
-        self.current_node: Optional[Node] = None
+        head = build_node_chain(sequence_data)
+        link_choice_branches(head)
+        self._compile(enumerate_nodes(head))
+
+    def _compile(self, nodes: List[Node]) -> None:
+        self._indexes: Dict[int, int] = {id(node): i for i, node in enumerate(nodes)}
+        self.nodes: Tuple[Node, ...] = tuple(nodes)
+        self.next_index: Tuple[int, ...] = tuple(self.index_of(node.next) for node in nodes)
+        self.choice_index: Tuple[Mapping[str, int], ...] = tuple(
+            MappingProxyType({text: self.index_of(branch) for text, branch in node.choices.items()})
+            if isinstance(node, ChoiceNode) else _NO_CHOICES
+            for node in nodes)
+
+    def __getstate__(self) -> Dict:
+        """Only the nodes are pickled, the indexes are keyed on object ids"""
+        return {'nodes': self.nodes}
+
+    def __setstate__(self, state: Dict) -> None:
+        self._compile(list(state['nodes']))
+
+    @property
+    def head(self) -> Optional[Node]:
+        return self.nodes[0] if self.nodes else None
+
+    def index_of(self, node: Optional[Node]) -> int:
+        """Index of a node in this graph, or -1"""
+        if node is None:
+            return -1
+        return self._indexes.get(id(node), -1)
+
+    def after_choice(self, index: int, choice_text: str) -> int:
+        """Index reached by picking choice_text at the choice node at index"""
+        return self.choice_index[index].get(choice_text, self.next_index[index])
+
+class Sequence:
+    """One conversation's cursor into a shared dialogue graph.
+
+    The cursor is the node index, whether it points into the generated
+    graph, the player's responses and the history. Everything else is
+    shared with every other conversation on the same graph.
+    """
+    __slots__ = ('graph', 'position', 'in_generated', 'waiting_for_response', 'responses',
+                 'history', 'generated', 'generated_graph', 'stream_text', 'output')
+
+    def __init__(self, sequence_data: List[dict], graph: Optional[DialogueGraph] = None):
+        self.graph = graph if graph is not None else DialogueGraph(sequence_data)
+        self.position = 0 if self.graph.nodes else -1  # Index of the current node, -1 when done
+        self.in_generated = False  # Whether position is in generated_graph
         self.waiting_for_response = False
         self.responses = {}  # Store player responses
         self.history = []  # Store conversation history
-        self._build_sequence(sequence_data)
-    
-    def _build_sequence(self, sequence_data: List[dict]) -> None:
-        """Build the linked list sequence from sequence data"""
-        if not sequence_data:
-            return
+        self.generated: Optional[List[dict]] = None  # Data of the last generated node chain
+        self.generated_graph: Optional[DialogueGraph] = None  # That chain, compiled
+        self.stream_text = None  # Receives generated talk lines as they stream in, never stored
+        self.output: Optional[List[str]] = None  # Lines said during the current interaction, never stored
 
-        self.head = self._build_node_chain(sequence_data)
-        self.current_node = self.head
+    @property
+    def head(self) -> Optional[Node]:
+        return self.graph.head
 
-    def _build_node_chain(self, sequence_data: List[dict]) -> Optional[Node]:
-        """Build a chain of nodes from sequence data and return the head"""
-        if not sequence_data:
+    @property
+    def active_graph(self) -> DialogueGraph:
+        """The graph the cursor points into"""
+        return self.generated_graph if self.in_generated else self.graph
+
+    @property
+    def current_node(self) -> Optional[Node]:
+        if self.position < 0:
             return None
+        return self.active_graph.nodes[self.position]
 
-        # Create the first node
-        head = NodeFactory.create_node(sequence_data[0])
-        current = head
+    @current_node.setter
+    def current_node(self, node: Optional[Node]) -> None:
+        if node is None:
+            self.position = -1
+            return
+        index = self.active_graph.index_of(node)
+        if index < 0:
+            # Moving between the shared graph and the generated one
+            other = self.graph if self.in_generated else self.generated_graph
+            index = other.index_of(node) if other is not None else -1
+            if index < 0:
+                raise ValueError(f"{node.__class__.__name__} is not part of this conversation")
+            self.in_generated = not self.in_generated
+        self.position = index
 
-        # Create and link the rest of the nodes
-        for action in sequence_data[1:]:
-            next_node = NodeFactory.create_node(action)
-            current.next = next_node
-            current = next_node
+    def use_generated(self, sequence_data: List[dict]) -> Optional[Node]:
+        """Compile a generated chain for this conversation and return its head"""
+        self.generated = sequence_data
+        self.generated_graph = DialogueGraph(sequence_data)
+        return self.generated_graph.head
 
-        # Always append an EndNode as the last node
-        end_node = EndNode()
-        current.next = end_node
-        logger.debug("Added EndNode as the final node in sequence")
+    def interact(self, npc: Character, character: Character, output: Optional[List[str]] = None) -> None:
+        """Handle interaction between an NPC and a character.
 
-        return head
+        Lines the NPC says are appended to output, or printed without one.
+        """
+        self.output = output
+        try:
+            self._interact(npc, character)
+        finally:
+            self.output = None
 
-    def interact(self, npc: Character, character: Character) -> None:
-        """Handle interaction between an NPC and a character"""
+    def _interact(self, npc: Character, character: Character) -> None:
         if not self.current_node:
             logger.debug("No current node, ending conversation")
             npc.is_talking = False
@@ -64,6 +209,10 @@ class Sequence:
         if next_node is not None:  # None means waiting for response
             logger.debug(f"Setting current node to: {next_node.__class__.__name__ if next_node else None}")
             self.current_node = next_node
+        elif self.waiting_for_response:
+            # Start on generated replies while the player reads the question
+            from speculation import speculate
+            speculate(self)
 
     def provide_response(self, response: str) -> None:
         """Handle a response from the player"""
@@ -73,22 +222,15 @@ class Sequence:
         self.history.append({"role": "player", "text": response})
         self.waiting_for_response = False
 
-        if isinstance(self.current_node, AskNode):
-            if self.current_node.user_input:
-                self.responses[self.current_node.user_input] = response
-            self.current_node = self.current_node.next
-        elif isinstance(self.current_node, ChoiceNode):
-            chosen_node = self.current_node.choices.get(response)
-            if chosen_node:
-                # Set the chosen node's sequence to continue to the next node in the main sequence
-                current = chosen_node
-                while current.next:
-                    current = current.next
-                current.next = self.current_node.next
-                self.current_node = chosen_node
-            else:
-                # If choice not found, continue with next node
-                self.current_node = self.current_node.next
+        node = self.current_node
+        graph = self.active_graph
+        if isinstance(node, AskNode):
+            if node.user_input:
+                self.responses[node.user_input] = response
+            self.position = graph.next_index[self.position]
+        elif isinstance(node, ChoiceNode):
+            # The chosen branch, or the next node if the choice has none
+            self.position = graph.after_choice(self.position, response)
 
     def format_text(self, text: str) -> str:
         """Format text with stored responses"""
@@ -101,12 +243,20 @@ class Sequence:
 
     def reset(self) -> None:
         """Reset the sequence to its initial state"""
-        self.current_node = self.head
+        self.position = 0 if self.graph.nodes else -1
+        self.in_generated = False
         self.responses = {}
         self.waiting_for_response = False
         self.history = []
+        self.generated = None
+        self.generated_graph = None
 
     @classmethod
     def from_yaml(cls, sequence_data: List[dict]) -> 'Sequence':
         """Create a sequence from YAML data"""
-        return cls(sequence_data) 
\ No newline at end of file
+        return cls(sequence_data)
+
+    @classmethod
+    def from_graph(cls, graph: DialogueGraph) -> 'Sequence':
+        """Create a sequence with its own cursor on a shared dialogue graph"""
+        return cls([], graph=graph)
@@ -38,6 +38,7 @@ SEQUENCE_FUNCTIONS = [
                                     },
                                     "quantity": {
                                         "type": "integer",
+                                        "minimum": 1,
                                         "description": "Amount of the item to give. Defaults to 1 if not specified",
                                         "default": 1
                                     }
@@ -58,6 +59,7 @@ SEQUENCE_FUNCTIONS = [
                                             },
                                             "quantity": {
                                                 "type": "integer",
+                                                "minimum": 1,
                                                 "description": "Amount of the item wanted",
                                                 "default": 1
                                             }
@@ -74,6 +76,7 @@ SEQUENCE_FUNCTIONS = [
                                             },
                                             "quantity": {
                                                 "type": "integer",
+                                                "minimum": 1,
                                                 "description": "Amount of the item offered",
                                                 "default": 1
                                             }
@@ -120,6 +123,7 @@ SEQUENCE_FUNCTIONS = [
                                                 },
                                                 "quantity": {
                                                     "type": "integer",
+                                                    "minimum": 1,
                                                     "description": "Amount of the item to give",
                                                     "default": 1
                                                 }
@@ -0,0 +1,322 @@
+"""
+Session storage for per-player game worlds
+"""
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+import pickle
+import sqlite3
+import threading
+import time
+import weakref
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class SessionEntry:
+    """A session's world, its message log and when it was last used"""
+    world: Any
+    messages: List[str] = field(default_factory=list)
+    last_access: float = 0.0
+
+class SessionBackend(ABC):
+    """Where session worlds live between requests.
+
+    Request handlers call ``get_or_create`` when a request starts and
+    ``save`` when it ends. Backends that keep worlds in this process hand out
+    the live objects and set ``shares_worlds``. Out-of-process backends hand
+    out a private copy that only becomes visible to other workers once saved.
+    """
+    shares_worlds = False
+
+    @abstractmethod
+    def get_or_create(self, session_id: str) -> Tuple[Any, List[str]]:
+        """Return the world and messages for a session, creating them if needed"""
+
+    @abstractmethod
+    def save(self, session_id: str, world: Any, messages: List[str],
+             only_if_unchanged: bool = False) -> bool:
+        """Store a session's world.
+
+        With only_if_unchanged the save is skipped, returning False, when
+        someone else saved the session after this world was loaded.
+        """
+
+    @abstractmethod
+    def discard(self, session_id: str) -> bool:
+        """Drop a session, returning whether it existed"""
+
+    @abstractmethod
+    def evict_idle(self) -> int:
+        """Drop every session idle for longer than the timeout"""
+
+    @abstractmethod
+    def stats(self) -> Dict[str, int]:
+        """Counters for resident worlds and evictions"""
+
+class SessionStore(SessionBackend):
+    """In-memory worlds keyed by session id with idle expiry and LRU eviction.
+
+    Entries are kept in least recently used order. Idle entries are swept
+    at most once per ``sweep_interval`` seconds on access, and creating an
+    entry beyond ``max_sessions`` evicts the least recently used one.
+    """
+    shares_worlds = True
+
+    def __init__(self, world_factory: Callable[[], Any], max_sessions: int = 500,
+                 idle_timeout: float = 1800.0, sweep_interval: float = 60.0,
+                 clock: Callable[[], float] = time.monotonic):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.world_factory = world_factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._entries: 'OrderedDict[str, SessionEntry]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._last_sweep = clock()
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.discarded = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._entries
+
+    def get(self, session_id: str) -> Optional[SessionEntry]:
+        """Return a live entry and mark it as used, or None"""
+        now = self.clock()
+        with self._lock:
+            self._maybe_sweep(now)
+            entry = self._entries.get(session_id)
+            if entry is None:
+                return None
+            if now - entry.last_access > self.idle_timeout:
+                del self._entries[session_id]
+                self.evicted_idle += 1
+                return None
+            entry.last_access = now
+            self._entries.move_to_end(session_id)
+            return entry
+
+    def get_or_create(self, session_id: str) -> Tuple[Any, List[str]]:
+        """Return the world and messages for a session, creating them if needed"""
+        entry = self.get(session_id)
+        if entry is None:
+            # Build the world outside the lock, other sessions need not wait on it
+            world = self.world_factory()
+            with self._lock:
+                entry = self._entries.get(session_id)
+                if entry is None:
+                    entry = SessionEntry(world, [], self.clock())
+                    self._entries[session_id] = entry
+                    self.created += 1
+                    self._evict_overflow()
+        return entry.world, entry.messages
+
+    def save(self, session_id: str, world: Any, messages: List[str],
+             only_if_unchanged: bool = False) -> bool:
+        # The live objects were handed out, there is nothing to write back
+        return True
+
+    def discard(self, session_id: str) -> bool:
+        """Drop a session, returning whether it existed"""
+        with self._lock:
+            if self._entries.pop(session_id, None) is None:
+                return False
+            self.discarded += 1
+            return True
+
+    def evict_idle(self) -> int:
+        """Drop every session idle for longer than the timeout"""
+        with self._lock:
+            return self._sweep(self.clock())
+
+    def stats(self) -> Dict[str, int]:
+        """Counters for resident worlds and evictions"""
+        return {
+            'resident': len(self._entries),
+            'created': self.created,
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru,
+            'discarded': self.discarded,
+        }
+
+    def _maybe_sweep(self, now: float) -> None:
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+    def _sweep(self, now: float) -> int:
+        self._last_sweep = now
+        expired = [session_id for session_id, entry in self._entries.items()
+                   if now - entry.last_access > self.idle_timeout]
+        for session_id in expired:
+            del self._entries[session_id]
+        self.evicted_idle += len(expired)
+        if expired:
+            logger.debug(f"Evicted {len(expired)} idle sessions, {len(self._entries)} resident")
+        return len(expired)
+
+    def _evict_overflow(self) -> None:
+        while len(self._entries) > self.max_sessions:
+            session_id, _ = self._entries.popitem(last=False)
+            self.evicted_lru += 1
+            logger.debug(f"Evicted least recently used session {session_id}")
+
+class SQLiteSessionStore(SessionBackend):
+    """Worlds stored in a local SQLite database shared by worker processes.
+
+    Worlds are pickled unless ``encode`` and ``decode`` functions are given.
+
+    Each row carries a revision that is bumped on every save, so a caller
+    can refuse to overwrite a session someone else saved in the meantime.
+    Plain saves are last writer wins. Eviction counters are per process,
+    the resident count comes from the database.
+    """
+    def __init__(self, path: str, world_factory: Callable[[], Any], max_sessions: int = 500,
+                 idle_timeout: float = 1800.0, sweep_interval: float = 60.0,
+                 clock: Callable[[], float] = time.time,
+                 encode: Optional[Callable[[Any, List[str]], bytes]] = None,
+                 decode: Optional[Callable[[bytes], Tuple[Any, List[str]]]] = None):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1")
+        self.path = path
+        self.world_factory = world_factory
+        self.encode = encode or self._pickle_encode
+        self.decode = decode or self._pickle_decode
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        self.sweep_interval = sweep_interval
+        self.clock = clock
+        self._local = threading.local()
+        self._revisions: 'weakref.WeakKeyDictionary[Any, int]' = weakref.WeakKeyDictionary()
+        self._last_sweep = clock()
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+        self.discarded = 0
+        self._connection().execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            " session_id TEXT PRIMARY KEY,"
+            " data BLOB NOT NULL,"
+            " revision INTEGER NOT NULL,"
+            " last_access REAL NOT NULL)")
+        self._connection().execute(
+            "CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions (last_access)")
+
+    def _connection(self) -> sqlite3.Connection:
+        """One autocommit connection per thread"""
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @staticmethod
+    def _pickle_encode(world: Any, messages: List[str]) -> bytes:
+        return pickle.dumps((world, messages), protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def _pickle_decode(data: bytes) -> Tuple[Any, List[str]]:
+        return pickle.loads(data)
+
+    def get_or_create(self, session_id: str) -> Tuple[Any, List[str]]:
+        now = self.clock()
+        connection = self._connection()
+        if now - self._last_sweep >= self.sweep_interval:
+            self._sweep(now)
+
+        row = connection.execute(
+            "SELECT data, revision, last_access FROM sessions WHERE session_id = ?",
+            (session_id,)).fetchone()
+        if row is not None and now - row[2] <= self.idle_timeout:
+            try:
+                world, messages = self.decode(row[0])
+                connection.execute("UPDATE sessions SET last_access = ? WHERE session_id = ?",
+                                   (now, session_id))
+                self._revisions[world] = row[1]
+                return world, messages
+            except Exception as e:
+                logger.error(f"Could not restore session {session_id}: {str(e)}")
+        elif row is not None:
+            connection.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+            self.evicted_idle += 1
+
+        world = self.world_factory()
+        self._revisions[world] = 0
+        self.created += 1
+        return world, []
+
+    def save(self, session_id: str, world: Any, messages: List[str],
+             only_if_unchanged: bool = False) -> bool:
+        data = self.encode(world, messages)
+        now = self.clock()
+        revision = self._revisions.get(world, 0)
+        connection = self._connection()
+        if only_if_unchanged:
+            if revision == 0:
+                cursor = connection.execute(
+                    "INSERT OR IGNORE INTO sessions (session_id, data, revision, last_access)"
+                    " VALUES (?, ?, 1, ?)", (session_id, data, now))
+            else:
+                cursor = connection.execute(
+                    "UPDATE sessions SET data = ?, revision = revision + 1, last_access = ?"
+                    " WHERE session_id = ? AND revision = ?", (data, now, session_id, revision))
+            if cursor.rowcount != 1:
+                return False
+            self._revisions[world] = revision + 1
+        else:
+            connection.execute(
+                "INSERT INTO sessions (session_id, data, revision, last_access) VALUES (?, ?, 1, ?)"
+                " ON CONFLICT (session_id) DO UPDATE SET"
+                " data = excluded.data, revision = revision + 1, last_access = excluded.last_access",
+                (session_id, data, now))
+            row = connection.execute("SELECT revision FROM sessions WHERE session_id = ?",
+                                     (session_id,)).fetchone()
+            if row is not None:
+                self._revisions[world] = row[0]
+        if revision == 0:
+            self._evict_overflow()
+        return True
+
+    def discard(self, session_id: str) -> bool:
+        cursor = self._connection().execute("DELETE FROM sessions WHERE session_id = ?", (session_id,))
+        if cursor.rowcount:
+            self.discarded += 1
+            return True
+        return False
+
+    def evict_idle(self) -> int:
+        return self._sweep(self.clock())
+
+    def stats(self) -> Dict[str, int]:
+        resident = self._connection().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+        return {
+            'resident': resident,
+            'created': self.created,
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru,
+            'discarded': self.discarded,
+        }
+
+    def _sweep(self, now: float) -> int:
+        self._last_sweep = now
+        cursor = self._connection().execute("DELETE FROM sessions WHERE last_access < ?",
+                                            (now - self.idle_timeout,))
+        self.evicted_idle += cursor.rowcount
+        return cursor.rowcount
+
+    def _evict_overflow(self) -> None:
+        cursor = self._connection().execute(
+            "DELETE FROM sessions WHERE session_id IN ("
+            " SELECT session_id FROM sessions ORDER BY last_access DESC LIMIT -1 OFFSET ?)",
+            (self.max_sessions,))
+        self.evicted_lru += cursor.rowcount
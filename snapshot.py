@@ -0,0 +1,284 @@
+"""
+Compact binary snapshots of a World and its session messages
+
+Layout (all integers little endian):
+
+    magic 'AIPW' | u16 format version | world section | messages section
+
+Version 2 starts the world section with the NPC simulation mode. Version 1
+snapshots restore into the default mode.
+
+Strings are a u32 byte length followed by UTF-8. Free form values such as
+dynamic NPC data are stored as compact JSON strings. NPCs reference their
+template by id and their dialogue cursor by node index, so the shared
+dialogue graph itself is never copied into a snapshot.
+"""
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import json
+import struct
+from npc import NPC
+from npc_registry import registry
+from sequence import DialogueGraph
+from world import World, CHANGE_LOG_SIZE
+
+MAGIC = b'AIPW'
+FORMAT_VERSION = 2
+READABLE_VERSIONS = (1, 2)
+
+# Change log entries, npc moves are by far the most common
+CHANGE_NPC_MOVED = 1
+CHANGE_OTHER = 0
+
+# NPC flags
+FLAG_TALKING = 1
+FLAG_WAITING = 2
+FLAG_IN_GENERATED = 4
+FLAG_HAS_GENERATED = 8
+FLAG_HAS_GOAL = 16
+
+_HEADER = struct.Struct('<4sH')
+_U8 = struct.Struct('<B')
+_I32 = struct.Struct('<i')
+_U32 = struct.Struct('<I')
+_I64 = struct.Struct('<q')
+_F64 = struct.Struct('<d')
+_POSITION = struct.Struct('<ii')
+_NPC_STATE = struct.Struct('<iiBddi')
+_CHANGE_HEADER = struct.Struct('<IB')
+_CHANGE_MOVE = struct.Struct('<Iii')
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot cannot be written or read"""
+
+class _Writer:
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def pack(self, packer: struct.Struct, *values) -> None:
+        self.buffer += packer.pack(*values)
+
+    def string(self, value: str) -> None:
+        encoded = value.encode('utf-8')
+        self.buffer += _U32.pack(len(encoded))
+        self.buffer += encoded
+
+    def json(self, value: Any) -> None:
+        self.string(json.dumps(value, separators=(',', ':'), ensure_ascii=False))
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def unpack(self, packer: struct.Struct) -> tuple:
+        try:
+            values = packer.unpack_from(self.data, self.offset)
+        except struct.error as e:
+            raise SnapshotError(f"Truncated snapshot: {str(e)}")
+        self.offset += packer.size
+        return values
+
+    def u32(self) -> int:
+        return self.unpack(_U32)[0]
+
+    def string(self) -> str:
+        length = self.u32()
+        end = self.offset + length
+        if end > len(self.data):
+            raise SnapshotError("Truncated snapshot string")
+        value = str(self.data[self.offset:end], 'utf-8')
+        self.offset = end
+        return value
+
+    def json(self) -> Any:
+        return json.loads(self.string())
+
+def encode_world(world: World, messages: Optional[List[str]] = None) -> bytes:
+    """Serialize a world, and optionally its session messages, to bytes"""
+    writer = _Writer()
+    writer.pack(_HEADER, MAGIC, FORMAT_VERSION)
+
+    # World bookkeeping
+    writer.string(world.simulation)
+    writer.string(world.epoch)
+    writer.pack(_U32, world.version)
+    writer.pack(_U32, world.snapshot_version)
+    writer.pack(_F64, world.last_update_time)
+    writer.json(world.committed_player_state)
+
+    # Player and inventory
+    character = world.character
+    writer.pack(_POSITION, character.x, character.y)
+    writer.pack(_U32, len(character.inventory))
+    for item, amount in character.inventory.items():
+        writer.string(item)
+        writer.pack(_I64, amount)
+
+    # Dynamic NPC definitions and remembered positions
+    writer.json(world.dynamic_npcs)
+    writer.pack(_U32, len(world.npc_positions))
+    for npc_id, position in world.npc_positions.items():
+        writer.string(npc_id)
+        writer.pack(_POSITION, position['x'], position['y'])
+
+    # NPCs with their dialogue cursors
+    npcs = [loc for loc in world.locations if isinstance(loc, NPC)]
+    if len(npcs) != len(world.locations):
+        raise SnapshotError("Only NPC locations can be snapshotted")
+    npc_indexes = {id(npc): i for i, npc in enumerate(npcs)}
+    writer.pack(_U32, len(npcs))
+    for npc in npcs:
+        _write_npc(writer, npc)
+    interaction = npc_indexes.get(id(world.current_interaction), -1)
+    writer.pack(_I32, interaction)
+
+    # Change log, npc moves in binary and everything else as JSON. Changes up
+    # to the last reset are never served as deltas, so they are left out.
+    npc_ids = {npc.id: i for i, npc in enumerate(npcs)}
+    changes = [change for change in world.change_log
+               if change['version'] > world.snapshot_version]
+    writer.pack(_U32, len(changes))
+    for change in changes:
+        location = change.get('location') if change['type'] == 'npc_moved' else None
+        npc_index = npc_ids.get(location['id']) if location else None
+        if npc_index is not None:
+            writer.pack(_CHANGE_HEADER, change['version'], CHANGE_NPC_MOVED)
+            writer.pack(_CHANGE_MOVE, npc_index, location['x'], location['y'])
+        else:
+            writer.pack(_CHANGE_HEADER, change['version'], CHANGE_OTHER)
+            writer.json(change)
+
+    # Session messages
+    messages = messages or []
+    writer.pack(_U32, len(messages))
+    for message in messages:
+        writer.string(message)
+
+    return bytes(writer.buffer)
+
+def _write_npc(writer: _Writer, npc: NPC) -> None:
+    if npc.template is None or npc.id is None:
+        raise SnapshotError(f"NPC {npc.name} was not created from a template")
+    sequence = npc.sequence
+
+    flags = 0
+    if npc.is_talking:
+        flags |= FLAG_TALKING
+    if sequence.waiting_for_response:
+        flags |= FLAG_WAITING
+    if sequence.generated is not None:
+        flags |= FLAG_HAS_GENERATED
+    if sequence.in_generated:
+        flags |= FLAG_IN_GENERATED
+    if npc.goal is not None:
+        flags |= FLAG_HAS_GOAL
+    cursor = sequence.position
+
+    writer.string(npc.id)
+    writer.pack(_NPC_STATE, npc.x, npc.y, flags, npc.last_wander_time,
+                npc.wander_interval_offset, cursor)
+    writer.pack(_U32, len(sequence.responses))
+    for key, value in sequence.responses.items():
+        writer.string(key)
+        writer.string(value)
+    writer.pack(_U32, len(sequence.history))
+    for entry in sequence.history:
+        writer.pack(_U8, 1 if entry['role'] == 'npc' else 0)
+        writer.string(entry['text'])
+    if sequence.generated is not None:
+        writer.json(sequence.generated)
+    if npc.goal is not None:
+        writer.pack(_POSITION, *npc.goal)
+
+def decode_world(data: bytes) -> Tuple[World, List[str]]:
+    """Restore a world and its session messages from bytes"""
+    reader = _Reader(data)
+    magic, version = reader.unpack(_HEADER)
+    if magic != MAGIC:
+        raise SnapshotError("Not a world snapshot")
+    if version not in READABLE_VERSIONS:
+        raise SnapshotError(f"Unsupported snapshot format version {version}")
+
+    simulation = reader.string() if version >= 2 else None
+    world = World(load_npcs=False, simulation=simulation)
+    world.epoch = reader.string()
+    world.version = reader.u32()
+    world.snapshot_version = reader.u32()
+    world.last_update_time = reader.unpack(_F64)[0]
+    world.committed_player_state = reader.json()
+
+    world.character.x, world.character.y = reader.unpack(_POSITION)
+    inventory = {}
+    for _ in range(reader.u32()):
+        item = reader.string()
+        inventory[item] = reader.unpack(_I64)[0]
+    world.character.inventory = inventory
+
+    world.dynamic_npcs = reader.json()
+    dynamic_data = {f"dynamic_{npc['id']}": npc['data'] for npc in world.dynamic_npcs
+                    if isinstance(npc, dict) and 'id' in npc and 'data' in npc}
+    for _ in range(reader.u32()):
+        npc_id = reader.string()
+        x, y = reader.unpack(_POSITION)
+        world.npc_positions[npc_id] = {'x': x, 'y': y}
+
+    npcs = [_read_npc(reader, dynamic_data) for _ in range(reader.u32())]
+    for npc in npcs:
+        world.add_location(npc)
+    interaction = reader.unpack(_I32)[0]
+    world.current_interaction = npcs[interaction] if 0 <= interaction < len(npcs) else None
+
+    changes = deque(maxlen=CHANGE_LOG_SIZE)
+    for _ in range(reader.u32()):
+        change_version, kind = reader.unpack(_CHANGE_HEADER)
+        if kind == CHANGE_NPC_MOVED:
+            npc_index, x, y = reader.unpack(_CHANGE_MOVE)
+            location = world.location_payload(npcs[npc_index])
+            location['x'], location['y'] = x, y
+            changes.append({'type': 'npc_moved', 'location': location, 'version': change_version})
+        else:
+            changes.append(reader.json())
+    world.change_log = changes
+
+    messages = [reader.string() for _ in range(reader.u32())]
+    return world, messages
+
+def _read_npc(reader: _Reader, dynamic_data: Dict[str, dict]) -> NPC:
+    npc_id = reader.string()
+    if npc_id in dynamic_data:
+        template = registry.dynamic_template(npc_id, dynamic_data[npc_id])
+    else:
+        template = registry.static_template(npc_id)
+        if template is None:
+            raise SnapshotError(f"Unknown NPC template {npc_id}")
+
+    x, y, flags, last_wander_time, offset, cursor = reader.unpack(_NPC_STATE)
+    npc = template.instantiate()
+    npc.x, npc.y = x, y
+    npc.is_talking = bool(flags & FLAG_TALKING)
+    npc.last_wander_time = last_wander_time
+    npc.wander_interval_offset = offset
+
+    sequence = npc.sequence
+    sequence.waiting_for_response = bool(flags & FLAG_WAITING)
+    sequence.responses = {}
+    for _ in range(reader.u32()):
+        key = reader.string()
+        sequence.responses[key] = reader.string()
+    sequence.history = []
+    for _ in range(reader.u32()):
+        role = 'npc' if reader.unpack(_U8)[0] else 'player'
+        sequence.history.append({'role': role, 'text': reader.string()})
+    if flags & FLAG_HAS_GENERATED:
+        sequence.use_generated(reader.json())
+    # Snapshots written before goals existed have none
+    npc.goal = reader.unpack(_POSITION) if flags & FLAG_HAS_GOAL else None
+
+    sequence.in_generated = bool(flags & FLAG_IN_GENERATED)
+    if sequence.in_generated and sequence.generated_graph is None:
+        raise SnapshotError(f"Cursor of {npc_id} is in a generated dialogue it does not have")
+    if cursor >= len(sequence.active_graph.nodes):
+        raise SnapshotError(f"Cursor of {npc_id} is outside its dialogue")
+    sequence.position = max(cursor, -1)
+    return npc
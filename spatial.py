@@ -0,0 +1,152 @@
+"""
+Grid cell index for looking up world entities by position
+"""
+from typing import Any, Dict, Hashable, Iterable, List, Optional, Tuple
+import random
+
+Cell = Tuple[int, int]
+
+class FreeCellPool:
+    """A fixed set of cells, of which the free ones can be sampled in O(1).
+
+    Free cells are kept in a list with each cell's slot in a dict, so taking
+    a cell swaps it with the last one and pops it, and sampling is one
+    random pick with no retries.
+    """
+    def __init__(self, cells: Iterable[Cell], key: Hashable = None):
+        self.key = key  # What the cells were derived from, for the owner to compare
+        self._cells: List[Cell] = list(dict.fromkeys(cells))
+        self._slots: Dict[Cell, int] = {cell: i for i, cell in enumerate(self._cells)}
+        self._taken = set()
+
+    def __len__(self) -> int:
+        """Number of free cells"""
+        return len(self._cells)
+
+    def __contains__(self, cell: Cell) -> bool:
+        return cell in self._slots
+
+    def take(self, cell: Cell) -> None:
+        """Mark a cell as occupied, cells outside the pool are ignored"""
+        slot = self._slots.pop(cell, None)
+        if slot is None:
+            return
+        last = self._cells.pop()
+        if slot < len(self._cells):
+            self._cells[slot] = last
+            self._slots[last] = slot
+        self._taken.add(cell)
+
+    def release(self, cell: Cell) -> None:
+        """Mark a taken cell as free again"""
+        if cell in self._taken:
+            self._taken.discard(cell)
+            self._slots[cell] = len(self._cells)
+            self._cells.append(cell)
+
+    def release_all(self) -> None:
+        for cell in list(self._taken):
+            self.release(cell)
+
+    def sample(self, rng: random.Random = random) -> Optional[Cell]:
+        """A uniformly random free cell, or None when all are taken"""
+        if not self._cells:
+            return None
+        return self._cells[rng.randrange(len(self._cells))]
+
+class SpatialIndex:
+    """Incrementally maintained mapping from grid cells to their occupants.
+
+    Entities only need integer ``x`` and ``y`` attributes. Positions must be
+    changed through ``move`` so the index stays in sync.
+    """
+    def __init__(self):
+        self._cells: Dict[Cell, List[Any]] = {}
+        self._entity_cells: Dict[int, Cell] = {}
+        self.free_cells: Optional[FreeCellPool] = None
+
+    def __len__(self) -> int:
+        return len(self._entity_cells)
+
+    def __contains__(self, entity: Any) -> bool:
+        return id(entity) in self._entity_cells
+
+    def add(self, entity: Any) -> None:
+        """Index an entity at its current position"""
+        if id(entity) in self._entity_cells:
+            return
+        cell = (entity.x, entity.y)
+        occupants = self._cells.setdefault(cell, [])
+        occupants.append(entity)
+        self._entity_cells[id(entity)] = cell
+        if self.free_cells is not None and len(occupants) == 1:
+            self.free_cells.take(cell)
+
+    def remove(self, entity: Any) -> None:
+        """Stop indexing an entity"""
+        cell = self._entity_cells.pop(id(entity), None)
+        if cell is None:
+            return
+        occupants = self._cells[cell]
+        occupants.remove(entity)
+        if not occupants:
+            del self._cells[cell]
+            if self.free_cells is not None:
+                self.free_cells.release(cell)
+
+    def move(self, entity: Any, x: int, y: int) -> None:
+        """Move an entity to a new position and update the index"""
+        indexed = id(entity) in self._entity_cells
+        if indexed:
+            self.remove(entity)
+        entity.x = x
+        entity.y = y
+        if indexed:
+            self.add(entity)
+
+    def at(self, x: int, y: int) -> Optional[Any]:
+        """Return the first entity at a position, if any"""
+        occupants = self._cells.get((x, y))
+        return occupants[0] if occupants else None
+
+    def all_at(self, x: int, y: int) -> List[Any]:
+        """Return every entity at a position"""
+        return list(self._cells.get((x, y), ()))
+
+    def in_area(self, min_x: int, min_y: int, max_x: int, max_y: int) -> List[Any]:
+        """Every entity in a rectangle of cells, bounds included.
+
+        Small rectangles look up each of their cells and large ones scan the
+        occupied cells, so a query costs the smaller of the two.
+        """
+        width = max_x - min_x + 1
+        height = max_y - min_y + 1
+        if width <= 0 or height <= 0:
+            return []
+        if width * height <= len(self._cells):
+            return [entity
+                    for y in range(min_y, max_y + 1)
+                    for x in range(min_x, max_x + 1)
+                    for entity in self._cells.get((x, y), ())]
+        return [entity
+                for (x, y), occupants in self._cells.items()
+                if min_x <= x <= max_x and min_y <= y <= max_y
+                for entity in occupants]
+
+    def track_free_cells(self, pool: FreeCellPool) -> None:
+        """Keep a pool's free cells in step with the occupied cells from now on"""
+        self.free_cells = pool
+        for cell in self._cells:
+            pool.take(cell)
+
+    def rebuild(self, entities: Iterable[Any]) -> None:
+        """Replace the index contents with the given entities"""
+        self.clear()
+        for entity in entities:
+            self.add(entity)
+
+    def clear(self) -> None:
+        self._cells.clear()
+        self._entity_cells.clear()
+        if self.free_cells is not None:
+            self.free_cells.release_all()
@@ -0,0 +1,86 @@
+"""
+Speculative generation of dialogue the player is about to reach
+"""
+from typing import List
+import logging
+import os
+import threading
+from jobs import JobPool, JobQueueFull
+from nodes import ChoiceNode, GenerateNode, GiveNode, TalkNode
+
+logger = logging.getLogger(__name__)
+
+# Nodes followed past a choice while looking for a generate node
+MAX_LOOKAHEAD = 8
+
+ENABLED = os.getenv('SPECULATIVE_GENERATION', '1') != '0'
+
+# Speculation never takes slots from requested work, extra guesses are dropped
+speculation_jobs = JobPool(max_workers=int(os.getenv('SPECULATION_WORKERS', 2)),
+                           max_pending=int(os.getenv('SPECULATION_MAX_PENDING', 8)),
+                           max_finished=0)
+
+_inflight = set()
+_inflight_lock = threading.Lock()
+
+def predict_generation_prompts(sequence) -> List[str]:
+    """Prompts of the generate nodes each option of the shown choice leads to.
+
+    Only choices are predicted. An ask's answer is free text and becomes
+    part of the prompt, so it cannot be guessed. The lookahead stops at
+    nodes whose outcome depends on the player or the inventory.
+    """
+    choice = sequence.current_node
+    if not sequence.waiting_for_response or not isinstance(choice, ChoiceNode):
+        return []
+
+    prompts = []
+    for option in choice.options:
+        history = sequence.history + [{"role": "player", "text": option}]
+        # Compiled branches already continue into the main chain
+        node = choice.choices.get(option, choice.next)
+        for _ in range(MAX_LOOKAHEAD):
+            if isinstance(node, GenerateNode):
+                prompt, _ = node.build_prompt(sequence, history)
+                if prompt not in prompts:
+                    prompts.append(prompt)
+                break
+            if not isinstance(node, (TalkNode, GiveNode)):
+                break
+            # Mirror the history the talk and give nodes will add on the way
+            if isinstance(node, TalkNode) or node.text:
+                history = history + [{"role": "npc", "text": sequence.format_text(node.text)}]
+            node = node.next
+    return prompts
+
+def speculate(sequence) -> int:
+    """Start generating the continuations of a shown choice, returning how many started.
+
+    Results land in the response cache, where the generate node finds them
+    once the player answers, or joins the call if it is still running.
+    """
+    if not ENABLED:
+        return 0
+    from character_generator import create_sequence
+
+    started = 0
+    for prompt in predict_generation_prompts(sequence):
+        with _inflight_lock:
+            if prompt in _inflight:
+                continue
+            _inflight.add(prompt)
+        try:
+            speculation_jobs.submit('speculation', lambda prompt=prompt: _generate(prompt, create_sequence))
+            started += 1
+        except JobQueueFull:
+            with _inflight_lock:
+                _inflight.discard(prompt)
+            logger.debug("Speculation queue full, skipping a prediction")
+    return started
+
+def _generate(prompt: str, create_sequence) -> None:
+    try:
+        create_sequence(prompt)
+    finally:
+        with _inflight_lock:
+            _inflight.discard(prompt)
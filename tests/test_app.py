@@ -1,6 +1,10 @@
 import pytest
-from app import app
+from unittest import mock
+from app import app, _event_stream, EVENT_LOCK_RETRY_SECONDS
+from world import World
 import json
+import threading
+import time
 
 @pytest.fixture
 def client():
@@ -87,4 +91,159 @@ def test_interact_with_leo(client):
     assert 'messages' in data
     assert any("What's your name" in msg for msg in data['messages'])
     assert data['waitingForInput'] == True  # Now waiting for name input
-    assert data['is_talking'] == True 
\ No newline at end of file
+    assert data['is_talking'] == True 
+
+def test_events_stream_starts_with_locations(client):
+    """Test that the push channel opens with a snapshot of all locations"""
+    response = client.get('/events')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/event-stream'
+    chunks = response.iter_encoded()
+    assert next(chunks).startswith(b'retry:')
+    snapshot = next(chunks).decode('utf-8')
+    assert snapshot.startswith('event: locations')
+    data = json.loads(snapshot.split('data: ', 1)[1])
+    assert any(loc['name'] == 'Leo' for loc in data['locations'])
+    response.close()
+
+def test_events_stream_retries_soon_while_the_world_is_busy():
+    """Test that a held world lock shortens the wait instead of pausing NPC ticks"""
+    world = World()
+    timeouts = []
+
+    class Subscription:
+        def get(self, timeout):
+            timeouts.append(timeout)
+            return {'type': 'resync'}
+
+    held, done = threading.Event(), threading.Event()
+    def hold_lock():
+        with world.lock:
+            held.set()
+            done.wait(5)
+    holder = threading.Thread(target=hold_lock)
+    holder.start()
+    held.wait(5)
+    stream = _event_stream(world, Subscription(), {'type': 'locations', 'locations': []})
+    try:
+        next(stream)
+        next(stream)
+        assert next(stream).startswith('event: resync')
+    finally:
+        done.set()
+        holder.join(5)
+        stream.close()
+    assert timeouts == [EVENT_LOCK_RETRY_SECONDS]
+
+def test_game_state_deltas(client):
+    """Test that clients with a known version only receive the changes since"""
+    # Start on a cell with a walkable cell to the east
+    saved = {'player': {'x': 0, 'y': 0}, 'npcPositions': {}, 'dynamicNpcs': []}
+    data = json.loads(client.post('/game_state', json={'savedState': saved}).data)
+    full = data['gameState']
+    assert full['full'] is True
+    assert full['player']['x'] == 0 and full['player']['y'] == 0
+
+    request_data = {'sinceVersion': full['version'], 'epoch': full['epoch']}
+    data = json.loads(client.post('/game_state', json=request_data).data)
+    delta = data['gameState']
+    assert delta['full'] is False
+    assert all(change['version'] > full['version'] for change in delta['changes'])
+    assert delta['version'] >= full['version']
+
+    # Moving the player shows up as a player change
+    request_data = {'direction': 'east', 'sinceVersion': delta['version'], 'epoch': delta['epoch']}
+    data = json.loads(client.post('/move', json=request_data).data)
+    assert (data['x'], data['y']) == (1, 0)
+    player_changes = [change for change in data['gameState']['changes'] if change['type'] == 'player']
+    assert player_changes[-1]['player']['x'] == 1
+
+def test_game_state_falls_back_to_snapshot(client):
+    """Test that unknown versions get a snapshot and foreign epochs are stale"""
+    full = json.loads(client.get('/game_state').data)['gameState']
+
+    data = json.loads(client.post('/game_state', json={'sinceVersion': -1, 'epoch': full['epoch']}).data)
+    assert data['gameState']['full'] is True
+
+    data = json.loads(client.post('/game_state', json={'sinceVersion': 1, 'epoch': 'other'}).data)
+    assert data['gameState'] == {'stale': True}
+
+
+def test_outdated_saved_state_does_not_overwrite_the_world(client):
+    """Test that a saved state from this world is only applied when it is newer"""
+    saved = {'player': {'x': 0, 'y': 0, 'inventory': {'fish': 1}}, 'npcPositions': {}, 'dynamicNpcs': []}
+    full = json.loads(client.post('/game_state', json={'savedState': saved}).data)['gameState']
+    assert full['player']['inventory'] == {'fish': 1}
+
+    # A stale tab of the same world cannot roll the inventory back
+    stale = dict(saved, player={'x': 1, 'y': 0, 'inventory': {}},
+                 version=full['version'], epoch=full['epoch'])
+    data = json.loads(client.post('/game_state', json={'savedState': stale}).data)
+    assert data['gameState']['player'] == {'x': 0, 'y': 0, 'inventory': {'fish': 1}}
+
+    # A state saved from another world instance restores it
+    foreign = dict(stale, epoch='other')
+    data = json.loads(client.post('/game_state', json={'savedState': foreign}).data)
+    assert data['gameState']['player'] == {'x': 1, 'y': 0, 'inventory': {}}
+
+def test_create_npc_runs_as_job(client):
+    """Test that NPC creation returns a job at once and adds the NPC when done"""
+    npc_data = {'npc': {'name': 'Gen', 'emoji': '🧙'}, 'sequence': [{'type': 'talk', 'text': 'Hi'}]}
+    with mock.patch('app.create_character_data', return_value=npc_data):
+        response = client.post('/create_npc', json={'description': 'a wizard', 'x': 3, 'y': 4})
+        assert response.status_code == 202
+        job = json.loads(response.data)['job']
+
+        deadline = time.time() + 5
+        while job['status'] not in ('done', 'failed') and time.time() < deadline:
+            time.sleep(0.01)
+            job = json.loads(client.get(f"/npc_jobs/{job['id']}").data)['job']
+
+    assert job['status'] == 'done'
+    assert job['result']['name'] == 'Gen'
+    state = json.loads(client.get('/game_state').data)
+    gen = next(loc for loc in state['locations'] if loc.get('name') == 'Gen')
+    assert (gen['x'], gen['y']) == (3, 4)
+
+def test_npc_job_status_unknown(client):
+    """Test that unknown job ids are not found"""
+    assert client.get('/npc_jobs/nope').status_code == 404
+
+def test_concurrent_interactions_keep_their_own_messages():
+    """Test that interactions on several threads each get exactly their own lines"""
+    app.config['TESTING'] = True
+    leo = {'savedState': {'player': {'x': 2, 'y': 1}, 'npcPositions': {}, 'dynamicNpcs': []}}
+    results = []
+    start = threading.Barrier(8)
+
+    def play():
+        with app.test_client() as client:
+            start.wait()
+            response = client.post('/interact', data=json.dumps(leo), content_type='application/json')
+            results.append(json.loads(response.data)['message'])
+
+    with mock.patch('sys.stdout') as stdout:
+        threads = [threading.Thread(target=play) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    stdout.write.assert_not_called()
+    assert len(results) == 8
+    assert all(message.count("I'm Leo") == 1 and "\n" not in message for message in results)
+
+def test_walk_to_follows_a_path(client):
+    """Test that the player walks to a clicked cell along a connected path"""
+    saved = {'player': {'x': 0, 'y': 0}, 'npcPositions': {}, 'dynamicNpcs': []}
+    response = client.post('/walk_to',
+                           data=json.dumps({'x': 2, 'y': 0, 'savedState': saved}),
+                           content_type='application/json')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data['canMove']
+    assert data['path'] == [[1, 0], [2, 0]]
+    assert [data['x'], data['y']] == [2, 0]
+
+    response = client.post('/walk_to', data=json.dumps({'x': 'far'}),
+                           content_type='application/json')
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+import gzip
+import re
+from assets import AssetStore
+from app import app, assets
+
+def test_stylesheets_link_fingerprinted_assets(tmp_path):
+    """Test that URLs get content hashes and stylesheets point at them"""
+    (tmp_path / 'static').mkdir()
+    (tmp_path / 'static' / 'map.png').write_bytes(b'png')
+    (tmp_path / 'static' / 'game.css').write_text("body { background: url('/static/map.png'); }")
+    store = AssetStore(str(tmp_path), ('static',))
+    image_url = store.url('static/map.png')
+    assert image_url.startswith('/static/map.') and image_url.endswith('.png')
+    assert image_url.encode() in store.get('static/game.css').content
+    assert store.url('static/missing.js') == '/static/missing.js'
+
+    (tmp_path / 'static' / 'map.png').write_bytes(b'new png')
+    assert AssetStore(str(tmp_path), ('static',)).url('static/game.css') != store.url('static/game.css')
+
+def test_fingerprinted_urls_are_immutable():
+    """Test that hashed URLs are cached for good and revalidate with their ETag"""
+    client = app.test_client()
+    url = assets.url('sounds/a.ogg')
+    response = client.get(url)
+    assert response.status_code == 200
+    assert 'immutable' in response.headers['Cache-Control']
+    assert response.data == assets.get('sounds/a.ogg').content
+    etag = response.headers['ETag']
+    assert not etag.startswith('W/')
+    assert client.get(url, headers={'If-None-Match': etag}).status_code == 304
+
+    response = client.get('/sounds/a.ogg')
+    assert response.headers['Cache-Control'] == 'no-cache'
+    assert response.headers['ETag'] == etag
+    assert client.get('/sounds/../app.py').status_code == 404
+
+def test_text_assets_are_served_precompressed():
+    """Test that stylesheets come gzipped to clients accepting it, and plain to others"""
+    client = app.test_client()
+    url = assets.url('static/css/game.css')
+    compressed = client.get(url, headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert 'Accept-Encoding' in compressed.headers['Vary']
+    plain = client.get(url)
+    assert 'Content-Encoding' not in plain.headers
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] != plain.headers['ETag']
+
+def test_page_links_fingerprinted_assets():
+    """Test that the game page only references hashed asset URLs"""
+    page = app.test_client().get('/').get_data(as_text=True)
+    assert assets.url('static/css/game.css') in page
+    assert assets.url('sounds/oe.ogg') in page
+    assert not re.search(r"/(static|sounds|graphics)/[\w/]+\.\w+['\"]", page)
@@ -0,0 +1,67 @@
+from unittest import mock
+import pytest
+import character_generator
+from llm import FakeBackend
+from llm_cache import LLMCache
+from character_schema import CHARACTER_FUNCTIONS
+from npc_schema import NPC_FUNCTIONS
+from sequence_schema import SEQUENCE_FUNCTIONS
+
+NPC = {'name': 'Gen', 'emoji': '🧙', 'personality': 'wise'}
+SEQUENCE = [{'type': 'talk', 'text': 'Hi'}]
+
+@pytest.fixture(autouse=True)
+def empty_cache(tmp_path):
+    """Give every test its own response cache"""
+    with mock.patch.object(character_generator, 'llm_cache', LLMCache(str(tmp_path))) as cache:
+        yield cache
+
+def test_merged_schema_embeds_both_schemas():
+    """Test that the combined schema is built from the NPC and sequence schemas"""
+    properties = CHARACTER_FUNCTIONS[0]['parameters']['properties']
+    assert properties['npc'] == NPC_FUNCTIONS[0]['parameters']
+    assert properties['sequence'] == SEQUENCE_FUNCTIONS[0]['parameters']['properties']['sequence']
+
+def test_combined_mode_makes_one_call():
+    """Test that combined generation returns structured data from one call"""
+    with mock.patch.object(character_generator.gateway, 'backend') as backend:
+        backend.call_function.return_value = {'npc': NPC, 'sequence': SEQUENCE}
+        data = character_generator.create_character_data('a wizard', mode=character_generator.COMBINED)
+    assert data == {'npc': NPC, 'sequence': SEQUENCE}
+    assert backend.call_function.call_count == 1
+    assert backend.call_function.call_args.args[2] is CHARACTER_FUNCTIONS
+
+def test_two_call_mode_makes_two_calls():
+    """Test that the two call mode asks for the NPC and then its sequence"""
+    with mock.patch.object(character_generator.gateway, 'backend') as backend:
+        backend.call_function.side_effect = [NPC, {'sequence': SEQUENCE}]
+        data = character_generator.create_character_data('a wizard', mode=character_generator.TWO_CALL)
+    assert data == {'npc': NPC, 'sequence': SEQUENCE}
+    assert backend.call_function.call_count == 2
+
+def test_identical_prompts_use_the_cache(empty_cache):
+    """Test that a repeated prompt is answered without calling the API again"""
+    with mock.patch.object(character_generator.gateway, 'backend') as backend:
+        backend.call_function.return_value = {'sequence': SEQUENCE}
+        assert character_generator.create_sequence('Say  hi') == SEQUENCE
+        assert character_generator.create_sequence(' Say hi ') == SEQUENCE
+    assert backend.call_function.call_count == 1
+    assert empty_cache.hits == 1
+
+def test_first_talk_line_streams_in():
+    """Test that the opening talk line reaches on_text progressively before the sequence returns"""
+    lines = []
+    with mock.patch.object(character_generator.gateway, 'backend', FakeBackend()):
+        sequence = character_generator.create_sequence('greet me', on_text=lines.append)
+    assert sequence[0]['type'] == 'talk'
+    assert len(lines) > 1
+    assert lines[-1] == sequence[0]['text']
+    assert all(sequence[0]['text'].startswith(line) for line in lines)
+
+def test_cached_sequence_still_reports_its_first_line():
+    """Test that a cache hit passes the whole first line to on_text at once"""
+    with mock.patch.object(character_generator.gateway, 'backend', FakeBackend()):
+        sequence = character_generator.create_sequence('greet me')
+        lines = []
+        assert character_generator.create_sequence('greet me', on_text=lines.append) == sequence
+    assert lines == [sequence[0]['text']]
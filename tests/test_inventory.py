@@ -0,0 +1,66 @@
+import pytest
+from character import Character
+from sequence import Sequence
+
+class Speaker:
+    name = 'Trader'
+    is_talking = False
+
+    def talk(self, message, output=None):
+        if output is not None:
+            output.append(message)
+
+def test_bulk_add_and_remove_drop_used_up_items():
+    """Test that amounts move in one step and used up items leave the inventory"""
+    character = Character(0, 0)
+    character.add_item('coins', 10000)
+    assert character.inventory == {'coins': 10000}
+    assert not character.remove_item('coins', 10001)
+    assert character.remove_item('coins', 9999)
+    assert character.remove_item('coins')
+    assert character.inventory == {}
+
+def test_failed_trade_changes_nothing():
+    """Test that a trade the character cannot afford leaves the inventory alone"""
+    character = Character(0, 0)
+    character.add_item('fish', 2)
+    assert not character.trade({'fish': 2, 'coins': 1}, {'Meat': 1})
+    assert character.inventory == {'fish': 2}
+    with pytest.raises(ValueError):
+        character.trade({'fish': 1}, {'Meat': -1})
+    assert character.inventory == {'fish': 2}
+    assert character.trade({'fish': 2}, {'Meat': 1})
+    assert character.inventory == {'Meat': 1}
+
+def test_dialogue_gives_and_trades_whole_quantities():
+    """Test that give and trade nodes move their full quantities at once"""
+    sequence = Sequence([
+        {'type': 'give', 'text': 'Take these', 'item': {'name': 'coins', 'quantity': 10000}},
+        {'type': 'trade', 'text': 'Deal?', 'trade': {
+            'want': {'name': 'coins', 'quantity': 10000}, 'offer': {'name': 'Sword', 'quantity': 1},
+            'success_text': 'Done', 'failure_text': 'No'}},
+    ])
+    character = Character(0, 0)
+    speaker = Speaker()
+    sequence.interact(speaker, character, [])
+    assert character.inventory == {'coins': 10000}
+    sequence.interact(speaker, character, [])
+    assert character.inventory == {'Sword': 1}
+
+def test_dialogue_with_bad_quantities_does_not_raise():
+    """Test that generated negative quantities give nothing and fail trades"""
+    sequence = Sequence([
+        {'type': 'give', 'text': 'Take these', 'item': {'name': 'coins', 'quantity': -5}},
+        {'type': 'trade', 'text': 'Deal?', 'trade': {
+            'want': {'name': 'coins', 'quantity': 1}, 'offer': {'name': 'Sword', 'quantity': -1},
+            'success_text': 'Done', 'failure_text': 'No'}},
+    ])
+    character = Character(0, 0)
+    character.add_item('coins', 1)
+    speaker = Speaker()
+    sequence.interact(speaker, character, [])
+    assert character.inventory == {'coins': 1}
+    output = []
+    sequence.interact(speaker, character, output)
+    assert output[-1] == 'Trader: No'
+    assert character.inventory == {'coins': 1}
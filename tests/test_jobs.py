@@ -0,0 +1,60 @@
+import threading
+import time
+import pytest
+from jobs import DONE, FAILED, JobPool, JobQueueFull
+
+def wait_for(job, timeout=5.0):
+    """Wait until a job has finished"""
+    deadline = time.time() + timeout
+    while not job.is_finished and time.time() < deadline:
+        time.sleep(0.01)
+    assert job.is_finished
+
+def test_job_result_passes_through_on_done():
+    """Test that the completion hook runs on the work's result"""
+    pool = JobPool(max_workers=1)
+    job = pool.submit('alice', lambda: 2, lambda value: value * 10)
+    wait_for(job)
+    assert job.status == DONE
+    assert job.to_dict() == {'id': job.id, 'status': DONE, 'result': 20}
+    pool.shutdown()
+
+def test_failed_job_records_error():
+    """Test that an exception marks the job failed instead of escaping"""
+    pool = JobPool(max_workers=1)
+    def fail():
+        raise ValueError("no model")
+    job = pool.submit('alice', fail)
+    wait_for(job)
+    assert job.status == FAILED
+    assert job.error == "no model"
+    assert pool.pending == 0
+    pool.shutdown()
+
+def test_pool_refuses_work_beyond_pending_limit():
+    """Test that submissions are refused while the pool is saturated"""
+    release = threading.Event()
+    pool = JobPool(max_workers=1, max_pending=2)
+    first = pool.submit('alice', release.wait)
+    pool.submit('alice', release.wait)
+    with pytest.raises(JobQueueFull):
+        pool.submit('alice', release.wait)
+    release.set()
+    wait_for(first)
+    pool.shutdown()
+
+def test_jobs_only_visible_to_their_owner():
+    """Test that another session cannot read a job"""
+    pool = JobPool(max_workers=1)
+    job = pool.submit('alice', lambda: None)
+    assert pool.get(job.id, owner='alice') is job
+    assert pool.get(job.id, owner='bob') is None
+    pool.shutdown()
+
+def test_only_recent_finished_jobs_kept():
+    """Test that finished jobs are forgotten oldest first"""
+    pool = JobPool(max_workers=1, max_finished=2)
+    jobs = [pool.submit('alice', lambda: None) for _ in range(4)]
+    pool.shutdown()
+    assert pool.get(jobs[0].id) is None
+    assert pool.get(jobs[-1].id) is jobs[-1]
@@ -0,0 +1,97 @@
+import threading
+import time
+import pytest
+from character_schema import CHARACTER_FUNCTIONS
+from llm import FakeBackend, LLMBusy, LLMGateway, LLMTimeout, TokenBucket
+from npc import NPCTemplate
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_fake_backend_is_deterministic_and_schema_shaped():
+    """Test that the fake answers the same prompt the same way with usable data"""
+    backend = FakeBackend()
+    first = backend.call_function('gpt-4o', 'a wizard', CHARACTER_FUNCTIONS, 'create_character', 5)
+    second = backend.call_function('gpt-4o', 'a wizard', CHARACTER_FUNCTIONS, 'create_character', 5)
+    other = backend.call_function('gpt-4o', 'a knight', CHARACTER_FUNCTIONS, 'create_character', 5)
+    assert first == second
+    assert first != other
+    template = NPCTemplate('dynamic_fake', first)
+    assert template.name and template.graph.head is not None
+
+def test_fake_backend_times_out():
+    """Test that a fake slower than the timeout raises like a real timeout"""
+    slept = []
+    backend = FakeBackend(latency=2.0, sleep=slept.append)
+    with pytest.raises(LLMTimeout):
+        backend.call_function('gpt-4o', 'x', CHARACTER_FUNCTIONS, 'create_character', 0.5)
+    assert slept == [0.5]
+
+def test_token_bucket_paces_after_burst():
+    """Test that the bucket allows a burst and then refills at its rate"""
+    clock = FakeClock()
+    bucket = TokenBucket(rate=2, burst=2, clock=clock)
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == 0
+    assert bucket.try_acquire() == pytest.approx(0.5)
+    clock.now += 0.5
+    assert bucket.try_acquire() == 0
+
+def test_gateway_bounds_concurrency_and_reports_queue():
+    """Test that no more than max_concurrency calls run and waiting callers are counted"""
+    release = threading.Event()
+    running = []
+    peak = []
+
+    class BlockingBackend(FakeBackend):
+        def call_function(self, *args):
+            running.append(1)
+            peak.append(len(running))
+            release.wait(5)
+            running.pop()
+            return {}
+
+    gateway = LLMGateway(BlockingBackend(), max_concurrency=2)
+    threads = [threading.Thread(target=gateway.call_function, args=('m', 'p', [], 'f'))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while gateway.metrics()['waiting'] < 3 and time.time() < deadline:
+        time.sleep(0.01)
+    metrics = gateway.metrics()
+    assert metrics['in_flight'] == 2
+    assert metrics['waiting'] == 3
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert max(peak) == 2
+    assert gateway.metrics()['calls'] == 5
+
+def test_gateway_refuses_when_queue_is_full():
+    """Test that callers beyond max_queue are turned away"""
+    release = threading.Event()
+
+    class BlockingBackend(FakeBackend):
+        def call_function(self, *args):
+            release.wait(5)
+            return {}
+
+    gateway = LLMGateway(BlockingBackend(), max_concurrency=1, max_queue=1)
+    threads = [threading.Thread(target=gateway.call_function, args=('m', 'p', [], 'f'))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    deadline = time.time() + 5
+    while gateway.metrics()['waiting'] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    with pytest.raises(LLMBusy):
+        gateway.call_function('m', 'p', [], 'f')
+    release.set()
+    for thread in threads:
+        thread.join(5)
+    assert gateway.metrics()['rejected'] == 1
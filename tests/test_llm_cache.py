@@ -0,0 +1,83 @@
+import threading
+import time
+from llm_cache import LLMCache
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+def test_key_ignores_whitespace_but_not_schema():
+    """Test that keys normalize prompts and cover model and schema"""
+    key = LLMCache.key('gpt-4o', {'f': 1}, 'Hello   there\n')
+    assert key == LLMCache.key('gpt-4o', {'f': 1}, ' Hello there')
+    assert key != LLMCache.key('gpt-4o', {'f': 2}, 'Hello there')
+    assert key != LLMCache.key('other', {'f': 1}, 'Hello there')
+
+def test_entries_survive_a_new_instance(tmp_path):
+    """Test that entries are read back from disk"""
+    LLMCache(str(tmp_path)).put('k', {'sequence': [1, 2]})
+    assert LLMCache(str(tmp_path)).get('k') == {'sequence': [1, 2]}
+
+def test_least_recently_used_entries_evicted(tmp_path):
+    """Test that the cache stays under its byte limit, dropping old entries first"""
+    cache = LLMCache(str(tmp_path), max_bytes=200)
+    cache.put('a', 'x' * 40)
+    cache.put('b', 'x' * 40)
+    cache.get('a')
+    cache.put('c', 'x' * 40)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.stats()['bytes'] <= 200
+
+def test_expired_entries_are_misses(tmp_path):
+    """Test that entries older than the TTL are not returned"""
+    clock = FakeClock()
+    cache = LLMCache(str(tmp_path), ttl=60, clock=clock)
+    cache.put('k', 'v')
+    clock.now += 59
+    assert cache.get('k') == 'v'
+    clock.now += 2
+    assert cache.get('k') is None
+    assert cache.stats()['entries'] == 0
+
+def test_concurrent_misses_share_one_call(tmp_path):
+    """Test that identical requests in flight are computed once"""
+    cache = LLMCache(str(tmp_path))
+    calls = []
+    started = threading.Event()
+    release = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return {'answer': 42}
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_compute('k', compute)))
+               for _ in range(4)]
+    threads[0].start()
+    started.wait(5)
+    for thread in threads[1:]:
+        thread.start()
+    # Bounded, so a single-flight regression fails instead of hanging the suite
+    deadline = time.monotonic() + 5
+    while cache.coalesced < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    release.set()
+    for thread in threads:
+        thread.join(5)
+
+    assert cache.coalesced == 3
+    assert calls == [1]
+    assert results == [{'answer': 42}] * 4
+
+def test_none_results_are_not_cached(tmp_path):
+    """Test that failed generations are retried next time"""
+    cache = LLMCache(str(tmp_path))
+    assert cache.get_or_compute('k', lambda: None) is None
+    assert cache.get_or_compute('k', lambda: 'v') == 'v'
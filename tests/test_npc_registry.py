@@ -0,0 +1,39 @@
+import os
+from unittest import mock
+import yaml
+from npc_registry import NPCRegistry, registry
+from world import World
+
+NPC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'npcs')
+
+def test_static_templates_parsed_once():
+    """Test that YAML files are only parsed on first use"""
+    npc_registry = NPCRegistry(NPC_DIR)
+    with mock.patch('npc_registry.yaml.safe_load', wraps=yaml.safe_load) as safe_load:
+        first = npc_registry.static_templates()
+        second = npc_registry.static_templates()
+    assert first is second
+    assert safe_load.call_count == len(first)
+
+def test_worlds_share_dialogue_but_not_state():
+    """Test that two worlds share compiled nodes but keep their own cursors"""
+    world_a, world_b = World(), World()
+    leo_a = next(npc for npc in world_a.locations if npc.name == 'Leo')
+    leo_b = next(npc for npc in world_b.locations if npc.name == 'Leo')
+
+    assert leo_a is not leo_b
+    assert leo_a.sequence.head is leo_b.sequence.head
+
+    leo_a.interact(world_a.character)
+    assert leo_a.is_talking
+    assert not leo_b.is_talking
+    assert leo_b.sequence.current_node is leo_b.sequence.head
+
+def test_dynamic_template_recompiled_on_change():
+    """Test that dynamic templates are cached per id and data"""
+    data = {'npc': {'name': 'Gen', 'emoji': '🧙'}, 'sequence': [{'type': 'talk', 'text': 'Hi'}]}
+    first = registry.dynamic_template('dynamic_test', data)
+    assert registry.dynamic_template('dynamic_test', data) is first
+
+    changed = {'npc': {'name': 'Gen', 'emoji': '🧙'}, 'sequence': [{'type': 'talk', 'text': 'Bye'}]}
+    assert registry.dynamic_template('dynamic_test', changed) is not first
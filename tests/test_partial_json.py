@@ -0,0 +1,31 @@
+import json
+from partial_json import parse_partial_json
+
+DOCUMENT = {
+    'sequence': [
+        {'type': 'talk', 'text': 'Hello \"traveler\" \\ café ☺'},
+        {'type': 'give', 'item': {'name': 'Meat', 'quantity': 12}, 'flag': True, 'none': None}
+    ]
+}
+
+def test_every_prefix_parses_to_a_prefix_of_the_document():
+    """Test that each prefix yields complete members plus the partial string"""
+    for text in (json.dumps(DOCUMENT), json.dumps(DOCUMENT, indent=2, ensure_ascii=False)):
+        for end in range(len(text) + 1):
+            partial = parse_partial_json(text[:end])
+            assert partial is None or isinstance(partial, dict)
+        assert parse_partial_json(text) == DOCUMENT
+
+def test_partial_string_value_is_kept():
+    """Test that a string that is still arriving is returned so far"""
+    assert parse_partial_json('{"sequence": [{"type": "talk", "text": "Hel') == \
+        {'sequence': [{'type': 'talk', 'text': 'Hel'}]}
+
+def test_half_escapes_and_unfinished_members_are_dropped():
+    """Test that escapes cut in half, keys without values and numbers are left out"""
+    assert parse_partial_json('{"text": "a\\') == {'text': 'a'}
+    assert parse_partial_json('{"text": "a\\u26') == {'text': 'a'}
+    assert parse_partial_json('{"a": 1, "quantity": 1') == {'a': 1}
+    assert parse_partial_json('{"a": 1, "typ') == {'a': 1}
+    assert parse_partial_json('{"a": tr') == {}
+    assert parse_partial_json('') is None
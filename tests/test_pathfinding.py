@@ -0,0 +1,96 @@
+import pytest
+from unittest import mock
+from pathfinding import Pathfinder
+from walkability import WalkabilityGrid
+from npc import NPC
+from world import World, OBJECTS, VECTORIZED
+
+# A wall with one gap, and a separate cell in the corner
+#   . . . . .
+#   # # # . #
+#   . . . . .
+#   # # # # .
+#   . # # # #
+GRID = WalkabilityGrid(5, 5, bytes([1, 1, 1, 1, 1,
+                                    0, 0, 0, 1, 0,
+                                    1, 1, 1, 1, 1,
+                                    0, 0, 0, 0, 1,
+                                    1, 0, 0, 0, 0]))
+
+def is_connected(start, path):
+    cells = [start] + path
+    return all(abs(ax - bx) + abs(ay - by) == 1 for (ax, ay), (bx, by) in zip(cells, cells[1:]))
+
+def test_shortest_path_goes_through_the_gap():
+    """Test that A* finds a shortest path around walls"""
+    pathfinder = Pathfinder(GRID)
+    path = pathfinder.find_path((-2, -2), (-2, 0))
+    assert path[-1] == (-2, 0)
+    assert len(path) == 8
+    assert is_connected((-2, -2), path)
+    assert all(GRID.is_walkable(x, y) for x, y in path)
+    assert pathfinder.find_path((-2, 0), (-2, 0)) == []
+
+def test_no_path_between_regions_or_into_walls():
+    """Test that unreachable goals fail without a search"""
+    pathfinder = Pathfinder(GRID)
+    assert pathfinder.find_path((-2, -2), (-2, 2)) is None
+    assert pathfinder.find_path((-2, -2), (-2, -1)) is None
+    assert pathfinder.next_step((-2, -2), (-2, 2)) is None
+    assert pathfinder.distance((-2, -2), (-2, 2)) is None
+
+def test_distance_fields_are_cached_and_followed():
+    """Test that warmed targets answer paths and next steps from one field"""
+    pathfinder = Pathfinder(GRID, max_fields=1)
+    pathfinder.warm([(-2, 0)])
+    assert pathfinder.has_field((-2, 0))
+    field = pathfinder.distance_field((-2, 0))
+    assert pathfinder.distance_field((-2, 0)) is field
+    assert pathfinder.distance((-2, -2), (-2, 0)) == 8
+    assert pathfinder.find_path((-2, -2), (-2, 0)) == Pathfinder(GRID).find_path((-2, -2), (-2, 0))
+    assert pathfinder.next_step((1, 0), (-2, 0)) == (0, 0)
+
+    pathfinder.warm([(2, 1)])
+    assert not pathfinder.has_field((-2, 0))
+
+def test_blocked_cells_are_avoided():
+    """Test that callers can route around occupied cells"""
+    pathfinder = Pathfinder(GRID)
+    pathfinder.warm([(2, 0)])
+    path = pathfinder.find_path((-2, 0), (2, 0), blocked=lambda x, y: (x, y) == (0, 0))
+    assert path is None
+    path = pathfinder.find_path((-2, -2), (2, -2), blocked=lambda x, y: (x, y) == (0, 0))
+    assert path == [(-1, -2), (0, -2), (1, -2), (2, -2)]
+
+@pytest.mark.parametrize('simulation', [OBJECTS, VECTORIZED])
+def test_npc_walks_to_its_goal(simulation):
+    """Test that sent NPCs follow the path one cell per tick in both simulations"""
+    if simulation == VECTORIZED:
+        pytest.importorskip('numpy')
+    world = World(load_npcs=False, simulation=simulation)
+    walker = NPC(-2, -2, name='walker', should_wander=False)
+    # Walls keep the wanderer in its corridor, out of the walker's way
+    wanderer = NPC(-2, 2, name='wanderer', should_wander=True)
+    world.grid = WalkabilityGrid(5, 5, bytes([1, 1, 1, 1, 1,
+                                              0, 0, 0, 1, 0,
+                                              1, 1, 1, 1, 1,
+                                              0, 0, 0, 0, 0,
+                                              1, 1, 1, 1, 1]))
+    for npc in (walker, wanderer):
+        world.add_location(npc)
+    assert world.send_npc_to(walker, -2, 0)
+    assert world.send_npc_to(wanderer, 0, 2)
+    assert not world.send_npc_to(walker, -2, 2)
+
+    now = max(walker.next_wander_time, wanderer.next_wander_time)
+    for _ in range(20):
+        before = {npc.name: (npc.x, npc.y) for npc in (walker, wanderer)}
+        with mock.patch('time.time', return_value=now):
+            world.update_npcs()
+        for npc in (walker, wanderer):
+            x, y = before[npc.name]
+            assert abs(npc.x - x) + abs(npc.y - y) <= 1
+        now += max(walker.wander_interval, wanderer.wander_interval) + 1
+    assert (walker.x, walker.y) == (-2, 0)
+    assert walker.goal is None and wanderer.goal is None
+    assert not walker.wants_to_move
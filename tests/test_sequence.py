@@ -0,0 +1,101 @@
+import pickle
+from npc_registry import registry
+from sequence import DialogueGraph, Sequence, link_choice_branches
+from world import World
+
+DATA = [
+    {'type': 'talk', 'text': 'Hello'},
+    {'type': 'choice', 'text': 'Pick', 'choices': [
+        {'choice_text': 'A', 'type': 'talk', 'text': 'You picked A'},
+        {'choice_text': 'B'}]},
+    {'type': 'ask', 'text': 'Name?', 'user_input': 'name'},
+    {'type': 'talk', 'text': 'Bye {name}'},
+]
+
+class Speaker:
+    name = 'Tester'
+    is_talking = False
+
+    def talk(self, message, output=None):
+        output.append(message)
+
+def links(graph):
+    return [node.next for node in graph.nodes], graph.next_index, graph.choice_index
+
+def test_answers_move_cursors_without_touching_the_graph():
+    """Test that sessions on one graph keep separate cursors and never change it"""
+    graph = DialogueGraph(DATA)
+    before = links(graph)
+    first, second = Sequence.from_graph(graph), Sequence.from_graph(graph)
+    speaker = Speaker()
+    for sequence, answer in ((first, 'A'), (second, 'B')):
+        output = []
+        sequence.interact(speaker, None, output)
+        sequence.interact(speaker, None, output)
+        sequence.provide_response(answer)
+        sequence.interact(speaker, None, output)
+    assert first.current_node.text == 'Name?' and not first.waiting_for_response
+    assert second.current_node.text == 'Name?' and second.waiting_for_response
+    assert {'role': 'npc', 'text': 'You picked A'} in first.history
+    assert {'role': 'npc', 'text': 'You picked A'} not in second.history
+    assert links(graph) == before
+
+def test_choice_branches_continue_into_the_main_chain():
+    """Test that a compiled branch leads back to the node after its choice"""
+    graph = DialogueGraph(DATA)
+    choice = graph.index_of(graph.head.next)
+    branch = graph.after_choice(choice, 'A')
+    assert graph.nodes[branch].text == 'You picked A'
+    assert graph.next_index[branch] == graph.next_index[choice]
+    assert graph.after_choice(choice, 'B') == graph.next_index[choice]
+
+def test_sessions_taking_the_same_shared_branch_do_not_loop():
+    """Test that worlds sharing Leo's template can each take the same branch to the end"""
+    worlds = [World(), World()]
+    leos = [next(npc for npc in world.locations if npc.id == 'leo.yaml') for world in worlds]
+    assert leos[0].sequence.graph is leos[1].sequence.graph
+    for world, leo in zip(worlds, leos):
+        world.character.x, world.character.y = leo.x, leo.y
+        output = []
+        world.try_interact(output=output)
+        world.try_interact(output=output)
+        leo.provide_response('Bob')
+        world.try_interact(output=output)
+        world.try_interact(output=output)
+        leo.provide_response('Yes, please!')
+        for _ in range(3):
+            world.try_interact(output=output)
+        assert output[-2:] == ["🦁: Leo: Here's some fresh meat for you!",
+                               "🦁: Leo: Remember, sharing is caring, Bob! Come back anytime."]
+        assert leo.sequence.current_node is None
+        assert world.character.inventory == {'Meat': 1}
+
+    # Relinking the shared chain leaves it finite
+    graph = leos[0].sequence.graph
+    link_choice_branches(graph.head)
+    node, steps = graph.head, 0
+    while node is not None and steps < len(graph.nodes) + 1:
+        node, steps = node.next, steps + 1
+    assert node is None
+
+def test_cursor_follows_into_generated_dialogue():
+    """Test that the cursor moves into a generated graph and resets back"""
+    sequence = Sequence(DATA)
+    head = sequence.use_generated([{'type': 'talk', 'text': 'Generated'}])
+    sequence.current_node = head
+    assert sequence.in_generated and sequence.position == 0
+    sequence.reset()
+    assert not sequence.in_generated and sequence.current_node is sequence.head
+
+def test_pickled_graph_rebuilds_its_indexes():
+    """Test that a graph still addresses its own nodes after unpickling"""
+    graph = pickle.loads(pickle.dumps(DialogueGraph(DATA)))
+    assert [graph.index_of(node) for node in graph.nodes] == list(range(len(graph.nodes)))
+
+def test_hot_objects_have_no_instance_dict():
+    """Test that NPCs, their sequences and dialogue nodes are slotted"""
+    npc = registry.static_template('chatty.yaml').instantiate()
+    objects = [npc, npc.sequence, npc.sequence.graph] + list(npc.sequence.graph.nodes)
+    assert not any(hasattr(obj, '__dict__') for obj in objects)
+    restored = pickle.loads(pickle.dumps(npc))
+    assert restored.name == npc.name and restored.sequence.position == npc.sequence.position
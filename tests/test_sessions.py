@@ -0,0 +1,111 @@
+from sessions import SessionStore, SQLiteSessionStore
+from world import World
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def make_store(**kwargs):
+    clock = FakeClock()
+    store = SessionStore(object, clock=clock, **kwargs)
+    return store, clock
+
+def test_same_session_gets_same_world():
+    """Test that a session keeps its world and messages between requests"""
+    store, _ = make_store()
+    world, messages = store.get_or_create('a')
+    messages.append('hello')
+    assert store.get_or_create('a') == (world, ['hello'])
+    assert store.stats()['created'] == 1
+
+def test_idle_sessions_expire():
+    """Test that sessions idle past the timeout get a fresh world"""
+    store, clock = make_store(idle_timeout=10, sweep_interval=5)
+    world, _ = store.get_or_create('a')
+    store.get_or_create('b')
+    clock.now = 8
+    store.get_or_create('b')
+    clock.now = 15
+    assert store.get_or_create('a')[0] is not world
+    assert store.stats()['evicted_idle'] == 1
+
+    clock.now = 30
+    assert store.evict_idle() == 2
+    assert store.stats()['resident'] == 0
+
+def test_least_recently_used_session_evicted_at_capacity():
+    """Test that the cap on live worlds evicts the least recently used one"""
+    store, clock = make_store(max_sessions=2)
+    store.get_or_create('a')
+    store.get_or_create('b')
+    store.get_or_create('a')
+    store.get_or_create('c')
+    assert 'a' in store and 'c' in store
+    assert 'b' not in store
+    assert store.stats() == {'resident': 2, 'created': 3, 'evicted_idle': 0,
+                             'evicted_lru': 1, 'discarded': 0}
+
+def test_discard():
+    """Test that reset drops the session"""
+    store, _ = make_store()
+    store.get_or_create('a')
+    assert store.discard('a')
+    assert not store.discard('a')
+    assert store.stats()['discarded'] == 1
+
+class Counter:
+    """Small picklable stand-in for a world"""
+    def __init__(self):
+        self.value = 0
+
+def make_sqlite_store(tmp_path, **kwargs):
+    clock = FakeClock()
+    store = SQLiteSessionStore(str(tmp_path / 'sessions.db'), Counter, clock=clock, **kwargs)
+    return store, clock
+
+def test_sqlite_workers_share_saved_worlds(tmp_path):
+    """Test that a world saved by one worker is loaded by another"""
+    worker_a = SQLiteSessionStore(str(tmp_path / 'sessions.db'), World)
+    worker_b = SQLiteSessionStore(str(tmp_path / 'sessions.db'), World)
+
+    world, messages = worker_a.get_or_create('a')
+    world.character.add_item('fish', 3)
+    messages.append('hello')
+    worker_a.save('a', world, messages)
+
+    restored, restored_messages = worker_b.get_or_create('a')
+    assert restored is not world
+    assert restored.character.inventory == {'fish': 3}
+    assert restored_messages == ['hello']
+    leo = restored.get_location_at(2, 1)
+    assert leo is not None and leo.name == 'Leo'
+
+def test_sqlite_conditional_save_detects_conflicts(tmp_path):
+    """Test that a stale copy does not overwrite a newer save when asked not to"""
+    store, _ = make_sqlite_store(tmp_path)
+    world, messages = store.get_or_create('a')
+    store.save('a', world, messages)
+
+    stale, _ = store.get_or_create('a')
+    fresh, _ = store.get_or_create('a')
+    fresh.value = 1
+    assert store.save('a', fresh, [])
+    stale.value = 2
+    assert not store.save('a', stale, [], only_if_unchanged=True)
+    assert store.get_or_create('a')[0].value == 1
+
+def test_sqlite_eviction(tmp_path):
+    """Test idle expiry and the cap on stored worlds"""
+    store, clock = make_sqlite_store(tmp_path, max_sessions=2, idle_timeout=10)
+    for session_id in ('a', 'b', 'c'):
+        clock.now += 1
+        store.save(session_id, *store.get_or_create(session_id))
+    assert store.stats()['resident'] == 2
+    assert store.stats()['evicted_lru'] == 1
+
+    clock.now += 20
+    assert store.evict_idle() == 2
+    assert store.stats()['resident'] == 0
@@ -0,0 +1,54 @@
+from spatial import SpatialIndex
+from world import World
+
+class Entity:
+    def __init__(self, x, y):
+        self.x = x
+        self.y = y
+
+def test_index_tracks_moves():
+    """Test that lookups follow entities as they move"""
+    index = SpatialIndex()
+    entity = Entity(1, 2)
+    index.add(entity)
+    assert index.at(1, 2) is entity
+
+    index.move(entity, 3, 4)
+    assert (entity.x, entity.y) == (3, 4)
+    assert index.at(1, 2) is None
+    assert index.at(3, 4) is entity
+
+    index.remove(entity)
+    assert index.at(3, 4) is None
+    assert len(index) == 0
+
+def test_shared_cells_keep_all_occupants():
+    """Test that removing one occupant keeps the others in the cell"""
+    index = SpatialIndex()
+    first, second = Entity(0, 0), Entity(0, 0)
+    index.add(first)
+    index.add(second)
+    index.remove(first)
+    assert index.at(0, 0) is second
+
+def test_world_index_matches_locations_after_wandering():
+    """Test that NPC wandering keeps the world's index in sync"""
+    world = World()
+    for _ in range(20):
+        for npc in world.locations:
+            npc.last_wander_time = 0
+        world.reschedule_wandering()
+        world.update_npcs()
+    for location in world.locations:
+        assert location in world.occupancy.all_at(location.x, location.y)
+    assert len(world.occupancy) == len(world.locations)
+
+def test_area_query_scans_cells_or_occupants():
+    """Test that rectangle queries find the same entities however they search"""
+    index = SpatialIndex()
+    entities = [Entity(x, y) for x, y in [(0, 0), (2, 1), (5, 5), (-3, 2)]]
+    for entity in entities:
+        index.add(entity)
+    assert index.in_area(0, 0, 2, 1) == [entities[0], entities[1]]
+    assert set(map(id, index.in_area(-10, -10, 10, 10))) == set(map(id, entities))
+    assert index.in_area(1, 1, 0, 0) == []
@@ -0,0 +1,62 @@
+from unittest import mock
+import speculation
+from jobs import JobPool
+from sequence import Sequence
+from npc_registry import registry
+
+class Speaker:
+    """Just enough of an NPC for nodes to talk through"""
+    name = 'Chatty'
+    is_talking = False
+
+    def talk(self, message, output=None):
+        pass
+
+def chatty_at_choice():
+    """Chatty's dialogue with its topic choice on screen"""
+    sequence = Sequence.from_graph(registry.static_template('chatty.yaml').graph)
+    speaker = Speaker()
+    with mock.patch.object(speculation, 'speculate'):
+        sequence.interact(speaker, None)
+        sequence.interact(speaker, None)
+    assert sequence.waiting_for_response
+    return sequence, speaker
+
+def test_prompts_predicted_for_every_option():
+    """Test that each option of the shown choice gets the prompt it will generate with"""
+    sequence, _ = chatty_at_choice()
+    prompts = speculation.predict_generation_prompts(sequence)
+    assert len(prompts) == 2
+    assert 'User chose: Weather' in prompts[0]
+    assert 'User chose: Planets' in prompts[1]
+
+def test_predicted_prompt_matches_the_real_call():
+    """Test that the answered choice generates with exactly the speculated prompt"""
+    sequence, speaker = chatty_at_choice()
+    predicted = speculation.predict_generation_prompts(sequence)[1]
+    sequence.provide_response('Planets')
+    with mock.patch('character_generator.create_sequence', return_value=None) as create_sequence:
+        sequence.interact(speaker, None)
+    create_sequence.assert_called_once_with(predicted, on_text=None)
+
+def test_speculation_starts_when_choice_is_shown():
+    """Test that showing a choice queues generation in the background"""
+    sequence = Sequence.from_graph(registry.static_template('chatty.yaml').graph)
+    speaker = Speaker()
+    pool = JobPool(max_workers=1, max_finished=0)
+    with mock.patch('character_generator.create_sequence', return_value=None) as create_sequence, \
+            mock.patch.object(speculation, 'speculation_jobs', pool):
+        sequence.interact(speaker, None)
+        sequence.interact(speaker, None)
+        pool.shutdown()
+    assert create_sequence.call_count == 2
+
+def test_asks_are_not_predicted():
+    """Test that free text answers are not guessed"""
+    sequence = Sequence.from_graph(registry.static_template('botty.yaml').graph)
+    speaker = Speaker()
+    with mock.patch.object(speculation, 'speculate'):
+        sequence.interact(speaker, None)
+        sequence.interact(speaker, None)
+    assert sequence.waiting_for_response
+    assert speculation.predict_generation_prompts(sequence) == []
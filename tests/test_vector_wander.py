@@ -0,0 +1,52 @@
+import time
+import pytest
+from npc import NPCTemplate
+from walkability import WalkabilityGrid
+from world import World, VECTORIZED, WANDER_RETRY_DELAY
+
+np = pytest.importorskip('numpy')
+
+TEMPLATE_DATA = {
+    'npc': {'name': 'Walker', 'emoji': '🚶', 'wander': {'enabled': True, 'interval': 1}},
+    'sequence': [{'type': 'talk', 'text': 'Hello!'}],
+}
+
+def crowded_world(size=7):
+    """A vectorized world whose open map is filled with walkers except one cell"""
+    world = World(load_npcs=False, simulation=VECTORIZED)
+    cells = bytearray([1]) * (size * size)
+    world.grid = WalkabilityGrid(size, size, bytes(cells))
+    template = NPCTemplate('walker', TEMPLATE_DATA)
+    half = size // 2
+    for i in range(size * size - 1):
+        npc = template.instantiate()
+        npc.id = f'walker_{i}'
+        npc.x, npc.y = i % size - half, i // size - half
+        npc.last_wander_time = 0
+        world.add_location(npc)
+    return world
+
+def test_batch_moves_stay_walkable_and_never_collide():
+    """Test that a batch step keeps every NPC on its own walkable cell"""
+    world = crowded_world()
+    for _ in range(30):
+        for npc in world.locations:
+            world.wander_scheduler.schedule(npc, 0)
+        world.update_npcs()
+        cells = [(npc.x, npc.y) for npc in world.locations]
+        assert len(set(cells)) == len(cells)
+        assert all(world.can_move_to(x, y) for x, y in cells)
+        assert all(world.get_location_at(npc.x, npc.y) is npc for npc in world.locations)
+    assert any(change['type'] == 'npc_moved' for change in world.change_log)
+
+def test_blocked_and_talking_npcs_are_retried_later():
+    """Test that NPCs that could not move are due again after the retry delay"""
+    world = crowded_world(size=3)
+    for npc in world.locations:
+        npc.is_talking = True
+    world.reschedule_wandering()
+    before = [(npc.x, npc.y) for npc in world.locations]
+    world.update_npcs()
+    assert [(npc.x, npc.y) for npc in world.locations] == before
+    next_due = world.wander_scheduler.next_due_time()
+    assert time.time() < next_due <= time.time() + WANDER_RETRY_DELAY
@@ -0,0 +1,55 @@
+from PIL import Image
+from walkability import OBSTRUCTION_PATH, WalkabilityGrid, load_grid
+from npc import NPC
+from world import World
+
+def test_grid_matches_obstruction_image():
+    """Test that the grid agrees with the thresholded obstruction pixels"""
+    grid = load_grid()
+    image = Image.open(OBSTRUCTION_PATH).convert('L')
+    for img_y in range(image.height):
+        for img_x in range(image.width):
+            expected = image.getpixel((img_x, img_y)) > 127
+            assert grid.is_walkable(img_x - grid.center_x, img_y - grid.center_y) == expected
+
+def test_out_of_bounds_is_blocked():
+    """Test that positions outside the map are never walkable"""
+    grid = WalkabilityGrid(2, 2, bytes([1, 1, 1, 1]))
+    assert grid.is_walkable(0, 0)
+    assert not grid.is_walkable(-2, 0)
+    assert not grid.is_walkable(0, 1)
+
+def test_worlds_share_one_grid():
+    """Test that worlds reuse the grid instead of decoding images"""
+    assert World().grid is World().grid
+
+def test_regions_are_labeled_once_per_grid():
+    """Test that walkable cells are grouped into 4-connected regions"""
+    grid = WalkabilityGrid(4, 3, bytes([1, 1, 0, 1,
+                                        0, 1, 0, 1,
+                                        1, 0, 0, 0]))
+    assert grid.region_count == 3
+    first = grid.region_at(-2, -1)
+    assert grid.region_at(-1, 0) == first
+    assert grid.region_at(1, -1) not in (0, first)
+    assert grid.region_at(0, 0) == 0
+    assert grid.largest_region() == first
+    assert sorted(grid.region_positions(first)) == [(-2, -1), (-1, -1), (-1, 0)]
+
+def test_spawn_positions_are_free_and_reachable():
+    """Test that spawns only use free cells of the player's region until none are left"""
+    world = World(load_npcs=False)
+    world.grid = WalkabilityGrid(4, 3, bytes([1, 1, 0, 1,
+                                              0, 1, 0, 1,
+                                              1, 0, 0, 0]))
+    world.character.x, world.character.y = -1, 0
+    reachable = set(world.grid.region_positions(world.grid.region_at(-1, 0)))
+    spawned = set()
+    for i in range(len(reachable)):
+        x, y = world.find_random_position()
+        assert (x, y) in reachable and (x, y) not in spawned
+        spawned.add((x, y))
+        world.add_location(NPC(x, y, name=f'npc_{i}', should_wander=False))
+    assert world.find_random_position() is None
+    world.move_location(world.locations[0], 5, 5)
+    assert world.find_random_position() == list(next(iter(reachable - {(loc.x, loc.y) for loc in world.locations})))
@@ -0,0 +1,108 @@
+import time
+from unittest import mock
+import character_generator
+import speculation
+from llm import FakeBackend
+from llm_cache import LLMCache
+from npc import NPC
+from walkability import WalkabilityGrid
+from world import World, WANDER_RETRY_DELAY, CHANGE_LOG_SIZE
+
+def test_npcs_have_stable_ids():
+    """Test that static NPCs are identified by their YAML file name"""
+    world = World()
+    ids = {npc.id for npc in world.locations}
+    assert 'leo.yaml' in ids
+    assert len(ids) == len(world.locations)
+
+def test_update_npcs_records_positions_without_filesystem():
+    """Test that ticking updates NPC positions by id with no directory scans"""
+    world = World()
+    for npc in world.locations:
+        npc.last_wander_time = 0
+    world.reschedule_wandering()
+    with mock.patch('glob.glob') as glob_mock, mock.patch('os.listdir') as listdir_mock:
+        world.update_npcs()
+    glob_mock.assert_not_called()
+    listdir_mock.assert_not_called()
+    for npc in world.locations:
+        assert world.npc_positions[npc.id] == {'x': npc.x, 'y': npc.y}
+
+def test_update_npcs_only_visits_due_npcs():
+    """Test that NPCs that are not due to wander are not touched"""
+    world = World()
+    leo = next(npc for npc in world.locations if npc.id == 'leo.yaml')
+    for npc in world.locations:
+        npc.last_wander_time = time.time() + 1000
+    leo.last_wander_time = 0
+    world.reschedule_wandering()
+
+    with mock.patch('npc.NPC.try_wander', autospec=True, return_value=False) as try_wander:
+        world.update_npcs()
+    assert [call.args[0] for call in try_wander.call_args_list] == [leo]
+    # Leo could not move, so it is retried shortly instead of on every tick
+    next_due = world.wander_scheduler.next_due_time()
+    assert time.time() < next_due <= time.time() + WANDER_RETRY_DELAY
+
+def test_change_log_is_bounded():
+    """Test that deltas older than the change log need a full snapshot"""
+    world = World()
+    leo = next(npc for npc in world.locations if npc.id == 'leo.yaml')
+    start = world.version
+    for i in range(CHANGE_LOG_SIZE + 1):
+        world.move_location(leo, leo.x, leo.y)
+    assert world.changes_since(start) is None
+    assert len(world.changes_since(world.version - 3)) == 3
+    assert world.changes_since(world.version) == []
+
+def test_streamed_generation_publishes_and_speaks_the_first_line(tmp_path, capsys):
+    """Test that a generated talk line is published while streaming and spoken in the same interaction"""
+    world = World()
+    chatty = next(npc for npc in world.locations if npc.id == 'chatty.yaml')
+    world.character.x, world.character.y = chatty.x, chatty.y
+    subscription = world.events.subscribe()
+    with mock.patch.object(speculation, 'speculate'), \
+            mock.patch.object(character_generator, 'llm_cache', LLMCache(str(tmp_path))), \
+            mock.patch.object(character_generator.gateway, 'backend', FakeBackend()):
+        world.try_interact()
+        world.try_interact()
+        chatty.provide_response('Planets', world.character)
+        capsys.readouterr()
+        world.try_interact(stream=True)
+
+    streamed = [event['text'] for event in list(subscription.queue) if event['type'] == 'talk_stream']
+    first_line = chatty.sequence.generated[0]['text']
+    assert len(streamed) > 1 and streamed[-1] == first_line
+    assert first_line in capsys.readouterr().out
+    assert chatty.sequence.stream_text is None
+
+def test_state_only_holds_npcs_in_view():
+    """Test that payloads are culled to the view and crossings are sent as enter and leave"""
+    world = World(load_npcs=False)
+    world.grid = WalkabilityGrid(40, 40, bytes([1]) * 1600)
+    world.view_distance = 3
+    near = NPC(2, 0, name='near', should_wander=False)
+    far = NPC(10, 0, name='far', should_wander=False)
+    for npc in (near, far):
+        npc.id = npc.name
+        world.add_location(npc)
+    world.commit_player_state()
+    assert world.visible_locations() == [near]
+    assert set(world.npc_positions_payload()) == {'near'}
+
+    version = world.version
+    world.move_location(near, 4, 0)
+    world.move_location(far, 9, 0)
+    world.move_location(far, 3, 0)
+    assert [(c['type'], c['location']['name']) for c in world.changes_since(version)] == [
+        ('npc_left', 'near'), ('npc_entered', 'far')]
+
+    version = world.version
+    world.character.x = 6
+    world.commit_player_state()
+    assert [c['type'] for c in world.changes_since(version)] == ['player', 'npc_entered']
+    assert {npc.name for npc in world.visible_locations()} == {'near', 'far'}
+    world.character.x = 20
+    world.commit_player_state()
+    assert [c['type'] for c in world.changes_since(version)][2:] == ['player', 'npc_left', 'npc_left']
+    assert world.visible_locations() == []
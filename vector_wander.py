@@ -0,0 +1,207 @@
+"""
+Array-backed NPC wandering for worlds with large NPC populations
+
+NumPy is optional. Without it AVAILABLE is False and worlds keep using the
+per-object WanderScheduler.
+"""
+from typing import Dict, List, Optional
+import logging
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+AVAILABLE = np is not None
+
+logger = logging.getLogger(__name__)
+
+# Wander directions, picked uniformly like NPC.try_wander does
+_DX = (0, 0, 1, -1)
+_DY = (1, -1, 0, 0)
+
+class VectorWanderScheduler:
+    """Wander schedule and movement for every NPC of a world, kept in arrays.
+
+    Positions, wander times, intervals and due times live in NumPy arrays
+    indexed by row. ``step`` picks the due rows, draws a direction for all
+    of them at once, checks the targets against the walkability grid and
+    each other in bulk, and only touches the NPC objects of the ones that
+    can move. It keeps the WanderScheduler interface, so the world
+    registers and reschedules NPCs the same way in both modes.
+    """
+    def __init__(self, seed: Optional[int] = None, capacity: int = 64):
+        if np is None:
+            raise RuntimeError("NumPy is required for vectorized NPC wandering")
+        self._rng = np.random.default_rng(seed)
+        self._rows: Dict[int, int] = {}
+        self._npcs: List = []
+        self._free: List[int] = []
+        self._dx = np.array(_DX, dtype=np.int64)
+        self._dy = np.array(_DY, dtype=np.int64)
+        self._allocate(capacity)
+        self._walkable = None
+        self._walkable_grid = None
+
+    def _allocate(self, capacity: int) -> None:
+        self.x = np.zeros(capacity, dtype=np.int64)
+        self.y = np.zeros(capacity, dtype=np.int64)
+        self.last_wander_time = np.zeros(capacity, dtype=np.float64)
+        self.interval = np.zeros(capacity, dtype=np.float64)
+        self.offset = np.zeros(capacity, dtype=np.float64)
+        self.due = np.full(capacity, np.inf, dtype=np.float64)
+        self.has_goal = np.zeros(capacity, dtype=bool)
+
+    def _grow(self) -> None:
+        old = (self.x, self.y, self.last_wander_time, self.interval, self.offset, self.due, self.has_goal)
+        self._allocate(len(self.x) * 2)
+        for new, values in zip((self.x, self.y, self.last_wander_time, self.interval,
+                                self.offset, self.due, self.has_goal), old):
+            new[:len(values)] = values
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, npc) -> bool:
+        return id(npc) in self._rows
+
+    def schedule(self, npc, due_time: Optional[float] = None) -> None:
+        """Add or move an NPC, due at its next wander time unless given"""
+        row = self._rows.get(id(npc))
+        if row is None:
+            if self._free:
+                row = self._free.pop()
+                self._npcs[row] = npc
+            else:
+                row = len(self._npcs)
+                if row == len(self.x):
+                    self._grow()
+                self._npcs.append(npc)
+            self._rows[id(npc)] = row
+        self.x[row], self.y[row] = npc.x, npc.y
+        self.last_wander_time[row] = npc.last_wander_time
+        self.interval[row] = npc.wander_interval
+        self.offset[row] = npc.wander_interval_offset
+        self.due[row] = npc.next_wander_time if due_time is None else due_time
+        self.has_goal[row] = npc.goal is not None
+
+    def unschedule(self, npc) -> None:
+        """Remove an NPC from the schedule"""
+        row = self._rows.pop(id(npc), None)
+        if row is not None:
+            self._npcs[row] = None
+            self.due[row] = np.inf
+            self._free.append(row)
+
+    def pop_due(self, current_time: float) -> List:
+        """Remove and return every NPC due at or before current_time"""
+        rows = np.flatnonzero(self.due[:len(self._npcs)] <= current_time)
+        due = [self._npcs[row] for row in rows[np.argsort(self.due[rows], kind='stable')]]
+        for npc in due:
+            self.unschedule(npc)
+        return due
+
+    def next_due_time(self) -> Optional[float]:
+        """Time the earliest scheduled NPC becomes due"""
+        if not self._rows:
+            return None
+        return float(self.due[:len(self._npcs)].min())
+
+    def rebuild(self, npcs) -> None:
+        """Reschedule the given NPCs from their current wander times"""
+        self.clear()
+        for npc in npcs:
+            self.schedule(npc)
+
+    def clear(self) -> None:
+        self._rows.clear()
+        self._npcs.clear()
+        self._free.clear()
+        self.due[:] = np.inf
+
+    def step(self, world, current_time: float, retry_delay: float) -> int:
+        """Wander every due NPC one cell in a single batch, returning how many moved.
+
+        Targets off the grid, blocked, occupied or claimed by an earlier
+        NPC in the batch are not taken. NPCs that did not move, including
+        talking ones, are due again after retry_delay.
+        """
+        count = len(self._npcs)
+        rows = np.flatnonzero(self.due[:count] <= current_time)
+        if not len(rows):
+            return 0
+
+        # NPCs walking to a goal follow their path one object at a time. The
+        # batch rows are split off first, reaching a goal clears has_goal.
+        goal_mask = self.has_goal[rows]
+        goal_rows, rows = rows[goal_mask], rows[~goal_mask]
+        moved = 0
+        for row in goal_rows.tolist():
+            npc = self._npcs[row]
+            if npc.try_wander(world, current_time):
+                moved += 1
+                self.schedule(npc)
+            else:
+                self.schedule(npc, max(npc.next_wander_time, current_time + retry_delay))
+            if not npc.wants_to_move:
+                self.unschedule(npc)
+        if not len(rows):
+            return moved
+
+        directions = self._rng.integers(0, 4, size=len(rows))
+        target_x = self.x[rows] + self._dx[directions]
+        target_y = self.y[rows] + self._dy[directions]
+
+        grid = world.grid
+        walkable = self._walkable_cells(grid)
+        grid_x = target_x + grid.center_x
+        grid_y = target_y + grid.center_y
+        ok = (grid_x >= 0) & (grid_x < grid.width) & (grid_y >= 0) & (grid_y < grid.height)
+        ok[ok] = walkable[grid_y[ok], grid_x[ok]]
+
+        # Only the first NPC aiming at a cell may take it
+        keys = target_x * (1 << 32) + target_y
+        _, first = np.unique(keys, return_index=True)
+        unique_target = np.zeros(len(rows), dtype=bool)
+        unique_target[first] = True
+        ok &= unique_target
+
+        # Talking and occupancy live on the objects, looked at for candidates only
+        for i in np.flatnonzero(ok):
+            npc = self._npcs[rows[i]]
+            if npc.is_talking or world.get_location_at(int(target_x[i]), int(target_y[i])):
+                ok[i] = False
+
+        moved_rows = rows[ok]
+        offsets = self._rng.uniform(-1, 1, size=len(moved_rows))
+        self.x[moved_rows] = target_x[ok]
+        self.y[moved_rows] = target_y[ok]
+        self.last_wander_time[moved_rows] = current_time
+        self.offset[moved_rows] = offsets
+        self.due[moved_rows] = current_time + self.interval[moved_rows] + offsets
+
+        stuck_rows = rows[~ok]
+        next_wander = self.last_wander_time[stuck_rows] + self.interval[stuck_rows] + self.offset[stuck_rows]
+        self.due[stuck_rows] = np.maximum(next_wander, current_time + retry_delay)
+
+        # Moves are written back to the objects so clients and the cell index see them
+        for row, x, y, offset in zip(moved_rows.tolist(), self.x[moved_rows].tolist(),
+                                     self.y[moved_rows].tolist(), offsets.tolist()):
+            npc = self._npcs[row]
+            npc.last_wander_time = current_time
+            npc.wander_interval_offset = offset
+            world.move_location(npc, x, y)
+        return moved + len(moved_rows)
+
+    def moved(self, npc) -> None:
+        """Take the position of an NPC that was moved outside of step"""
+        row = self._rows.get(id(npc))
+        if row is not None:
+            self.x[row], self.y[row] = npc.x, npc.y
+
+    def _walkable_cells(self, grid):
+        if self._walkable_grid is not grid:
+            self._walkable = np.frombuffer(grid.cells, dtype=np.uint8).reshape(
+                grid.height, grid.width).astype(bool)
+            self._walkable_grid = grid
+        return self._walkable
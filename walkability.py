@@ -0,0 +1,102 @@
+"""
+Precomputed walkability grid decoded once from the obstruction map
+"""
+from array import array
+from collections import deque
+from functools import lru_cache
+from typing import List, Tuple
+from PIL import Image
+import os
+
+OBSTRUCTION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'graphics', 'obstructions.png')
+
+class WalkabilityGrid:
+    """Immutable grid of walkable cells shared by every world.
+
+    Cells are stored row-major, one byte each (1 walkable, 0 blocked), with
+    the world origin at the center of the map. Walkable cells are labeled
+    with the connected region they belong to, numbered from 1, while the
+    grid is built.
+    """
+    def __init__(self, width: int, height: int, cells: bytes):
+        if len(cells) != width * height:
+            raise ValueError(f"Expected {width * height} cells, got {len(cells)}")
+        self.width = width
+        self.height = height
+        self.cells = bytes(cells)
+        self.center_x = int(width // 2)
+        self.center_y = int(height // 2)
+        self.region_labels, self._region_cells = self._label_regions()
+
+    def _label_regions(self) -> Tuple[array, List[array]]:
+        """Label 4-connected walkable regions with a breadth first flood fill"""
+        width, height, cells = self.width, self.height, self.cells
+        labels = array('I', bytes(4 * width * height))
+        regions: List[array] = [array('I')]  # Region 0 is every blocked cell
+        for start in range(width * height):
+            if not cells[start] or labels[start]:
+                continue
+            label = len(regions)
+            members = array('I', [start])
+            labels[start] = label
+            pending = deque([start])
+            while pending:
+                index = pending.popleft()
+                x = index % width
+                for neighbor, inside in ((index - width, index >= width),
+                                         (index + width, index < width * (height - 1)),
+                                         (index - 1, x > 0),
+                                         (index + 1, x < width - 1)):
+                    if inside and cells[neighbor] and not labels[neighbor]:
+                        labels[neighbor] = label
+                        members.append(neighbor)
+                        pending.append(neighbor)
+            regions.append(members)
+        return labels, regions
+
+    @property
+    def region_count(self) -> int:
+        return len(self._region_cells) - 1
+
+    def region_at(self, x: int, y: int) -> int:
+        """Region of a position in world coordinates, 0 when it is not walkable"""
+        img_x = self.center_x + x
+        img_y = self.center_y + y
+        if 0 <= img_x < self.width and 0 <= img_y < self.height:
+            return self.region_labels[img_y * self.width + img_x]
+        return 0
+
+    def largest_region(self) -> int:
+        """The region with the most cells, 0 when nothing is walkable"""
+        if self.region_count == 0:
+            return 0
+        return max(range(1, len(self._region_cells)), key=lambda label: len(self._region_cells[label]))
+
+    def region_positions(self, region: int) -> List[Tuple[int, int]]:
+        """Every cell of a region in world coordinates"""
+        if region <= 0 or region >= len(self._region_cells):
+            return []
+        width = self.width
+        return [(index % width - self.center_x, index // width - self.center_y)
+                for index in self._region_cells[region]]
+
+    @classmethod
+    def from_image(cls, path: str, threshold: int = 127) -> 'WalkabilityGrid':
+        """Decode an obstruction image, pixels brighter than threshold are walkable"""
+        with Image.open(path) as image:
+            grayscale = image.convert('L')
+            mask = grayscale.point(lambda value: 1 if value > threshold else 0)
+            return cls(grayscale.width, grayscale.height, mask.tobytes())
+
+    def is_walkable(self, x: int, y: int) -> bool:
+        """Check a position in world coordinates"""
+        img_x = self.center_x + x
+        img_y = self.center_y + y
+        if 0 <= img_x < self.width and 0 <= img_y < self.height:
+            return self.cells[img_y * self.width + img_x] == 1
+        return False
+
+@lru_cache(maxsize=None)
+def load_grid(path: str = OBSTRUCTION_PATH) -> WalkabilityGrid:
+    """Load the walkability grid for a map, decoded once per process"""
+    return WalkabilityGrid.from_image(path)
@@ -1,54 +1,118 @@
 from character import Character
 from npc import NPC
-from typing import List, Dict
-from PIL import Image
+from npc_registry import registry
+from typing import Any, List, Dict, Optional, Tuple
+from collections import deque
+from itertools import islice
+from walkability import load_grid
+from spatial import FreeCellPool, SpatialIndex
+from pathfinding import Pathfinder, pathfinder_for
+from scheduler import WanderScheduler
+from events import EventBus
+import vector_wander
 import os
-import glob
-import random
+import threading
 import time
+import uuid
 import logging
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Global in-memory storage for all dynamic state
-DYNAMIC_NPCS = []
-NPC_POSITIONS = {}  # Store current positions of all NPCs
-PLAYER_STATE = {
-    'x': 0,
-    'y': 0,
-    'inventory': {}
-}
+# Seconds before retrying an NPC that was due but could not wander
+WANDER_RETRY_DELAY = 1.0
+
+# Number of recent changes kept for clients asking for deltas
+CHANGE_LOG_SIZE = 512
+
+# NPC simulation: 'objects' moves NPCs one by one, 'vectorized' moves them in NumPy batches
+OBJECTS = 'objects'
+VECTORIZED = 'vectorized'
+DEFAULT_SIMULATION = os.getenv('NPC_SIMULATION', OBJECTS)
+
+# Cells around the player whose entities are sent to the client, plus a margin
+# so they arrive just before they come into sight. The page shows the whole
+# 20 cell map, so by default nothing on it is left out.
+VIEW_RADIUS = int(os.getenv('VIEW_RADIUS', 20))
+VIEW_MARGIN = int(os.getenv('VIEW_MARGIN', 2))
+
+def create_wander_scheduler(simulation: str):
+    """Scheduler for a simulation mode, falling back to objects without NumPy"""
+    if simulation == VECTORIZED:
+        if vector_wander.AVAILABLE:
+            return vector_wander.VectorWanderScheduler()
+        logger.warning("NumPy is not installed, using the objects NPC simulation")
+    elif simulation != OBJECTS:
+        raise ValueError(f"Unknown NPC simulation: {simulation}")
+    return WanderScheduler()
 
 class World:
-    def __init__(self):
-        self.character = Character(PLAYER_STATE['x'], PLAYER_STATE['y'])
-        self.character.inventory = PLAYER_STATE['inventory'].copy()
+    def __init__(self, load_npcs: bool = True, simulation: Optional[str] = None):
+        self.character = Character(0, 0)
         self.current_interaction = None
         
-        # Load obstruction and map images first
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        obstruction_path = os.path.join(base_path, 'graphics', 'obstructions.png')
-        map_path = os.path.join(base_path, 'graphics', 'map.png')
+        # Dynamic state owned by this world so it can be stored per session
+        self.dynamic_npcs = []  # Generated NPC definitions with their creation position
+        self.npc_positions = {}  # Current positions of all NPCs by NPC id
         
-        self.obstruction_map = Image.open(obstruction_path).convert('L')
-        self.background_map = Image.open(map_path)
+        # Share the process-wide walkability grid
+        self.grid = load_grid()
         
-        # Set up image dimensions and center point
-        self.map_width, self.map_height = self.obstruction_map.size
-        self.center_x = int(self.map_width // 2)
-        self.center_y = int(self.map_height // 2)
+        # Set up map dimensions and center point
+        self.map_width, self.map_height = self.grid.width, self.grid.height
+        self.center_x = self.grid.center_x
+        self.center_y = self.grid.center_y
         
-        # Initialize locations list
+        # Initialize locations list and the cell index over it
         self.locations = []
+        self.occupancy = SpatialIndex()
+        self.view_distance = VIEW_RADIUS + VIEW_MARGIN
+        self._visible: Optional[Dict[int, Any]] = None  # Locations in view by id, built on first use
+        self._visible_center: Optional[Tuple[int, int]] = None  # Cell the view was built around
+        self.simulation = simulation or DEFAULT_SIMULATION
+        self.wander_scheduler = create_wander_scheduler(self.simulation)
         
-        # Load all NPCs
-        self.reload_npcs()
+        # Requests and push streams may touch the same world from several threads
+        self.lock = threading.RLock()
+        self.events = EventBus()
+        
+        # Versioned change log, clients older than the log get a full snapshot
+        self.epoch = uuid.uuid4().hex
+        self.version = 0
+        self.change_log = deque(maxlen=CHANGE_LOG_SIZE)
+        self.snapshot_version = 0
+        self.committed_player_state = None
+        
+        # Load all NPCs, unless the caller restores them itself
+        if load_npcs:
+            self.reload_npcs()
         
         # Initialize last update time
         self.last_update_time = time.time()
 
+    def __getstate__(self) -> Dict:
+        """Picklable state, leaving out locks, subscribers and derived indexes"""
+        state = self.__dict__.copy()
+        for name in ('grid', 'occupancy', '_visible', '_visible_center',
+                     'wander_scheduler', 'lock', 'events'):
+            state.pop(name, None)
+        return state
+
+    def __setstate__(self, state: Dict) -> None:
+        self.__dict__.update(state)
+        self.grid = load_grid()
+        self.lock = threading.RLock()
+        self.events = EventBus()
+        self.occupancy = SpatialIndex()
+        self.occupancy.rebuild(self.locations)
+        self.view_distance = state.get('view_distance', VIEW_RADIUS + VIEW_MARGIN)
+        self._visible = None
+        self._visible_center = None
+        self.simulation = state.get('simulation', DEFAULT_SIMULATION)
+        self.wander_scheduler = create_wander_scheduler(self.simulation)
+        self.reschedule_wandering()
+
     def reload_npcs(self):
         """Reload all NPCs, particularly after adding a new dynamic NPC"""
         # Keep track of non-NPC locations
@@ -56,32 +120,36 @@ class World:
         
         # Clear current NPCs
         self.locations = non_npc_locations
+        self.occupancy.rebuild(self.locations)
+        self._visible = None
+        self.wander_scheduler.clear()
         
-        # Load static NPCs from files
-        base_path = os.path.dirname(os.path.abspath(__file__))
-        npc_path = os.path.join(base_path, 'npcs', '*.yaml')
-        for npc_file in glob.glob(npc_path):
+        # Instantiate static NPCs from the shared templates
+        for template in registry.static_templates():
             try:
-                npc = NPC.from_yaml(npc_file)
-                npc_id = os.path.basename(npc_file)
+                npc = template.instantiate()
+                npc_id = template.id
                 
                 # Use stored position if available
-                if npc_id in NPC_POSITIONS:
-                    npc.x, npc.y = NPC_POSITIONS[npc_id]['x'], NPC_POSITIONS[npc_id]['y']
+                if npc_id in self.npc_positions:
+                    npc.x, npc.y = self.npc_positions[npc_id]['x'], self.npc_positions[npc_id]['y']
                 elif npc.needs_position:
-                    x, y = self.find_random_position()
-                    npc.x, npc.y = x, y
-                    NPC_POSITIONS[npc_id] = {'x': x, 'y': y}
+                    position = self.find_random_position()
+                    if position is None:
+                        logger.warning(f"No free cell left for {npc_id}, placing it at {npc.x}, {npc.y}")
+                    else:
+                        npc.x, npc.y = position
+                    self.npc_positions[npc_id] = {'x': npc.x, 'y': npc.y}
                 else:
-                    NPC_POSITIONS[npc_id] = {'x': npc.x, 'y': npc.y}
+                    self.npc_positions[npc_id] = {'x': npc.x, 'y': npc.y}
                     
-                self.locations.append(npc)
+                self.add_location(npc)
             except Exception as e:
-                logger.error(f"Error loading static NPC from {npc_file}: {str(e)}")
+                logger.error(f"Error loading static NPC {template.id}: {str(e)}")
                 continue
         
         # Load dynamic NPCs from memory
-        for dynamic_npc in DYNAMIC_NPCS:
+        for dynamic_npc in self.dynamic_npcs:
             try:
                 if not isinstance(dynamic_npc, dict):
                     logger.error(f"Invalid dynamic NPC format: {dynamic_npc}")
@@ -99,124 +167,291 @@ class World:
                     logger.error(f"Invalid NPC data format: {dynamic_npc}")
                     continue
                 
-                # Create NPC from stored data
-                npc = NPC.from_yaml_data(dynamic_npc['data'])
+                # Create NPC from the cached template for this data
+                npc = registry.dynamic_template(npc_id, dynamic_npc['data']).instantiate()
                 
-                # Set position from stored data
-                npc.x = dynamic_npc.get('x', 0)
-                npc.y = dynamic_npc.get('y', 0)
+                # Use stored position if available, else the creation position
+                if npc_id in self.npc_positions:
+                    npc.x, npc.y = self.npc_positions[npc_id]['x'], self.npc_positions[npc_id]['y']
+                else:
+                    npc.x = dynamic_npc.get('x', 0)
+                    npc.y = dynamic_npc.get('y', 0)
                 
-                # Update NPC_POSITIONS
-                NPC_POSITIONS[npc_id] = {'x': npc.x, 'y': npc.y}
+                # Update stored position
+                self.npc_positions[npc_id] = {'x': npc.x, 'y': npc.y}
                 
-                self.locations.append(npc)
+                self.add_location(npc)
                 logger.debug(f"Successfully loaded dynamic NPC: {npc_id}")
             except Exception as e:
                 logger.error(f"Error loading dynamic NPC: {str(e)}", exc_info=True)
                 continue
 
+        # Paths to the spawn, to NPCs that stay put such as shops and to NPC goals are asked for most
+        npcs = [loc for loc in self.locations if isinstance(loc, NPC)]
+        self.pathfinder.warm([(0, 0)] + [(npc.x, npc.y) for npc in npcs if not npc.should_wander] +
+                             [npc.goal for npc in npcs if npc.goal is not None])
+        
+        self.record_change({'type': 'locations', 'locations': self.visible_locations_payload()}, resets=True)
+
     def update_npcs(self):
         """Update only NPC states and positions, leaving player state unchanged."""
         current_time = time.time()
-        
-        # Update NPCs and their positions in memory
-        for i, location in enumerate(self.locations):
-            if isinstance(location, NPC):
-                # Try to make the NPC wander
-                if location.try_wander(self, current_time):
-                    # If NPC moved, update its position in memory
-                    npc_id = f"dynamic_{i}" if i >= len(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs', '*.yaml'))) else os.path.basename(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs', '*.yaml'))[i])
-                    NPC_POSITIONS[npc_id] = {'x': location.x, 'y': location.y}
-                    # Log debug info instead of printing
-                    logger.debug(f"NPC {location.name} moved to {location.x}, {location.y}")
-                # Always update position in memory even if NPC didn't move
-                else:
-                    npc_id = f"dynamic_{i}" if i >= len(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs', '*.yaml'))) else os.path.basename(glob.glob(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'npcs', '*.yaml'))[i])
-                    NPC_POSITIONS[npc_id] = {'x': location.x, 'y': location.y}
+
+        if isinstance(self.wander_scheduler, WanderScheduler):
+            self._wander_objects(current_time)
+        else:
+            self.wander_scheduler.step(self, current_time, WANDER_RETRY_DELAY)
         
         self.last_update_time = current_time
 
+    def _wander_objects(self, current_time: float) -> None:
+        # Only NPCs whose wander time has come are visited. NPCs that could not
+        # move (blocked or talking) are retried after a short delay.
+        for npc in self.wander_scheduler.pop_due(current_time):
+            if npc.try_wander(self, current_time):
+                logger.debug(f"NPC {npc.name} moved to {npc.x}, {npc.y}")
+                if npc.wants_to_move:
+                    self.wander_scheduler.schedule(npc)
+            elif npc.wants_to_move:
+                self.wander_scheduler.schedule(
+                    npc, max(npc.next_wander_time, current_time + WANDER_RETRY_DELAY))
+
     def update(self):
         """Update the world state, including NPC movements and player state."""
         self.update_npcs()
-        
-        # Update player state in memory
-        PLAYER_STATE['x'] = self.character.x
-        PLAYER_STATE['y'] = self.character.y
-        PLAYER_STATE['inventory'] = self.character.inventory.copy()
+        self.commit_player_state()
+
+    def add_location(self, location) -> None:
+        """Add a location to the world and index its position"""
+        self.locations.append(location)
+        self.occupancy.add(location)
+        if self._visible is not None and self.in_view(location.x, location.y):
+            self._visible[id(location)] = location
+        if isinstance(location, NPC) and location.wants_to_move:
+            self.wander_scheduler.schedule(location)
+
+    @property
+    def pathfinder(self) -> Pathfinder:
+        """Shortest paths on this world's map, shared with every world on it"""
+        return pathfinder_for(self.grid)
+
+    def send_npc_to(self, npc: NPC, x: int, y: int) -> bool:
+        """Make an NPC walk to a cell, returning False if it cannot get there"""
+        if self.pathfinder.distance((npc.x, npc.y), (x, y)) is None:
+            return False
+        npc.goal = (x, y)
+        self.wander_scheduler.schedule(npc)
+        return True
+
+    def add_dynamic_npc(self, npc_id: str, data: Dict, x: int = 0, y: int = 0) -> NPC:
+        """Add a generated NPC without disturbing the NPCs already in the world"""
+        dynamic_id = f"dynamic_{npc_id}"
+        npc = registry.dynamic_template(dynamic_id, data).instantiate()
+        npc.x, npc.y = x, y
+        self.dynamic_npcs.append({'id': npc_id, 'x': x, 'y': y, 'data': data})
+        self.npc_positions[dynamic_id] = {'x': x, 'y': y}
+        self.add_location(npc)
+        # Dynamic NPC definitions are not sent as deltas, clients need a full snapshot
+        self.record_change({'type': 'locations', 'locations': self.visible_locations_payload()}, resets=True)
+        return npc
+
+    def reschedule_wandering(self) -> None:
+        """Rebuild the wander schedule after NPC wander times were changed directly"""
+        self.wander_scheduler.rebuild(
+            loc for loc in self.locations if isinstance(loc, NPC) and loc.wants_to_move)
+
+    def move_location(self, location, x: int, y: int) -> None:
+        """Move a location, keeping the occupancy index and NPC positions up to date.
+
+        NPC moves are only sent to the client while the NPC is in view.
+        Crossing the edge of the view is sent as 'npc_entered' or 'npc_left'.
+        """
+        visible = self._visible_locations()
+        was_visible = id(location) in visible
+        self.occupancy.move(location, x, y)
+        self.wander_scheduler.moved(location)
+        is_visible = self.in_view(x, y)
+        if is_visible:
+            visible[id(location)] = location
+        else:
+            visible.pop(id(location), None)
+        if isinstance(location, NPC) and location.id:
+            self.npc_positions[location.id] = {'x': x, 'y': y}
+            if was_visible or is_visible:
+                change_type = 'npc_moved' if was_visible and is_visible else (
+                    'npc_entered' if is_visible else 'npc_left')
+                self.record_change({'type': change_type, 'location': self.location_payload(location)})
+
+    def record_change(self, change: Dict, resets: bool = False) -> None:
+        """Stamp a change with the next version, log it and push it to subscribers.
+
+        A resetting change cannot be expressed as a delta, so clients that
+        have not seen it need a full snapshot.
+        """
+        self.version += 1
+        change['version'] = self.version
+        self.change_log.append(change)
+        if resets:
+            self.snapshot_version = self.version
+        self.events.publish(change)
+
+    def changes_since(self, version: int) -> Optional[List[Dict]]:
+        """Changes after a version, or None when only a full snapshot will do"""
+        if version > self.version or version < self.snapshot_version:
+            return None
+        if version == self.version:
+            return []
+        first_logged = self.change_log[0]['version']
+        if version + 1 < first_logged:
+            return None
+        return list(islice(self.change_log, version + 1 - first_logged, None))
+
+    def commit_player_state(self) -> None:
+        """Record a player change if position or inventory differ from the last one"""
+        player = {
+            'x': self.character.x,
+            'y': self.character.y,
+            'inventory': dict(self.character.inventory)
+        }
+        if player != self.committed_player_state:
+            before = self._visible_locations()
+            self.committed_player_state = player
+            self.record_change({'type': 'player', 'player': dict(player)})
+            if self.view_center != self._visible_center:
+                self._update_view(before)
+
+    @property
+    def view_center(self) -> Tuple[int, int]:
+        """Cell the client's view is centered on, the last committed player position"""
+        player = self.committed_player_state
+        if player is None:
+            return self.character.x, self.character.y
+        return player['x'], player['y']
+
+    def in_view(self, x: int, y: int) -> bool:
+        """Whether a cell is in the view last sent to the client"""
+        self._visible_locations()
+        center_x, center_y = self._visible_center
+        return abs(x - center_x) <= self.view_distance and abs(y - center_y) <= self.view_distance
+
+    def _visible_locations(self) -> Dict[int, Any]:
+        """Locations in view keyed by id, looked up in the cell index when unknown"""
+        if self._visible is None:
+            self._visible_center = center_x, center_y = self.view_center
+            distance = self.view_distance
+            self._visible = {id(loc): loc for loc in self.occupancy.in_area(
+                center_x - distance, center_y - distance, center_x + distance, center_y + distance)}
+        return self._visible
+
+    def _update_view(self, before: Dict[int, Any]) -> None:
+        """Send the locations that came into or went out of view after the player moved"""
+        self._visible = None
+        after = self._visible_locations()
+        for key, location in after.items():
+            if key not in before:
+                self.record_change({'type': 'npc_entered', 'location': self.location_payload(location)})
+        for key, location in before.items():
+            if key not in after:
+                self.record_change({'type': 'npc_left', 'location': self.location_payload(location)})
+
+    def visible_locations(self) -> List:
+        """Locations within view distance of the player"""
+        return list(self._visible_locations().values())
+
+    def npc_positions_payload(self) -> Dict[str, Dict[str, int]]:
+        """Positions of the NPCs in view keyed by NPC id"""
+        return {loc.id: {'x': loc.x, 'y': loc.y}
+                for loc in self.visible_locations() if isinstance(loc, NPC) and loc.id}
+
+    def location_payload(self, location) -> Dict:
+        """Client representation of a single location"""
+        return {
+            'id': getattr(location, 'id', None),
+            'x': location.x,
+            'y': location.y,
+            'emoji': location.emoji,
+            'type': location.__class__.__name__,
+            'name': getattr(location, 'name', None)
+        }
+
+    def locations_payload(self) -> List[Dict]:
+        """Client representation of every location"""
+        return [self.location_payload(loc) for loc in self.locations]
+
+    def visible_locations_payload(self) -> List[Dict]:
+        """Client representation of the locations in view"""
+        return [self.location_payload(loc) for loc in self.visible_locations()]
 
     def get_location_at(self, x: int, y: int):
-        for location in self.locations:
-            if location.x == x and location.y == y:
-                return location
-        return None
+        return self.occupancy.at(x, y)
+
+    def try_interact(self, stream: bool = False, output: Optional[List[str]] = None):
+        """Interact with whatever stands on the player's cell.
 
-    def try_interact(self):
+        Lines said are appended to output. With stream, a generated talk
+        line is published as 'talk_stream' events while the model is still
+        writing it.
+        """
         location = self.get_location_at(self.character.x, self.character.y)
         if location:
             if isinstance(location, NPC):
                 if not location.is_talking:
                     self.current_interaction = location
-                location.interact(self.character)
+                location.sequence.stream_text = self._talk_streamer(location) if stream else None
+                try:
+                    location.interact(self.character, output)
+                finally:
+                    location.sequence.stream_text = None
                 if not location.is_talking:
                     self.current_interaction = None
+                self.events.publish({
+                    'type': 'interaction',
+                    'id': location.id,
+                    'name': location.name,
+                    'is_talking': location.is_talking
+                })
             return True
         return False
 
+    def _talk_streamer(self, npc: NPC):
+        def publish(text: str) -> None:
+            self.events.publish({
+                'type': 'talk_stream',
+                'id': npc.id,
+                'name': npc.name,
+                'text': text
+            })
+        return publish
+
     def is_interaction_active(self):
         return self.current_interaction is not None
     
     def can_move_to(self, x: int, y: int) -> bool:
-        # Convert world coordinates to image coordinates
-        img_x = self.center_x + x
-        img_y = self.center_y + y
-        
-        # Check if position is within map bounds
-        if (0 <= img_x < self.map_width and 
-            0 <= img_y < self.map_height):
-            # Get pixel value at position (0 is black, 255 is white)
-            pixel_value = self.obstruction_map.getpixel((img_x, img_y))
-            # Return True if pixel is closer to white (walkable)
-            return pixel_value > 127
-        return False
+        return self.grid.is_walkable(x, y)
 
-    def find_random_position(self) -> List[int]:
-        """Find a random walkable position that's not occupied by any character."""
-        # Define search bounds (adjust these based on your map size)
-        min_x, max_x = -10, 10
-        min_y, max_y = -10, 10
-        max_attempts = 100
-        
-        for _ in range(max_attempts):
-            x = random.randint(min_x, max_x)
-            y = random.randint(min_y, max_y)
-            
-            # Check if position is walkable and not occupied
-            if self.can_move_to(x, y) and not self.get_location_at(x, y):
-                return [x, y]
-        
-        # If no position found, return a default position
-        return [0, 0]
+    def find_random_position(self) -> Optional[List[int]]:
+        """Pick a random free walkable cell the player can reach, or None if there is none"""
+        region = self.grid.region_at(self.character.x, self.character.y) or self.grid.largest_region()
+        key = (self.grid, region)
+        pool = self.occupancy.free_cells
+        if pool is None or pool.key != key:
+            # Free cells of the player's region, kept up to date by the cell index from now on
+            self.occupancy.track_free_cells(FreeCellPool(self.grid.region_positions(region), key))
+        cell = self.occupancy.free_cells.sample()
+        return list(cell) if cell is not None else None
 
     def reset(self):
         """Reset the world state to initial values."""
-        # Reset player state
-        PLAYER_STATE.update({
-            'x': 0,
-            'y': 0,
-            'inventory': {}
-        })
-        
         # Reset character
         self.character.x = 0
         self.character.y = 0
         self.character.inventory = {}
         
         # Clear NPC positions
-        NPC_POSITIONS.clear()
+        self.npc_positions.clear()
         
         # Clear dynamic NPCs
-        DYNAMIC_NPCS.clear()
+        self.dynamic_npcs.clear()
         
         # Clear current interaction
         self.current_interaction = None